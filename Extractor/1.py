@@ -1,8 +1,13 @@
 import asyncio
 import base64
 import os
+import sys
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 
+# The crawl cache is shared with the RAG ingestion code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG_Agent"))
+from crawl_cache import CrawlCache, probe_unchanged
+
 FACULTY_URLS = [
     "https://dsu.edu.in/girisha-g-s",
     "https://dsu.edu.in/rajesh-t-m",
@@ -11,23 +16,52 @@ FACULTY_URLS = [
     "https://dsu.edu.in/dr-savitha"
 ]
 
+# Separate from the scraper's cache: this one tracks the pages behind the screenshots
+CACHE_FILE = "screenshot_cache.sqlite"
+
+def screenshot_path(url):
+    return f"screenshots/{url.split('/')[-1]}.png"
+
 async def main():
     browser_conf = BrowserConfig(headless=True)
+    cache = CrawlCache(CACHE_FILE)
+    # Pages the server reports unchanged, with a screenshot from an earlier run, are not rendered again
+    urls = [url for url in FACULTY_URLS
+            if not (os.path.exists(screenshot_path(url)) and probe_unchanged(cache, url))]
+    unchanged = len(FACULTY_URLS) - len(urls)
+    changed = 0
+    if not urls:
+        print(f"All {unchanged} pages unchanged")
+        return
 
     async with AsyncWebCrawler(config=browser_conf) as crawler:
         results = await crawler.arun_many(
-            urls=FACULTY_URLS,
+            urls=urls,
             config=CrawlerRunConfig(stream=False,pdf=True,screenshot=True)  # Default behavior
         )
         i=0
         for res in results:
             name = res.url.split("/")[-1]
             #print(f"Markdown for {name}:\n", result.markdown)
+            markdown = str(res.markdown)
+            headers = {key.lower(): value for key, value in (res.response_headers or {}).items()}
+            if os.path.exists(screenshot_path(res.url)) and cache.is_unchanged(res.url, markdown):
+                cache.touch(res.url, headers.get("etag"), headers.get("last-modified"))
+                unchanged += 1
+                continue
                     
             if res.screenshot:
                 os.makedirs("screenshots", exist_ok=True)
-                with open(f"screenshots/{name}.png", "wb") as f:
+                with open(screenshot_path(res.url), "wb") as f:
                     f.write(base64.b64decode(res.screenshot))
+                cache.store(res.url, markdown, headers.get("etag"), headers.get("last-modified"))
+                changed += 1
+            # Ingested directly by RAG_Agent/text_loader.py (load_pdfs)
+            if res.pdf:
+                os.makedirs("pdfs", exist_ok=True)
+                with open(f"pdfs/{name}.pdf", "wb") as f:
+                    f.write(res.pdf)
+    print(f"Fetched {len(urls)} of {len(FACULTY_URLS)} pages: {unchanged} unchanged, {changed} changed")
 
 if __name__ == "__main__":
     asyncio.run(main())
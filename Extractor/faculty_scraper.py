@@ -3,9 +3,15 @@ from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
 from crawl4ai.deep_crawling import BFSDeepCrawlStrategy
 from crawl4ai.content_scraping_strategy import LXMLWebScrapingStrategy
 from datetime import datetime
-import json
+import argparse
+import os
 import sys
 
+# The crawl cache is shared with the RAG ingestion code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG_Agent"))
+from crawl_cache import CrawlCache, probe_unchanged
+from page_records import PageRecordLog
+
 # List of faculty profile URLs to scrape
 FACULTY_URLS = [
     "https://dsu.edu.in/girisha-g-s",
@@ -15,8 +21,21 @@ FACULTY_URLS = [
     "https://dsu.edu.in/dr-savitha"
 ]
 
-async def scrape_faculty_profiles():
-    """Scrape faculty profile pages and store the markdown content."""
+OUTPUT_FILE = "faculty_data.jsonl"
+CACHE_FILE = "crawl_cache.sqlite"
+
+async def scrape_faculty_profiles(output_file=OUTPUT_FILE, resume=False):
+    """Scrape faculty profile pages and append each page's markdown to a JSONL file.
+
+    Each record is written as soon as its page is done. With resume, URLs
+    already in the output file (from an interrupted run) are skipped;
+    otherwise the last run's file is moved to <output_file>.prev and a new
+    one is started. Pages that are unchanged since the last run (by ETag /
+    Last-Modified, or by content hash once fetched) keep their previous
+    record with "changed": false. The flag is only informational: the
+    ingestion step tracks what it has loaded itself, so changes are not lost
+    if the scraper runs again before they are ingested.
+    """
     config = CrawlerRunConfig(
         deep_crawl_strategy=BFSDeepCrawlStrategy(
             max_depth=0,
@@ -26,33 +45,64 @@ async def scrape_faculty_profiles():
         verbose=True
     )
     
-    all_faculty_data = []
+    # The last complete run's records, kept until this run finishes
+    previous_file = output_file + ".prev"
+    if not resume and os.path.exists(output_file):
+        os.replace(output_file, previous_file)
+    output = PageRecordLog(output_file)
+    previous = PageRecordLog(previous_file)
+    done = output.urls() if resume else set()
+    cache = CrawlCache(CACHE_FILE)
+    fetched = unchanged = changed = 0
     
     async with AsyncWebCrawler() as crawler:
         for url in FACULTY_URLS:
+            if url in done:
+                print(f"\nAlready written, skipping {url}")
+                continue
+            # Only trust the cache if the last run's content is still on disk
+            previous_record = previous.lookup(url)
+            if previous_record is not None and probe_unchanged(cache, url):
+                output.append(dict(previous_record, changed=False))
+                unchanged += 1
+                print(f"\nUnchanged, skipping {url}")
+                continue
+            
             print(f"\nScraping {url}...")
             results = await crawler.arun(url, config=config)
             
             if results and len(results) > 0:
+                fetched += 1
+                markdown = str(results[0].markdown)
+                headers = {key.lower(): value for key, value in (results[0].response_headers or {}).items()}
+                if previous_record is not None and cache.is_unchanged(url, markdown):
+                    cache.touch(url, headers.get("etag"), headers.get("last-modified"))
+                    output.append(dict(previous_record, changed=False))
+                    unchanged += 1
+                    print(f"Content unchanged for {url}")
+                    continue
                 faculty_data = {
                     "url": url,
-                    "markdown_content": results[0].markdown,
-                    "timestamp": datetime.now().isoformat()
+                    "markdown_content": markdown,
+                    "timestamp": datetime.now().isoformat(),
+                    "changed": True
                 }
-                all_faculty_data.append(faculty_data)
+                output.append(faculty_data)
+                cache.store(url, markdown, headers.get("etag"), headers.get("last-modified"))
+                changed += 1
                 print(f"Successfully scraped {url}")
             else:
                 print(f"Failed to scrape {url}")
     
-    # Save the combined data to a JSON file
-    output_file = "faculty_data.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_faculty_data, f, indent=4, ensure_ascii=False)
+    output.close()
+    if os.path.exists(previous_file):
+        os.remove(previous_file)
     
     print(f"\nScraping completed. Data saved to {output_file}")
-    print(f"Total faculty profiles scraped: {len(all_faculty_data)}")
+    print(f"Total faculty profiles: {len(output.urls())} "
+          f"(resumed {len(done)}, fetched {fetched}, unchanged {unchanged}, changed {changed})")
 
-def run_scraper():
+def run_scraper(output_file=OUTPUT_FILE, resume=False):
     """Run the scraper, handling different environments."""
     try:
         loop = asyncio.get_event_loop()
@@ -61,9 +111,13 @@ def run_scraper():
         asyncio.set_event_loop(loop)
     
     if 'ipykernel' in sys.modules:
-        return loop.run_until_complete(scrape_faculty_profiles())
+        return loop.run_until_complete(scrape_faculty_profiles(output_file, resume))
     else:
-        return asyncio.run(scrape_faculty_profiles())
+        return asyncio.run(scrape_faculty_profiles(output_file, resume))
 
 if __name__ == "__main__":
-    run_scraper() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape faculty profile pages to a JSONL file")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run, skipping pages already written")
+    args = parser.parse_args()
+    run_scraper(args.output, args.resume)
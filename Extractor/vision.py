@@ -1,26 +1,259 @@
-from google.cloud import vision
-import io
+"""
+OCR stage: extracts text from screenshots with a pluggable backend.
 
-# Initialize client using the service account JSON key directly
-client = vision.ImageAnnotatorClient.from_service_account_file('firebaseSecretKey.json')
+Images come from a directory or any iterable of (name, bytes) pairs and are
+OCR'd in batches on a bounded thread pool. Results are cached on disk by the
+SHA-256 of the image bytes, so an unchanged screenshot is never sent to the
+OCR backend twice. Text is written to extracted_texts/<name>.txt and/or
+ingested straight into the RAG system.
 
-# Load image file
-with io.open("screenshots/dr-arunkumar.png", 'rb') as image_file:
-    content = image_file.read()
+Backends:
+  google     Google Cloud Vision text detection (batched, up to 16 images per call)
+  tesseract  Local Tesseract via pytesseract, an offline stand-in
 
-image = vision.Image(content=content)
+Run: python vision.py screenshots/ [--backend tesseract] [--output extracted_texts] [--ingest]
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-# Perform text detection
-response = client.text_detection(image=image)
-texts = response.text_annotations
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
 
-# Print extracted text
-if texts:
-    print("🔍 Extracted Text:\n")
-    print(texts[0].description)
-else:
-    print("No text found.")
+class GoogleVisionBackend:
+    """Google Cloud Vision text detection; the client is created on first use"""
+    name = "google-vision"
+    # Images per batch_annotate_images request (the API's limit)
+    max_batch_size = 16
 
-# Handle errors
-if response.error.message:
-    raise Exception(f'{response.error.message}')
+    def __init__(self, key_file: str = "firebaseSecretKey.json"):
+        self.key_file = key_file
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import vision
+                    self._client = vision.ImageAnnotatorClient.from_service_account_file(self.key_file)
+        return self._client
+
+    def ocr_batch(self, images: List[bytes]) -> List[Any]:
+        """Text of each image, or an Exception for images the API failed on"""
+        from google.cloud import vision
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        response = self._get_client().batch_annotate_images(requests=[
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+            for content in images
+        ])
+        texts = []
+        for result in response.responses:
+            if result.error.message:
+                texts.append(RuntimeError(result.error.message))
+            else:
+                texts.append(result.text_annotations[0].description if result.text_annotations else "")
+        return texts
+
+class TesseractBackend:
+    """Local OCR with Tesseract (needs pytesseract, Pillow and the tesseract binary)"""
+    name = "tesseract"
+    max_batch_size = 1
+
+    def __init__(self, lang: str = "eng"):
+        self.lang = lang
+
+    def ocr_batch(self, images: List[bytes]) -> List[Any]:
+        import io
+        import pytesseract
+        from PIL import Image
+        texts = []
+        for content in images:
+            try:
+                texts.append(pytesseract.image_to_string(Image.open(io.BytesIO(content)), lang=self.lang))
+            except Exception as e:
+                texts.append(e)
+        return texts
+
+def get_backend(name: str, **options):
+    """Build an OCR backend by name ("google" or "tesseract")"""
+    if name == "google":
+        return GoogleVisionBackend(**options)
+    if name == "tesseract":
+        return TesseractBackend(**options)
+    raise ValueError(f"Unknown OCR backend: {name}")
+
+class OcrCache:
+    """Disk-backed OCR text keyed by backend and the SHA-256 of the image bytes"""
+    def __init__(self, db_path: str = "./ocr_cache.sqlite"):
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr ("
+            "key TEXT PRIMARY KEY, backend TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(backend: str, content: bytes) -> str:
+        return f"{backend}:{hashlib.sha256(content).hexdigest()}"
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM ocr WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, key: str, backend: str, text: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr (key, backend, text, created) VALUES (?, ?, ?, ?)",
+                (key, backend, text, time.time())
+            )
+            self._conn.commit()
+
+def iter_image_files(directory: str) -> Iterator[Tuple[str, bytes]]:
+    """(name without extension, bytes) for every image in a directory, in name order"""
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, filename), 'rb') as f:
+                yield os.path.splitext(filename)[0], f.read()
+
+class OcrPipeline:
+    """OCRs a stream of images in batches with bounded concurrency.
+
+    Cached images are answered straight away; the rest are grouped into
+    batches of the backend's max_batch_size, and at most max_concurrency
+    batches are in flight. Each finished image is passed to the sinks as
+    (name, text, cached), always on the thread that called run(); an image
+    that the backend or a sink fails on is counted as failed and the run
+    goes on. Memory stays bounded by the batches in flight.
+    """
+    def __init__(self, backend, cache: Optional[OcrCache] = None, max_concurrency: int = 4,
+                 sinks: Optional[List[Callable[[str, str, bool], None]]] = None):
+        self.backend = backend
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.sinks = sinks or []
+
+    def run(self, images: Iterable[Tuple[str, bytes]]) -> Dict[str, Any]:
+        """OCR the images and return counts of OCR'd, cached and failed images"""
+        stats = {"images": 0, "ocr": 0, "cached": 0, "failed": 0, "failed_names": []}
+        start = time.perf_counter()
+        uncached = self._serve_cached(images, stats)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = set()
+            while True:
+                while len(pending) < self.max_concurrency:
+                    batch = list(islice(uncached, self.backend.max_batch_size))
+                    if not batch:
+                        break
+                    pending.add(executor.submit(self._ocr_batch, batch))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for name, text in future.result():
+                        if isinstance(text, Exception):
+                            print(f"Error OCRing {name}: {text}")
+                            stats["failed"] += 1
+                            stats["failed_names"].append(name)
+                        else:
+                            self._emit(name, text, False, stats)
+        stats["elapsed_seconds"] = time.perf_counter() - start
+        print(f"OCR: {stats['images']} images, {stats['ocr']} OCR'd, {stats['cached']} cached, "
+              f"{stats['failed']} failed in {stats['elapsed_seconds']:.1f}s")
+        return stats
+
+    def _serve_cached(self, images: Iterable[Tuple[str, bytes]], stats: Dict[str, Any]) -> Iterator[Tuple[str, bytes, str]]:
+        """Emit cached images and yield (name, bytes, cache key) for the rest"""
+        for name, content in images:
+            stats["images"] += 1
+            key = OcrCache.make_key(self.backend.name, content)
+            text = self.cache.get(key) if self.cache is not None else None
+            if text is not None:
+                self._emit(name, text, True, stats)
+            else:
+                yield name, content, key
+
+    def _ocr_batch(self, batch: List[Tuple[str, bytes, str]]) -> List[Tuple[str, Any]]:
+        try:
+            texts = self.backend.ocr_batch([content for _, content, _ in batch])
+        except Exception as e:
+            return [(name, e) for name, _, _ in batch]
+        for (_, _, key), text in zip(batch, texts):
+            if self.cache is not None and not isinstance(text, Exception):
+                self.cache.put(key, self.backend.name, text)
+        return [(name, text) for (name, _, _), text in zip(batch, texts)]
+
+    def _emit(self, name: str, text: str, cached: bool, stats: Dict[str, Any]):
+        """Pass an image's text to the sinks and count it as OCR'd, cached or failed"""
+        try:
+            for sink in self.sinks:
+                sink(name, text, cached)
+        except Exception as e:
+            # The text stays in the OCR cache, so a re-run retries only the sinks
+            print(f"Error handling text of {name}: {e}")
+            stats["failed"] += 1
+            stats["failed_names"].append(name)
+            return
+        stats["cached" if cached else "ocr"] += 1
+
+def text_file_sink(output_dir: str) -> Callable[[str, str, bool], None]:
+    """Sink writing <output_dir>/<name>.txt, skipping files that already hold the same text"""
+    os.makedirs(output_dir, exist_ok=True)
+
+    def write(name: str, text: str, cached: bool):
+        path = os.path.join(output_dir, f"{name}.txt")
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                if f.read() == text:
+                    return
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return write
+
+def ingestion_sink(rag_system) -> Callable[[str, str, bool], None]:
+    """Sink adding each text to a RAGSystem under the same source name as its text file.
+
+    Re-adding unchanged text only re-chunks it: stored chunks with the same
+    content hash are not embedded again.
+    """
+    def ingest(name: str, text: str, cached: bool):
+        rag_system.add_text(text, f"{name}.txt")
+    return ingest
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR screenshots into text files or the RAG index")
+    parser.add_argument("directory", nargs="?", default="screenshots", help="Directory of images")
+    parser.add_argument("--backend", default="google", choices=["google", "tesseract"])
+    parser.add_argument("--key-file", default="firebaseSecretKey.json", help="Google service account key")
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches OCR'd at once")
+    parser.add_argument("--cache", default="ocr_cache.sqlite")
+    parser.add_argument("--output", default="extracted_texts", help="Directory for text files ('' to skip)")
+    parser.add_argument("--ingest", action="store_true", help="Also add the text to the RAG system")
+    args = parser.parse_args()
+
+    options = {"key_file": args.key_file} if args.backend == "google" else {}
+    sinks = []
+    if args.output:
+        sinks.append(text_file_sink(args.output))
+    if args.ingest:
+        # The RAG system lives next to this directory
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG_Agent"))
+        from rag_system import RAGSystem
+        sinks.append(ingestion_sink(RAGSystem()))
+    pipeline = OcrPipeline(get_backend(args.backend, **options), OcrCache(args.cache), args.concurrency, sinks)
+    pipeline.run(iter_image_files(args.directory))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+# Tokens that pin a question to one entity: emails, anything with a digit (CS101,
+# room 204) and all-caps codes (CSE). Near-identical questions that differ in
+# one of these ask about different things.
+_KEY_TERM_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+|\b\w*\d\w*\b|\b[A-Z]{2,}\b")
+
+def key_terms(question: str) -> frozenset:
+    """Email, number and code tokens of a question, lowercased"""
+    return frozenset(term.lower() for term in _KEY_TERM_PATTERN.findall(question))
+
+class AnswerCache:
+    """Two-layer cache of query results placed in front of the LLM.
+
+    The exact layer matches normalized question text; the similarity layer
+    matches questions whose embedding has cosine similarity of at least
+    similarity_threshold with a cached one and the same key_terms (so "Who
+    teaches CS101?" never gets the answer for CS102). Entries expire after
+    ttl_seconds, the least recently used are evicted beyond max_entries, and
+    everything is dropped by invalidate() when the underlying collection
+    changes; a result computed from the collection before the change
+    (generation taken before retrieval) is then not stored either.
+
+    Entries are scoped (e.g. by the metadata filter the answer was retrieved
+    with), and a lookup only matches entries of the same scope. Normalized
+    embeddings live in one preallocated float32 matrix, a row per entry, so a
+    similarity lookup is a single matrix-vector product.
+    """
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Row i of _vectors holds the embedding of _row_keys[i]; allocated on the first put
+        self._vectors = None
+        self._row_keys: List[Optional[tuple]] = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        # Bumped by every invalidate()
+        self.generation = 0
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+        self.latency_saved = 0.0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Normalize a question for exact matching"""
+        question = re.sub(r"\s+", " ", question.strip().lower())
+        return question.rstrip("?!. ")
+
+    def get_exact(self, question: str, scope: str = "") -> Optional[Dict[str, Any]]:
+        """Look up a question by its normalized text"""
+        key = (scope, self.normalize(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return self._hit(entry, question, "exact")
+
+    def get_similar(self, question: str, embedding: List[float], scope: str = "") -> Optional[Dict[str, Any]]:
+        """Look up the most similar cached question above the threshold"""
+        query = self._unit(embedding)
+        terms = key_terms(question)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(query):
+                self.misses += 1
+                return None
+            # Free rows are all zeros, so they never clear a positive threshold
+            similarities = self._vectors @ query
+            candidates = np.flatnonzero(similarities >= self.similarity_threshold)
+            for row in candidates[np.argsort(-similarities[candidates])]:
+                key = self._row_keys[row]
+                if key is None or key[0] != scope:
+                    continue
+                entry = self._entries[key]
+                if self._expired(entry):
+                    self._remove(key)
+                    continue
+                if entry["terms"] != terms:
+                    continue
+                self._entries.move_to_end(key)
+                self.similar_hits += 1
+                return self._hit(entry, question, "similar")
+            self.misses += 1
+            return None
+
+    def put(self, question: str, embedding: List[float], result: Dict[str, Any], latency: float, scope: str = "",
+            generation: Optional[int] = None):
+        """Cache a query result along with how long it took to produce.
+
+        generation is the cache's generation read before retrieval; if the
+        collection changed since, the result may be stale and is dropped.
+        """
+        key = (scope, self.normalize(question))
+        vector = self._unit(embedding)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_puts += 1
+                return
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                # First entry, or a new embedder: older rows can't be compared with this one
+                self._clear()
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            row = self._free_rows.pop()
+            self._vectors[row] = vector
+            self._row_keys[row] = key
+            self._entries[key] = {
+                "row": row,
+                "terms": key_terms(question),
+                "result": copy.deepcopy(result),
+                "latency": latency,
+                "created": time.monotonic()
+            }
+
+    def invalidate(self):
+        """Drop every entry (the collection behind them has changed)"""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._clear()
+            self.generation += 1
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _remove(self, key: tuple):
+        """Drop one entry and free its row (lock held)"""
+        row = self._entries.pop(key)["row"]
+        self._vectors[row] = 0.0
+        self._row_keys[row] = None
+        self._free_rows.append(row)
+
+    def _clear(self):
+        """Drop every entry and free all rows (lock held)"""
+        self._entries.clear()
+        if self._vectors is not None:
+            self._vectors.fill(0.0)
+        self._row_keys = [None] * self.max_entries
+        self._free_rows = list(range(self.max_entries - 1, -1, -1))
+
+    def _hit(self, entry: Dict[str, Any], question: str, layer: str) -> Dict[str, Any]:
+        self.latency_saved += entry["latency"]
+        result = copy.deepcopy(entry["result"])
+        result["question"] = question
+        result["cached"] = layer
+        return result
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["created"] > self.ttl_seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit rate and latency saved"""
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": self.latency_saved,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts
+            }
@@ -0,0 +1,318 @@
+"""
+Offline benchmark suite: startup time, chunking, ingestion, search and query latency.
+
+Uses the deterministic stand-ins from offline_fakes (hash embedder, fake LLM,
+synthetic corpus), so no Ollama or model download is needed. Each stage runs
+in its own process so its peak memory is measured in isolation. Results are
+written as JSON; pass a previous results file as --baseline to flag
+regressions (exit status 1).
+
+Run: python benchmark.py [--sizes 10000,100000,1000000] [--backend chroma]
+                         [--output benchmark_results.json] [--baseline old.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+import numpy as np
+from langchain_core.documents import Document
+from config import Config
+from document_processor import DocumentProcessor
+from instrumentation import latency_summary
+from offline_fakes import HashEmbeddings, FakeLLMClient, generate_corpus, random_unit_vectors
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Chroma rejects larger batches in a single add call
+_BUILD_BATCH_SIZE = 5000
+
+# Libraries that should only be imported once they are needed
+_HEAVY_MODULES = ["torch", "sentence_transformers", "spacy", "langchain_ollama", "langchain_text_splitters", "chromadb"]
+
+# Run in a fresh interpreter: times importing rag_system and building a RAGSystem
+_STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from rag_system import RAGSystem
+imported = time.perf_counter()
+from benchmark import make_config, _HEAVY_MODULES
+config = make_config(sys.argv[1], sys.argv[2])
+config.QUERY_ONLY = sys.argv[3] == "1"
+init_start = time.perf_counter()
+RAGSystem(config)
+print(json.dumps({
+    "import_seconds": imported - start,
+    "init_seconds": time.perf_counter() - init_start,
+    "heavy_modules": [name for name in _HEAVY_MODULES if name in sys.modules]
+}))
+"""
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def make_config(workdir: str, backend: str) -> Config:
+    """Config with every store under workdir and only offline components"""
+    config = Config()
+    config.VECTOR_BACKEND = backend
+    config.CHROMA_DB_PATH = os.path.join(workdir, "chroma_db")
+    config.NUMPY_DB_PATH = os.path.join(workdir, "numpy_db")
+    config.EMBEDDING_CACHE_PATH = os.path.join(workdir, "embedding_cache.sqlite")
+    config.CRAWL_CACHE_PATH = os.path.join(workdir, "crawl_cache.sqlite")
+    config.SCRAPED_PAGES_CACHE_PATH = os.path.join(workdir, "scraped_pages_cache.sqlite")
+    config.SPACY_PIPELINE = "sentencizer"  # Rule-based, needs no model download
+    config.ANSWER_CACHE_ENABLED = False  # Every benchmark query does the full work
+    return config
+
+def bench_startup(backend: str, runs: int) -> Dict[str, Any]:
+    """Cold-start time: importing rag_system and constructing RAGSystem, full and query-only.
+
+    Each run is a new interpreter, so nothing is already imported. The default
+    embedder and LLM client are built, but constructing them contacts no server.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = {"backend": backend, "runs": runs}
+    for label, query_only in (("", "0"), ("query_only_", "1")):
+        samples = []
+        for _ in range(runs):
+            workdir = tempfile.mkdtemp(prefix="rag-bench-")
+            try:
+                output = subprocess.run(
+                    [sys.executable, "-c", _STARTUP_SCRIPT, workdir, backend, query_only],
+                    cwd=here, capture_output=True, text=True, check=True
+                ).stdout
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        result[f"{label}import_seconds"] = float(np.median([sample["import_seconds"] for sample in samples]))
+        result[f"{label}init_seconds"] = float(np.median([sample["init_seconds"] for sample in samples]))
+        result[f"{label}heavy_modules"] = samples[-1]["heavy_modules"]
+    return result
+
+def bench_chunking(num_documents: int, words_per_document: int, mode: str) -> Dict[str, Any]:
+    """DocumentProcessor.create_chunks throughput"""
+    corpus = generate_corpus(num_documents, words_per_document)
+    processor = DocumentProcessor(mode=mode, spacy_pipeline="sentencizer")
+    # Import spaCy and the splitter and build the pipeline outside the timed loop
+    processor.load()
+    start = time.perf_counter()
+    chunks = sum(len(processor.create_chunks(text, source)) for text, source in corpus)
+    elapsed = time.perf_counter() - start
+    characters = sum(len(text) for text, _ in corpus)
+    return {
+        "mode": mode,
+        "documents": num_documents,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "chunks_per_second": chunks / elapsed,
+        "mb_per_second": characters / elapsed / 1e6,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def bench_ingestion(num_documents: int, words_per_document: int, backend: str, dimension: int,
+                    embed_delay: float) -> Dict[str, Any]:
+    """RAGSystem.add_text end to end: chunking, embedding, storage and indexing"""
+    from rag_system import RAGSystem
+    corpus = generate_corpus(num_documents, words_per_document)
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        rag = RAGSystem(make_config(workdir, backend), embeddings=HashEmbeddings(dimension, per_text_delay=embed_delay),
+                        llm_client=FakeLLMClient())
+        rag.document_processor.load()
+        start = time.perf_counter()
+        for text, source in corpus:
+            rag.add_text(text, source)
+        elapsed = time.perf_counter() - start
+        chunks = rag.ingest_stats["chunks_embedded"]
+        return {
+            "backend": backend,
+            "documents": num_documents,
+            "chunks": chunks,
+            "seconds": elapsed,
+            "chunks_per_second": chunks / elapsed,
+            "documents_per_second": num_documents / elapsed,
+            "peak_rss_mb": peak_rss_mb()
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_query(num_documents: int, words_per_document: int, backend: str, dimension: int,
+                num_queries: int, llm_delay: float) -> Dict[str, Any]:
+    """RAGSystem.query latency with a fixed-delay stand-in LLM"""
+    from rag_system import RAGSystem
+    corpus = generate_corpus(num_documents, words_per_document)
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        rag = RAGSystem(make_config(workdir, backend), embeddings=HashEmbeddings(dimension),
+                        llm_client=FakeLLMClient(delay=llm_delay))
+        for text, source in corpus:
+            rag.add_text(text, source)
+        questions = [f"Who teaches CS{100 + i} and what research does the department do?" for i in range(num_queries)]
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            rag.query(question)
+            latencies.append(time.perf_counter() - start)
+        result = {"backend": backend, "queries": num_queries, "llm_delay_seconds": llm_delay}
+        result.update(latency_summary(latencies))
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_search(num_chunks: int, backend: str, dimension: int, num_queries: int) -> Dict[str, Any]:
+    """similarity_search latency on a store of num_chunks random vectors"""
+    from vector_backends import create_vector_store
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        store = create_vector_store(make_config(workdir, backend))
+        start = time.perf_counter()
+        for batch_start in range(0, num_chunks, _BUILD_BATCH_SIZE):
+            count = min(_BUILD_BATCH_SIZE, num_chunks - batch_start)
+            vectors = random_unit_vectors(count, dimension, seed=batch_start)
+            documents = [
+                Document(page_content=f"synthetic chunk {i}", metadata={
+                    "source": f"doc-{i // 100}", "page": 0, "chunk_index": i % 100,
+                    "chunk_id": f"chunk-{i}", "content_hash": str(i)
+                })
+                for i in range(batch_start, batch_start + count)
+            ]
+            store.add_documents(documents, vectors.tolist(), check_existing=False)
+        build_seconds = time.perf_counter() - start
+
+        queries = random_unit_vectors(num_queries, dimension, seed=num_chunks + 1).tolist()
+        store.similarity_search(queries[0], k=5)  # Warm up (page in, build caches)
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.similarity_search(query, k=5)
+            latencies.append(time.perf_counter() - start)
+        result = {
+            "backend": backend,
+            "chunks": num_chunks,
+            "dimension": dimension,
+            "queries": num_queries,
+            "build_seconds": build_seconds,
+            "build_chunks_per_second": num_chunks / build_seconds
+        }
+        result.update(latency_summary(latencies))
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_isolated(function, *args) -> Dict[str, Any]:
+    """Run a benchmark in a fresh process so its memory peak is its own"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric metrics keyed by "stage.metric" """
+    flat = {}
+    for stage, metrics in results.items():
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                flat[f"{stage}.{name}"] = value
+    return flat
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than tolerance (a fraction)"""
+    current = flatten(results)
+    previous = flatten(baseline)
+    regressions = []
+    for key, value in current.items():
+        old = previous.get(key)
+        if not old:
+            continue
+        if key.endswith("_per_second"):
+            worse = value < old * (1 - tolerance)
+        elif key.endswith(("_ms", "_mb", "seconds")):
+            worse = value > old * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{key}: {old:.3f} -> {value:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAG benchmarks")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Chunk counts for the search benchmark")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy"])
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--documents", type=int, default=200, help="Synthetic documents for chunking/ingestion")
+    parser.add_argument("--words", type=int, default=2000, help="Words per synthetic document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--embed-delay", type=float, default=0.0, help="Seconds per text spent by the fake embedder")
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="Seconds per answer spent by the fake LLM")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters per startup measurement")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = {}
+    print("Startup...")
+    results["startup"] = bench_startup(args.backend, args.startup_runs)
+    for mode in ("default", "spacy"):
+        print(f"Chunking ({mode})...")
+        results[f"chunking_{mode}"] = run_isolated(bench_chunking, args.documents, args.words, mode)
+    print("Ingestion...")
+    results["ingestion"] = run_isolated(
+        bench_ingestion, args.documents, args.words, args.backend, args.dimension, args.embed_delay
+    )
+    print("Query...")
+    results["query"] = run_isolated(
+        bench_query, min(args.documents, 50), args.words, args.backend, args.dimension,
+        min(args.queries, 50), args.llm_delay
+    )
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        print(f"Search at {size} chunks...")
+        results[f"search_{size}"] = run_isolated(bench_search, size, args.backend, args.dimension, args.queries)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "arguments": vars(args),
+        "results": results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+    for stage, metrics in results.items():
+        summary = ", ".join(
+            f"{name}={value:.2f}" for name, value in metrics.items()
+            if isinstance(value, float) and (name.endswith(("_per_second", "_ms", "_seconds")) or name == "peak_rss_mb")
+        )
+        print(f"{stage}: {summary}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
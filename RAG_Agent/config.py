@@ -5,7 +5,14 @@ load_dotenv()
 
 class Config:
     # Database settings
+    VECTOR_BACKEND = "chroma"  # "chroma" or "numpy" (in-process, memory-mapped; for < ~1M chunks)
     CHROMA_DB_PATH = "./chroma_db"
+    NUMPY_DB_PATH = "./numpy_db"
+    NUMPY_COMPACT_THRESHOLD = 0.5  # NumPy backend: compact the vector files once this fraction of rows is deleted (None = never)
+    VECTOR_QUANTIZATION = "none"  # NumPy backend only: "none", "float16", "int8" or "binary"
+    QUANTIZATION_RERANK_FACTOR = None  # Shortlist of k * factor re-ranked exactly; None uses the mode's default
+    KEEP_FULL_PRECISION = True  # Keep float32 vectors on disk for re-ranking (codes are stored in addition; False cuts disk use)
+    METADATA_INDEX_FIELDS = []  # NumPy backend: custom metadata fields to index for filtered search, e.g. ["crawl_date"]
     COLLECTION_NAME = "document_chunks"
     
     # Embedding settings - Using Ollama embeddings
@@ -17,6 +24,20 @@ class Config:
     # Ollama embeddings (primary choice)
     OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
     OLLAMA_BASE_URL = "http://localhost:11434"
+    # Several Ollama instances can share the load (comma-separated in the environment)
+    OLLAMA_BASE_URLS = os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",")
+    OLLAMA_KEEP_ALIVE = 1800  # Seconds each server keeps a model loaded after a request
+    
+    # Ollama embedding circuit breaker: after this many consecutive failures use the
+    # local model directly and probe Ollama in the background every RECOVERY seconds
+    EMBEDDING_BREAKER_FAILURE_THRESHOLD = 3
+    EMBEDDING_BREAKER_RECOVERY_SECONDS = 30
+    WARM_UP_EMBEDDERS = False  # Load the local fallback embedding model in the background at startup
+    
+    # Persistent embedding cache (shared by all embedding backends)
+    EMBEDDING_CACHE_ENABLED = True
+    EMBEDDING_CACHE_PATH = "./embedding_cache.sqlite"
+    EMBEDDING_CACHE_MEMORY_SIZE = 10000  # Entries kept in the in-memory LRU
     
     # OpenAI embeddings (requires API key)
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -28,6 +49,62 @@ class Config:
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
     CHUNKING_MODE = "spacy"
+    SPACY_PIPELINE = "trimmed"  # "full", "trimmed" (parser only) or "sentencizer" (rule-based)
+    SPACY_BATCH_SIZE = 64  # Texts per nlp.pipe batch
+    
+    # Parallel ingestion pipeline settings
+    INGEST_WORKERS = os.cpu_count() or 1  # Chunking processes
+    INGEST_EMBED_BATCH_SIZE = 256  # Chunks per embedding call, across files
+    INGEST_WRITE_BATCH_SIZE = 1000  # Chunks per collection.add call
+    INGEST_QUEUE_SIZE = 8  # Max batches buffered between stages
+    INGEST_PDF_PAGES_PER_TASK = 4  # PDF pages extracted and chunked per worker task
+    
+    # Crawl-to-index pipeline (crawl_ingestion.py)
+    CRAWL_CONCURRENCY = 8  # Pages fetched at once, across all hosts
+    CRAWL_MAX_PER_HOST = 2  # Requests in flight per host
+    CRAWL_HOST_DELAY_SECONDS = 0.5  # Minimum gap between request starts to the same host
+    CRAWL_TIMEOUT_SECONDS = 30
+    CRAWL_CACHE_PATH = "./crawl_cache.sqlite"  # ETag / Last-Modified / content hash per URL
+    SCRAPED_PAGES_CACHE_PATH = "./scraped_pages_cache.sqlite"  # Content hash per URL as last loaded by text_loader
     
     # Retrieval settings
-    TOP_K_CHUNKS = 5
\ No newline at end of file
+    TOP_K_CHUNKS = 5
+    
+    # Hybrid retrieval: BM25 over chunk text fused with vector hits by reciprocal rank fusion
+    HYBRID_SEARCH_ENABLED = True
+    LEXICAL_INDEX_PATH = None  # None: <vector DB path>/<collection>.lexical.sqlite
+    HYBRID_CANDIDATES = 20  # Hits taken from each retriever before fusion
+    RRF_K = 60  # Rank offset in 1 / (RRF_K + rank)
+    
+    # Context packing between retrieval and generation: drop repeated sentences,
+    # order chunks by MMR and trim to an estimated prompt token budget
+    CONTEXT_PACKING_ENABLED = True
+    CONTEXT_TOKEN_BUDGET = 1024
+    CONTEXT_MMR_LAMBDA = 0.7  # 1.0 = retrieval order only, lower = more diversity
+    
+    # Async query concurrency limits (per backend, per process)
+    ASYNC_EMBED_CONCURRENCY = 8
+    ASYNC_RETRIEVAL_CONCURRENCY = 4
+    ASYNC_LLM_CONCURRENCY = 2
+    
+    # Answer cache in front of the LLM (cleared whenever the collection changes)
+    ANSWER_CACHE_ENABLED = True
+    ANSWER_CACHE_MAX_ENTRIES = 1000
+    ANSWER_CACHE_TTL_SECONDS = 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95  # Cosine similarity for near-duplicate questions with the same codes/numbers/emails
+    
+    # Max concurrent LLM generations in RAGSystem.query_many
+    QUERY_MANY_CONCURRENCY = 4
+    
+    # Evaluation runner (evaluation.py): parallel questions and on-disk judgment cache
+    EVAL_CONCURRENCY = 4
+    EVAL_JUDGMENT_CACHE_PATH = "./judgment_cache.sqlite"
+    
+    # Instrumentation: per-stage spans are exported via RAGSystem.export_metrics (Prometheus)
+    # and, when logging is configured, as JSON lines on the "rag.metrics" logger
+    PRINT_PROGRESS = True  # Progress messages on stdout
+    METRICS_LOG_SPANS = True
+    
+    # Startup: heavy libraries (spaCy, torch, langchain_ollama) are imported on first use
+    QUERY_ONLY = False  # Never build the chunker; add_text/add_file raise
+    WARM_UP_ON_START = False  # Load the embedder, LLM client and chunker on a background thread
\ No newline at end of file
@@ -0,0 +1,125 @@
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Any, Tuple
+from lexical_index import tokenize
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Rough LLM token count (about four characters per token for English)"""
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[term] for term, count in a.items() if term in b)
+    return dot / math.sqrt(sum(v * v for v in a.values()) * sum(v * v for v in b.values()))
+
+class ContextPacker:
+    """Assembles retrieved chunks into a prompt context under a token budget.
+
+    Three steps, applied to results in retrieval order:
+    1. Sentences already present in a higher-ranked chunk are dropped, which
+       removes chunk overlap and near-duplicate chunks.
+    2. Chunks are reordered by maximal marginal relevance: relevance (from
+       rank) traded against term overlap with chunks already selected,
+       weighted by mmr_lambda (1.0 keeps retrieval order).
+    3. Chunks are added until token_budget is reached; a chunk that does not
+       fit contributes its leading sentences that do, or, if not even its
+       first sentence fits (e.g. unpunctuated OCR text), that sentence cut
+       to the remaining budget. The top chunk is always kept.
+    """
+    # Sentence fragments shorter than this are only dropped as exact repeats
+    _MIN_FRAGMENT_CHARS = 20
+
+    def __init__(self, token_budget: int = 1024, mmr_lambda: float = 0.7, chars_per_token: float = 4.0):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.chars_per_token = chars_per_token
+
+    def pack(self, results: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Return the results to send (content trimmed) and token accounting"""
+        tokens_before = sum(estimate_tokens(result["content"], self.chars_per_token) for result in results)
+        deduped, sentences_dropped = self._dedupe(results)
+        ordered = self._mmr_order(deduped)
+        packed = self._fit_budget(ordered)
+        tokens_after = sum(estimate_tokens(result["content"], self.chars_per_token) for result in packed)
+        return packed, {
+            "context_tokens": tokens_after,
+            "prompt_tokens_saved": tokens_before - tokens_after,
+            "duplicate_sentences_dropped": sentences_dropped,
+            "chunks_dropped": len(results) - len(packed)
+        }
+
+    def _dedupe(self, results: List[Dict[str, Any]]) -> Tuple[List[Tuple[Dict[str, Any], List[str]]], int]:
+        """Split chunks into sentences, dropping those an earlier chunk already contains"""
+        seen = set()
+        seen_text = ""
+        kept = []
+        dropped = 0
+        for result in results:
+            sentences = []
+            for sentence in _SENTENCE_BOUNDARY.split(result["content"].strip()):
+                key = _normalize(sentence)
+                if not key:
+                    continue
+                if key in seen or (len(key) >= self._MIN_FRAGMENT_CHARS and key in seen_text):
+                    dropped += 1
+                    continue
+                seen.add(key)
+                sentences.append(sentence.strip())
+            seen_text += " " + _normalize(result["content"])
+            if sentences:
+                kept.append((result, sentences))
+        return kept, dropped
+
+    def _mmr_order(self, chunks: List[Tuple[Dict[str, Any], List[str]]]) -> List[Tuple[Dict[str, Any], List[str]]]:
+        """Order chunks by maximal marginal relevance"""
+        if len(chunks) < 2 or self.mmr_lambda >= 1.0:
+            return chunks
+        vectors = [Counter(tokenize(" ".join(sentences))) for _, sentences in chunks]
+        relevance = [1.0 - i / len(chunks) for i in range(len(chunks))]
+        remaining = list(range(len(chunks)))
+        selected = []
+        while remaining:
+            def score(i):
+                redundancy = max((_cosine(vectors[i], vectors[j]) for j in selected), default=0.0)
+                return self.mmr_lambda * relevance[i] - (1.0 - self.mmr_lambda) * redundancy
+            best = max(remaining, key=score)
+            selected.append(best)
+            remaining.remove(best)
+        return [chunks[i] for i in selected]
+
+    def _fit_budget(self, chunks: List[Tuple[Dict[str, Any], List[str]]]) -> List[Dict[str, Any]]:
+        """Add chunks (or their leading sentences) until the token budget is used"""
+        packed = []
+        remaining = self.token_budget
+        for result, sentences in chunks:
+            taken = []
+            for sentence in sentences:
+                cost = estimate_tokens(" ".join(taken + [sentence]), self.chars_per_token)
+                if cost > remaining:
+                    break
+                taken.append(sentence)
+            if not taken:
+                # Fill what is left with the start of the sentence, if that is worth sending
+                if packed and remaining * self.chars_per_token < self._MIN_FRAGMENT_CHARS:
+                    continue
+                taken = [self._truncate(sentences[0], max(remaining, 1))]
+            content = " ".join(taken)
+            remaining -= estimate_tokens(content, self.chars_per_token)
+            packed.append(dict(result, content=content))
+        return packed
+
+    def _truncate(self, text: str, tokens: int) -> str:
+        """The start of text within a token budget, cut at a word boundary where possible"""
+        limit = int(tokens * self.chars_per_token)
+        if len(text) <= limit:
+            return text
+        cut = text[:limit]
+        space = cut.rfind(" ")
+        return cut[:space] if space > 0 else cut
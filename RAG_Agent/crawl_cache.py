@@ -0,0 +1,126 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, Any, Optional
+
+def normalize_content(text: str) -> str:
+    """Page text with whitespace collapsed, so re-rendering differences don't count as changes"""
+    return re.sub(r"\s+", " ", text).strip()
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the normalized page text"""
+    return hashlib.sha256(normalize_content(text).encode("utf-8")).hexdigest()
+
+class CrawlCache:
+    """Per-URL validators (ETag, Last-Modified) and content hash from the last crawl.
+
+    Used to skip unchanged pages: validators allow a conditional request
+    (304 Not Modified) so the page is not downloaded or rendered at all, and
+    the content hash catches pages that were fetched but whose text is the
+    same as last time.
+    """
+    def __init__(self, db_path: str = "./crawl_cache.sqlite"):
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL, "
+            "fetched_at REAL NOT NULL, checked_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """The stored entry for a URL, or None if it was never stored"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_hash, fetched_at, checked_at FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"url": url, "etag": row[0], "last_modified": row[1], "content_hash": row[2],
+                "fetched_at": row[3], "checked_at": row[4]}
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for a conditional request"""
+        entry = self.get(url)
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_unchanged(self, url: str, text: str) -> bool:
+        """Whether text hashes the same as the stored content"""
+        entry = self.get(url)
+        return entry is not None and entry["content_hash"] == content_hash(text)
+
+    def store(self, url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Record a page's content and validators (call once it has been processed)"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, fetched_at, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash(text), now, now)
+            )
+            self._conn.commit()
+
+    def touch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Mark a page as checked and unchanged, keeping newer validators if the server sent any"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pages SET checked_at = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (time.time(), etag, last_modified, url)
+            )
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pages = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return {"pages": pages}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def probe_unchanged(cache: CrawlCache, url: str, timeout: float = 10.0) -> bool:
+    """Ask the server, with a conditional HEAD request, whether a cached page changed.
+
+    True on 304 Not Modified, or when the server ignores the conditional
+    headers but returns the same ETag / Last-Modified as stored. False when
+    nothing is cached, the server sends no validators, or the request fails,
+    so the caller falls back to a full fetch.
+    """
+    entry = cache.get(url)
+    if entry is None or not (entry["etag"] or entry["last_modified"]):
+        return False
+    request = urllib.request.Request(url, method="HEAD", headers=cache.conditional_headers(url))
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            cache.touch(url)
+            return True
+        return False
+    except Exception:
+        return False
+    if (entry["etag"] and etag == entry["etag"]) or \
+            (not entry["etag"] and entry["last_modified"] and last_modified == entry["last_modified"]):
+        cache.touch(url)
+        return True
+    return False
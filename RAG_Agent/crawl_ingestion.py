@@ -0,0 +1,326 @@
+"""
+Crawl-to-index pipeline: fetches pages concurrently and indexes each one as
+soon as it arrives, instead of crawling everything first and loading the
+saved text in a separate step.
+
+Fetching is bounded by a global concurrency limit and, per host, by a limit
+on requests in flight and a minimum delay between request starts. Finished
+pages go through a queue to an ingestion worker that chunks, embeds and
+stores them (RAGSystem.add_text) while the rest are still being fetched.
+With a CrawlCache, pages the server reports as not modified, or whose text
+is unchanged, are skipped and only changed pages are indexed.
+
+Run: python crawl_ingestion.py URL [URL ...] [--urls-file urls.txt] [--fetcher http]
+"""
+import argparse
+import asyncio
+import logging
+import time
+import urllib.error
+import urllib.request
+from datetime import date
+from html.parser import HTMLParser
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlsplit
+from crawl_cache import CrawlCache, probe_unchanged
+
+logger = logging.getLogger("rag.crawl")
+
+# Marks the end of the crawl on the page queue
+_DONE = object()
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML page, one block element per paragraph"""
+    _SKIP = {"script", "style", "noscript", "head", "template", "svg"}
+    _BLOCKS = {"p", "div", "section", "article", "li", "tr", "br", "h1", "h2", "h3", "h4", "h5", "h6",
+               "header", "footer", "table", "ul", "ol"}
+
+    def __init__(self):
+        super().__init__()
+        self._skip_depth = 0
+        self._current = []
+        self.paragraphs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag in self._BLOCKS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self._BLOCKS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def _flush(self):
+        text = " ".join("".join(self._current).split())
+        if text:
+            self.paragraphs.append(text)
+        self._current = []
+
+    def text(self) -> str:
+        self._flush()
+        return "\n\n".join(self.paragraphs)
+
+def html_to_text(html: str) -> str:
+    """Visible text of an HTML page, with paragraphs separated by blank lines"""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
+
+def _page(text: str = "", etag: Optional[str] = None, last_modified: Optional[str] = None,
+          not_modified: bool = False) -> Dict[str, Any]:
+    """What a fetcher returns for one URL"""
+    return {"text": text, "etag": etag, "last_modified": last_modified, "not_modified": not_modified}
+
+class HttpFetcher:
+    """Plain HTTP fetcher (standard library only) that extracts page text from HTML.
+
+    Sends conditional requests, so an unchanged page costs a 304 and no
+    body. No JavaScript is run; use Crawl4aiFetcher for pages that need a
+    browser.
+    """
+    # Handles If-None-Match / If-Modified-Since itself
+    conditional = True
+
+    def __init__(self, timeout: float = 30.0, user_agent: str = "RAG-Agent-Crawler/1.0"):
+        self.timeout = timeout
+        self.user_agent = user_agent
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def _get(self, url: str, headers: Dict[str, str]) -> Dict[str, Any]:
+        request = urllib.request.Request(url, headers=dict(headers, **{"User-Agent": self.user_agent}))
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                charset = response.headers.get_content_charset() or "utf-8"
+                html = response.read().decode(charset, errors="replace")
+                return _page(html_to_text(html), response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return _page(not_modified=True)
+            raise
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Page text and validators; raises on HTTP and network errors"""
+        return await asyncio.to_thread(self._get, url, headers or {})
+
+class Crawl4aiFetcher:
+    """Fetcher backed by one shared crawl4ai browser, returning each page's markdown.
+
+    A browser load can't be made conditional, so with a cache the pipeline
+    first asks the server with a HEAD request (probe_unchanged).
+    """
+    conditional = False
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self._crawler = None
+        self._config = None
+
+    async def __aenter__(self):
+        # Imported here: crawl4ai is only needed for browser crawling
+        from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
+        from crawl4ai.content_scraping_strategy import LXMLWebScrapingStrategy
+        self._config = CrawlerRunConfig(scraping_strategy=LXMLWebScrapingStrategy(), verbose=self.verbose)
+        self._crawler = AsyncWebCrawler()
+        await self._crawler.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._crawler.__aexit__(*exc_info)
+        self._crawler = None
+        return False
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Page markdown and validators; raises if the crawl failed"""
+        result = await self._crawler.arun(url, config=self._config)
+        if not result.success:
+            raise RuntimeError(result.error_message or f"Failed to crawl {url}")
+        response_headers = {key.lower(): value for key, value in (result.response_headers or {}).items()}
+        return _page(str(result.markdown), response_headers.get("etag"), response_headers.get("last-modified"))
+
+class _HostLimiter:
+    """Per-host politeness: at most max_in_flight requests and delay seconds between starts"""
+    def __init__(self, max_in_flight: int, delay: float):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.delay = delay
+        self.next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        # Reserve the next start slot before sleeping so concurrent waiters queue up behind it
+        now = time.monotonic()
+        start = max(now, self.next_start)
+        self.next_start = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+        return False
+
+class CrawlIngestionPipeline:
+    """Crawls URLs concurrently and indexes each page into a RAGSystem as it arrives.
+
+    Pages are stored with the URL as their source and {"url", "crawl_date"}
+    metadata, so queries can be filtered by crawl date. With a cache,
+    unchanged pages are not indexed again, and a page's cache entry is only
+    updated once it has been indexed, so a failed page is retried next run.
+    A page that now has no text has its old chunks deleted.
+    """
+    def __init__(self, rag_system, fetcher=None, max_concurrency: int = 8, max_per_host: int = 2,
+                 host_delay: float = 0.5, queue_size: int = 16, cache: Optional[CrawlCache] = None):
+        self.rag_system = rag_system
+        self.fetcher = fetcher or HttpFetcher()
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.host_delay = host_delay
+        self.queue_size = queue_size
+
+    def run(self, urls: List[str]) -> Dict[str, Any]:
+        """Crawl and index the URLs, returning throughput statistics"""
+        return asyncio.run(self.arun(urls))
+
+    async def arun(self, urls: List[str]) -> Dict[str, Any]:
+        """Crawl and index the URLs from a running event loop"""
+        urls = list(dict.fromkeys(urls))
+        page_queue = asyncio.Queue(maxsize=self.queue_size)
+        limit = asyncio.Semaphore(self.max_concurrency)
+        hosts: Dict[str, _HostLimiter] = {}
+        # fetched: downloaded; unchanged: not modified or same text; changed: new or different text;
+        # emptied: changed to no text, so its old chunks were deleted
+        stats = {"pages": len(urls), "pages_fetched": 0, "pages_unchanged": 0, "pages_changed": 0,
+                 "pages_failed": 0, "pages_indexed": 0, "pages_emptied": 0, "changed_urls": [], "failed_urls": [],
+                 "first_page_indexed_seconds": None}
+        chunks_before = self.rag_system.ingest_stats["chunks_embedded"]
+        crawl_date = date.today().isoformat()
+        start = time.perf_counter()
+
+        async def crawl(url: str):
+            host = urlsplit(url).netloc
+            limiter = hosts.setdefault(host, _HostLimiter(self.max_per_host, self.host_delay))
+            try:
+                # Host slot first, so pages waiting on a busy host don't hold global slots
+                async with limiter, limit:
+                    with self.rag_system.metrics.span("crawl.fetch", items=1, host=host):
+                        page = await self._fetch(url)
+            except Exception as e:
+                logger.error("Error crawling %s: %s", url, e)
+                stats["pages_failed"] += 1
+                stats["failed_urls"].append(url)
+                return
+            if not page["not_modified"]:
+                stats["pages_fetched"] += 1
+            if page["not_modified"] or (self.cache is not None and self.cache.is_unchanged(url, page["text"])):
+                if self.cache is not None:
+                    self.cache.touch(url, page["etag"], page["last_modified"])
+                stats["pages_unchanged"] += 1
+                return
+            stats["pages_changed"] += 1
+            stats["changed_urls"].append(url)
+            await page_queue.put((url, page))
+
+        async def index():
+            while True:
+                item = await page_queue.get()
+                if item is _DONE:
+                    return
+                url, page = item
+                text = page["text"] if page["text"].strip() else ""
+                try:
+                    # Chunking and embedding block, so they run off the event loop while fetches continue.
+                    # An empty page still goes through add_text, which deletes its old chunks.
+                    await asyncio.to_thread(
+                        self.rag_system.add_text, text, url, 0, {"url": url, "crawl_date": crawl_date}
+                    )
+                except Exception as e:
+                    logger.error("Error indexing %s: %s", url, e)
+                    stats["pages_failed"] += 1
+                    stats["failed_urls"].append(url)
+                    continue
+                if self.cache is not None:
+                    self.cache.store(url, page["text"], page["etag"], page["last_modified"])
+                if not text:
+                    stats["pages_emptied"] += 1
+                    continue
+                stats["pages_indexed"] += 1
+                if stats["first_page_indexed_seconds"] is None:
+                    stats["first_page_indexed_seconds"] = time.perf_counter() - start
+                self.rag_system.progress(f"Indexed {url} ({stats['pages_indexed']}/{len(urls)})")
+
+        async with self.fetcher:
+            indexer = asyncio.create_task(index())
+            try:
+                await asyncio.gather(*(crawl(url) for url in urls))
+                await page_queue.put(_DONE)
+                await indexer
+            finally:
+                if not indexer.done():
+                    indexer.cancel()
+
+        elapsed = time.perf_counter() - start
+        stats["chunks_embedded"] = self.rag_system.ingest_stats["chunks_embedded"] - chunks_before
+        stats["elapsed_seconds"] = elapsed
+        stats["pages_per_sec"] = stats["pages_indexed"] / elapsed if elapsed > 0 else 0.0
+        self.rag_system.progress(f"Fetched {stats['pages_fetched']} pages: {stats['pages_unchanged']} unchanged, "
+                 f"{stats['pages_changed']} changed, {stats['pages_failed']} failed; "
+                 f"indexed {stats['pages_indexed']} in {elapsed:.1f}s")
+        return stats
+
+    async def _fetch(self, url: str) -> Dict[str, Any]:
+        """Fetch a page, conditionally when it is in the cache"""
+        headers = self.cache.conditional_headers(url) if self.cache is not None else {}
+        if headers and not getattr(self.fetcher, "conditional", False):
+            if await asyncio.to_thread(probe_unchanged, self.cache, url):
+                return _page(not_modified=True)
+        return await self.fetcher.fetch(url, headers)
+
+def main():
+    from config import Config
+    from rag_system import RAGSystem
+
+    parser = argparse.ArgumentParser(description="Crawl pages straight into the RAG index")
+    parser.add_argument("urls", nargs="*", help="Pages to crawl")
+    parser.add_argument("--urls-file", help="File with one URL per line")
+    parser.add_argument("--fetcher", default="crawl4ai", choices=["crawl4ai", "http"])
+    parser.add_argument("--concurrency", type=int, default=Config.CRAWL_CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=Config.CRAWL_MAX_PER_HOST)
+    parser.add_argument("--host-delay", type=float, default=Config.CRAWL_HOST_DELAY_SECONDS)
+    parser.add_argument("--cache", default=Config.CRAWL_CACHE_PATH, help="Crawl cache database")
+    parser.add_argument("--no-cache", action="store_true", help="Fetch and index every page again")
+    args = parser.parse_args()
+
+    urls = list(args.urls)
+    if args.urls_file:
+        with open(args.urls_file, 'r', encoding='utf-8') as f:
+            urls.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if not urls:
+        parser.error("no URLs given")
+
+    rag = RAGSystem()
+    fetcher = Crawl4aiFetcher() if args.fetcher == "crawl4ai" else HttpFetcher(rag.config.CRAWL_TIMEOUT_SECONDS)
+    pipeline = CrawlIngestionPipeline(
+        rag, fetcher,
+        max_concurrency=args.concurrency,
+        max_per_host=args.per_host,
+        host_delay=args.host_delay,
+        cache=None if args.no_cache else CrawlCache(args.cache)
+    )
+    stats = pipeline.run(urls)
+    for url in stats["failed_urls"]:
+        print(f"Failed: {url}")
+
+if __name__ == "__main__":
+    main()
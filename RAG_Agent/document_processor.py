@@ -1,61 +1,227 @@
 import hashlib
-from typing import List, Dict, Any
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+import json
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, TextIO, Tuple
+from langchain_core.documents import Document
 
-# Add spaCy import
-try:
-    import spacy
-    SPACY_AVAILABLE = True
-except ImportError:
-    SPACY_AVAILABLE = False
+# spaCy components we never use: only sentence boundaries are needed for chunking
+SPACY_UNUSED_COMPONENTS = ["tagger", "attribute_ruler", "lemmatizer", "ner"]
+
+# Metadata set by the chunker, which callers' extra metadata may not replace
+RESERVED_METADATA_KEYS = frozenset(["source", "page", "chunk_index", "chunk_id", "content_hash"])
+
+# Characters read per window when streaming (well below spaCy's default max_length)
+DEFAULT_STREAM_WINDOW = 100000
 
 class DocumentProcessor:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, mode: str = "default", spacy_sentences_per_chunk: int = 8):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, mode: str = "default", spacy_sentences_per_chunk: int = 8,
+                 spacy_pipeline: str = "full", spacy_model: str = "en_core_web_sm"):
         self.mode = mode
         self.spacy_sentences_per_chunk = spacy_sentences_per_chunk
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        # Load spaCy model if needed
-        if self.mode == "spacy" and SPACY_AVAILABLE:
-            self.nlp = spacy.load("en_core_web_sm")
-        else:
-            self.nlp = None
+        self.spacy_pipeline = spacy_pipeline
+        self.spacy_model = spacy_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # The splitter and spaCy model are built on first use: importing spaCy alone takes
+        # over a second, and a process that only queries never needs either
+        self._text_splitter = None
+        self._nlp = None
+        self._nlp_loaded = False
+        self._load_lock = threading.Lock()
+    
+    @property
+    def text_splitter(self):
+        """Character splitter used in default mode and when spaCy is unavailable"""
+        if self._text_splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+                separators=["\n\n", "\n", " ", ""]
+            )
+        return self._text_splitter
+    
+    @property
+    def nlp(self):
+        """spaCy pipeline in spacy mode (None otherwise or if spaCy is not installed)"""
+        if not self._nlp_loaded:
+            with self._load_lock:
+                if not self._nlp_loaded:
+                    if self.mode == "spacy":
+                        self._nlp = self._load_spacy(self.spacy_model, self.spacy_pipeline)
+                    self._nlp_loaded = True
+        return self._nlp
+    
+    def load(self):
+        """Build the splitter and load the spaCy model now instead of on the first chunk"""
+        self.text_splitter
+        self.nlp
+    
+    @staticmethod
+    def _load_spacy(model: str, pipeline: str):
+        """Load a spaCy pipeline for sentence segmentation (None if spaCy is not installed).
+
+        "full" loads every component, "trimmed" keeps only what the parser needs
+        for sentence boundaries, and "sentencizer" uses a rule-based splitter.
+        """
+        try:
+            import spacy
+        except ImportError:
+            return None
+        if pipeline == "sentencizer":
+            nlp = spacy.blank("en")
+            nlp.add_pipe("sentencizer")
+            return nlp
+        if pipeline == "trimmed":
+            return spacy.load(model, exclude=SPACY_UNUSED_COMPONENTS)
+        return spacy.load(model)
     
     def create_chunks(self, text: str, source: str, page: int = 0) -> List[Document]:
         """Create chunks from text with deterministic IDs"""
         if self.mode == "spacy" and self.nlp is not None:
             # ML-based chunking: split into sentences, then group
-            doc = self.nlp(text)
-            sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
-            # Group sentences into chunks
-            chunks = []
-            for i in range(0, len(sentences), self.spacy_sentences_per_chunk):
-                chunk = " ".join(sentences[i:i+self.spacy_sentences_per_chunk])
-                if chunk:
-                    chunks.append(chunk)
+            chunks = self._group_sentences(self.nlp(text))
         else:
             # Default: character-based chunking
             chunks = self.text_splitter.split_text(text)
-        documents = []
-        for i, chunk in enumerate(chunks):
-            # Create deterministic ID based on source, page, and chunk index
-            chunk_id = self._generate_chunk_id(source, page, i)
-            doc = Document(
-                page_content=chunk,
-                metadata={
-                    "source": source,
-                    "page": page,
-                    "chunk_index": i,
-                    "chunk_id": chunk_id
-                }
+        return self._build_documents(chunks, source, page)
+    
+    def create_chunks_many(self, items: Iterable[Tuple[str, str, int]], n_process: int = 1,
+                           batch_size: int = 64) -> List[List[Document]]:
+        """Chunk many (text, source, page) items at once.
+
+        With spaCy the texts are segmented by nlp.pipe, which batches work and can
+        spread it over n_process processes. Returns one list of chunks per item.
+        """
+        items = list(items)
+        if self.mode == "spacy" and self.nlp is not None:
+            docs = self.nlp.pipe(
+                (text for text, _, _ in items),
+                n_process=n_process,
+                batch_size=batch_size
             )
-            documents.append(doc)
-        return documents
+            return [
+                self._build_documents(self._group_sentences(doc), source, page)
+                for doc, (_, source, page) in zip(docs, items)
+            ]
+        return [self.create_chunks(text, source, page) for text, source, page in items]
+    
+    def _group_sentences(self, doc) -> List[str]:
+        """Group the sentences of a spaCy Doc into chunks"""
+        sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+        chunks = []
+        for i in range(0, len(sentences), self.spacy_sentences_per_chunk):
+            chunk = " ".join(sentences[i:i+self.spacy_sentences_per_chunk])
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+    
+    def _build_documents(self, chunks: List[str], source: str, page: int) -> List[Document]:
+        """Wrap chunk texts in Documents with deterministic IDs"""
+        return [self._build_document(chunk, source, page, i) for i, chunk in enumerate(chunks)]
+    
+    def _build_document(self, chunk: str, source: str, page: int, chunk_index: int) -> Document:
+        """Wrap a single chunk text in a Document"""
+        # Create deterministic ID based on source, page, and chunk index
+        chunk_id = self._generate_chunk_id(source, page, chunk_index)
+        return Document(
+            page_content=chunk,
+            metadata={
+                "source": source,
+                "page": page,
+                "chunk_index": chunk_index,
+                "chunk_id": chunk_id,
+                "content_hash": self._generate_content_hash(chunk)
+            }
+        )
+    
+    def iter_file_chunks(self, file_path: str, source: str, page: int = 0,
+                         window_size: int = DEFAULT_STREAM_WINDOW) -> Iterator[Document]:
+        """Stream chunks from a text file without loading it whole"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield from self.iter_chunks(f, source, page, window_size)
+    
+    def iter_chunks(self, stream: TextIO, source: str, page: int = 0,
+                    window_size: int = DEFAULT_STREAM_WINDOW) -> Iterator[Document]:
+        """Yield chunks from a text stream as they are produced.
+
+        The stream is read in windows of window_size characters. The tail of each
+        window, which may end mid-sentence (or mid-chunk in character mode), is
+        carried into the next window and segmented again, so windows overlap and
+        memory stays proportional to the window size. Chunk indices, and so IDs,
+        are assigned in stream order.
+        """
+        if self.mode == "spacy" and self.nlp is not None:
+            pieces = self._iter_sentence_chunks(stream, window_size)
+        else:
+            pieces = self._iter_character_chunks(stream, window_size)
+        for i, chunk in enumerate(pieces):
+            yield self._build_document(chunk, source, page, i)
+    
+    def _iter_sentence_chunks(self, stream: TextIO, window_size: int) -> Iterator[str]:
+        """Stream sentence-grouped chunk texts"""
+        carry = ""
+        pending = []
+        while True:
+            block = stream.read(window_size)
+            at_end = not block
+            text = carry + block
+            if not text:
+                break
+            sentences = list(self.nlp(text).sents)
+            carry = ""
+            # The last sentence may be cut by the window boundary: re-segment it with
+            # the next window, unless it has already grown past a full window
+            if not at_end and sentences and len(text) - sentences[-1].start_char < window_size:
+                carry = text[sentences[-1].start_char:]
+                sentences = sentences[:-1]
+            pending.extend(sent.text.strip() for sent in sentences if sent.text.strip())
+            while len(pending) >= self.spacy_sentences_per_chunk:
+                yield " ".join(pending[:self.spacy_sentences_per_chunk])
+                pending = pending[self.spacy_sentences_per_chunk:]
+            if at_end:
+                break
+        if pending:
+            yield " ".join(pending)
+    
+    def _iter_character_chunks(self, stream: TextIO, window_size: int) -> Iterator[str]:
+        """Stream character-split chunk texts"""
+        carry = ""
+        while True:
+            block = stream.read(window_size)
+            at_end = not block
+            text = carry + block
+            if not text:
+                break
+            chunks = self.text_splitter.split_text(text)
+            carry = ""
+            # Hold back the last chunk: it may continue in the next window
+            if not at_end and len(chunks) > 1:
+                start = text.rfind(chunks[-1])
+                if start > 0:
+                    carry = text[start:]
+                    chunks = chunks[:-1]
+            elif not at_end and len(text) < 2 * window_size:
+                carry = text
+                chunks = []
+            yield from chunks
+            if at_end:
+                break
+    
+    def add_metadata(self, doc: Document, metadata: Dict[str, Any]):
+        """Merge extra metadata into a chunk and fold it into the content hash.
+
+        Re-adding the same text with different metadata then counts as a
+        change, so the new metadata is written.
+        """
+        doc.metadata.update(metadata)
+        extra = json.dumps(metadata, sort_keys=True, default=str)
+        doc.metadata["content_hash"] = self._generate_content_hash(doc.page_content + "\0" + extra)
+    
+    def _generate_content_hash(self, chunk: str) -> str:
+        """Hash a chunk's text so changed content can be detected on re-ingestion"""
+        return hashlib.md5(chunk.encode()).hexdigest()
     
     def _generate_chunk_id(self, source: str, page: int, chunk_index: int) -> str:
         """Generate deterministic chunk ID"""
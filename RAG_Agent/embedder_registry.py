@@ -0,0 +1,60 @@
+import logging
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple, List, Union
+from embeddings import LocalEmbeddings, OllamaEmbeddingsWrapper
+from ollama_pool import normalize_base_urls
+
+logger = logging.getLogger("rag.embeddings")
+
+# Process-wide embedders, keyed by (backend, model name, base URLs, keep-alive)
+_embedders: Dict[Tuple[str, str, Any, Any], object] = {}
+_key_locks: Dict[Tuple[str, str, Any, Any], threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+def get_embedder(backend: str, model_name: str, base_url: Optional[Union[str, Sequence[str]]] = None,
+                 keep_alive: Optional[int] = 1800):
+    """Return the shared embedder for a backend/model, creating it on first use.
+
+    Creating an embedder is cheap; its model or clients load on the first
+    embedding call or on load().
+
+    For Ollama, base_url may list several endpoints to balance across.
+    """
+    if backend == "ollama":
+        key = (backend, model_name, normalize_base_urls(base_url), keep_alive)
+    else:
+        key = (backend, model_name, base_url, None)
+    embedder = _embedders.get(key)
+    if embedder is not None:
+        return embedder
+
+    with _registry_lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    # Only one thread loads a given model; others wait for it instead of loading it again
+    with key_lock:
+        embedder = _embedders.get(key)
+        if embedder is None:
+            if backend == "local":
+                embedder = LocalEmbeddings(model_name)
+            elif backend == "ollama":
+                embedder = OllamaEmbeddingsWrapper(model_name, key[2], keep_alive)
+            else:
+                raise ValueError(f"Unknown embedding backend: {backend}")
+            _embedders[key] = embedder
+    return embedder
+
+def warm_up(specs: List[Tuple[str, str, Optional[str]]], background: bool = False) -> Optional[threading.Thread]:
+    """Load the given (backend, model name, base URL) embedders ahead of time"""
+    def load_all():
+        for backend, model_name, base_url in specs:
+            try:
+                get_embedder(backend, model_name, base_url).load()
+            except Exception as e:
+                logger.warning("Error warming up %s embedder %s: %s", backend, model_name, e)
+
+    if not background:
+        load_all()
+        return None
+    thread = threading.Thread(target=load_all, name="embedder-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+class EmbeddingCache:
+    """Disk-backed, content-addressed store of embedding vectors.
+
+    Vectors are keyed by embedding model name plus a SHA-256 of the text and
+    stored as float32 blobs in SQLite, with a bounded in-memory LRU in front.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    _LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, db_path: str = "./embedding_cache.sqlite", memory_size: int = 10000):
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """Build the cache key for a text embedded by a given model"""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model_name}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up keys in memory first, then on disk"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self.memory_hits += 1
+                else:
+                    missing.append(key)
+
+            disk_found = 0
+            for start in range(0, len(missing), self._LOOKUP_BATCH_SIZE):
+                batch = missing[start:start + self._LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    disk_found += 1
+
+            self.disk_hits += disk_found
+            self.misses += len(missing) - disk_found
+        return found
+
+    def put_many(self, model_name: str, items: Dict[str, List[float]]):
+        """Store vectors on disk and in the LRU"""
+        if not items:
+            return
+        rows = [
+            (key, model_name, np.asarray(vector, dtype=np.float32).tobytes())
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            for key, vector in items.items():
+                self._remember(key, list(vector))
+
+    def _remember(self, key: str, vector: List[float]):
+        """Insert into the in-memory LRU, evicting the oldest entries"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the cache"""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbeddings:
+    """Wraps any embedding backend with a persistent EmbeddingCache"""
+    def __init__(self, embeddings, cache: EmbeddingCache, model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or getattr(embeddings, "model_name", type(embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents, only calling the backend for unseen texts"""
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Embed each missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, computed)
+            found.update(computed)
+
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query"""
+        key = EmbeddingCache.make_key(self.model_name, text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return list(found[key])
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model_name, {key: vector})
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query, awaiting the backend only on a cache miss.
+
+        Cache reads and writes hit SQLite, so they run in a worker thread.
+        """
+        key = EmbeddingCache.make_key(self.model_name, text)
+        found = await asyncio.to_thread(self.cache.get_many, [key])
+        if key in found:
+            return list(found[key])
+        vector = await self.embeddings.aembed_query(text)
+        await asyncio.to_thread(self.cache.put_many, self.model_name, {key: vector})
+        return vector
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return self.cache.get_stats()
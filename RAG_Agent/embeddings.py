@@ -1,11 +1,32 @@
-from typing import List
-from sentence_transformers import SentenceTransformer
-from langchain_ollama import OllamaEmbeddings
-import numpy as np
+import asyncio
+import threading
+from typing import List, Optional, Sequence, Union
+from ollama_pool import get_pool
 
 class LocalEmbeddings:
+    """sentence-transformers embedder, loaded on first use.
+
+    Importing sentence-transformers pulls in torch and takes seconds, so
+    neither the import nor the model load happens until something is embedded
+    (or load() is called, e.g. by a background warm-up).
+    """
     def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self._model = None
+        self._load_lock = threading.Lock()
+    
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+    
+    def load(self):
+        """Load the model now"""
+        self.model
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed a list of documents"""
@@ -16,19 +37,41 @@ class LocalEmbeddings:
         """Embed a single query"""
         embedding = self.model.encode([text])
         return embedding[0].tolist()
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query in a worker thread (encoding is CPU-bound)"""
+        return await asyncio.to_thread(self.embed_query, text)
 
 class OllamaEmbeddingsWrapper:
-    """Wrapper for Ollama embeddings - requires nomic-embed-text model"""
-    def __init__(self, model: str = "nomic-embed-text", base_url: str = "http://localhost:11434"):
-        self.embeddings = OllamaEmbeddings(
-            model=model,
-            base_url=base_url
-        )
+    """Wrapper for Ollama embeddings - requires nomic-embed-text model.
+
+    base_url may list several endpoints; requests are balanced across them
+    by the shared OllamaPool.
+    """
+    def __init__(self, model: str = "nomic-embed-text", base_url: Union[str, Sequence[str]] = "http://localhost:11434",
+                 keep_alive: Optional[int] = 1800):
+        self.model_name = model
+        self.pool = get_pool(base_url, keep_alive)
+        self._client_name = f"embeddings:{model}"
+    
+    def _make_embeddings(self, base_url: str):
+        # Imported here: langchain_ollama takes over a second to import
+        from langchain_ollama import OllamaEmbeddings
+        return OllamaEmbeddings(model=self.model_name, base_url=base_url, keep_alive=self.pool.keep_alive)
+    
+    def load(self):
+        """Build the client for every endpoint now (no request is sent)"""
+        for endpoint in self.pool.endpoints:
+            self.pool.client(endpoint, self._client_name, self._make_embeddings)
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed a list of documents"""
-        return self.embeddings.embed_documents(texts)
+        return self.pool.run(self._client_name, self._make_embeddings, lambda e: e.embed_documents(texts))
     
     def embed_query(self, text: str) -> List[float]:
         """Embed a single query"""
-        return self.embeddings.embed_query(text)
\ No newline at end of file
+        return self.pool.run(self._client_name, self._make_embeddings, lambda e: e.embed_query(text))
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query using the async Ollama client"""
+        return await self.pool.arun(self._client_name, self._make_embeddings, lambda e: e.aembed_query(text))
\ No newline at end of file
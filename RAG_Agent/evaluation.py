@@ -0,0 +1,204 @@
+"""
+Evaluation runner: answers a dataset of questions with RAGSystem.query and
+has an LLM judge each answer against the expected one.
+
+Questions are answered and judged on a bounded thread pool. Judgments are
+cached on disk by (judge model, question, expected, actual), so re-running
+an unchanged regression set only judges answers that changed.
+
+Dataset: a JSON list, or JSON lines, of {"question": ..., "expected": ...}
+objects, each optionally with "filters" for the query.
+
+Run: python evaluation.py dataset.json [--concurrency 4] [--output evaluation_results.json]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from instrumentation import latency_summary
+from llm_client import GENERATION_ERROR_PREFIX
+
+logger = logging.getLogger("rag.evaluation")
+
+def load_dataset(path: str) -> List[Dict[str, Any]]:
+    """Read evaluation items from a JSON list or a JSON lines file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for i, item in enumerate(items):
+        if "question" not in item or "expected" not in item:
+            raise ValueError(f"Dataset item {i} needs 'question' and 'expected' fields")
+    return items
+
+class JudgmentCache:
+    """Disk-backed verdicts keyed by judge model and the (question, expected, actual) triple"""
+    def __init__(self, db_path: str = "./judgment_cache.sqlite"):
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS judgments ("
+            "key TEXT PRIMARY KEY, judge TEXT NOT NULL, correct INTEGER NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(judge: str, question: str, expected: str, actual: str) -> str:
+        """Build the cache key for one judgment"""
+        payload = json.dumps([question, expected, actual], ensure_ascii=False)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{judge}:{digest}"
+
+    def get(self, key: str) -> Optional[bool]:
+        """The cached verdict, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT correct FROM judgments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return bool(row[0])
+
+    def put(self, key: str, judge: str, correct: bool):
+        """Store a verdict"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO judgments (key, judge, correct, created) VALUES (?, ?, ?, ?)",
+                (key, judge, int(correct), time.time())
+            )
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and the number of stored verdicts"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM judgments").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class EvaluationRunner:
+    """Answers and judges a dataset with bounded parallelism.
+
+    judge is any object with judge_answer(question, expected, actual) that
+    raises when the judge itself fails (default: the system's LLM client).
+    Failed judge calls and failed generations count as incorrect and are
+    never cached.
+    """
+    def __init__(self, rag_system, judge=None, cache: Optional[JudgmentCache] = None,
+                 max_concurrency: int = 4):
+        self.rag_system = rag_system
+        self.judge = judge or rag_system.llm_client
+        self.judge_name = getattr(self.judge, "model", type(self.judge).__name__)
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+
+    def run(self, dataset: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Evaluate every item and return accuracy, latencies and per-item results"""
+        self.rag_system.progress(f"Evaluating {len(dataset)} questions with up to {self.max_concurrency} in parallel")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            items = list(executor.map(self._evaluate, dataset))
+        elapsed = time.perf_counter() - start
+
+        correct = sum(1 for item in items if item["correct"])
+        judged = [item for item in items if item["judgment"] == "judged"]
+        report = {
+            "judge": self.judge_name,
+            "questions": len(items),
+            "correct": correct,
+            "accuracy": correct / len(items) if items else 0.0,
+            "judged": len(judged),
+            "judgments_cached": sum(1 for item in items if item["judgment"] == "cached"),
+            "generation_errors": sum(1 for item in items if item["judgment"] == "generation_error"),
+            "judge_errors": sum(1 for item in items if item["judgment"] == "judge_error"),
+            "elapsed_seconds": elapsed,
+            "query_latency": latency_summary([item["query_seconds"] for item in items]),
+            "judge_latency": latency_summary([item["judge_seconds"] for item in judged]),
+            "items": items
+        }
+        self.rag_system.progress(f"Accuracy {report['accuracy']:.1%} ({correct}/{len(items)}), "
+                 f"{report['judgments_cached']} cached judgments, {elapsed:.1f}s")
+        return report
+
+    def _evaluate(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        question, expected = item["question"], item["expected"]
+        start = time.perf_counter()
+        result = self.rag_system.query(question, filters=item.get("filters"))
+        query_seconds = time.perf_counter() - start
+        answer = result["answer"]
+        outcome = {
+            "question": question,
+            "expected": expected,
+            "answer": answer,
+            "sources": result["sources"],
+            "query_seconds": query_seconds,
+            "judge_seconds": 0.0,
+            "correct": False
+        }
+        if answer.startswith(GENERATION_ERROR_PREFIX):
+            outcome["judgment"] = "generation_error"
+            return outcome
+
+        key = JudgmentCache.make_key(self.judge_name, question, expected, answer)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            outcome["correct"] = cached
+            outcome["judgment"] = "cached"
+            return outcome
+
+        start = time.perf_counter()
+        try:
+            correct = self.judge.judge_answer(question, expected, answer)
+        except Exception as e:
+            logger.warning("Error judging answer to %r: %s", question, e)
+            outcome["judgment"] = "judge_error"
+            return outcome
+        outcome["judge_seconds"] = time.perf_counter() - start
+        outcome["correct"] = correct
+        outcome["judgment"] = "judged"
+        if self.cache is not None:
+            self.cache.put(key, self.judge_name, correct)
+        return outcome
+
+def main():
+    from config import Config
+    from rag_system import RAGSystem
+
+    parser = argparse.ArgumentParser(description="Evaluate the RAG system on a question set")
+    parser.add_argument("dataset", help="JSON or JSON lines file of {question, expected} items")
+    parser.add_argument("--concurrency", type=int, default=Config.EVAL_CONCURRENCY)
+    parser.add_argument("--cache", default=Config.EVAL_JUDGMENT_CACHE_PATH, help="Judgment cache database")
+    parser.add_argument("--no-cache", action="store_true", help="Judge every answer again")
+    parser.add_argument("--output", default="evaluation_results.json")
+    args = parser.parse_args()
+
+    config = Config()
+    config.QUERY_ONLY = True
+    rag = RAGSystem(config)
+    cache = None if args.no_cache else JudgmentCache(args.cache)
+    report = EvaluationRunner(rag, cache=cache, max_concurrency=args.concurrency).run(load_dataset(args.dataset))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+    for name in ("query_latency", "judge_latency"):
+        summary = ", ".join(f"{key}={value:.1f}" for key, value in report[name].items())
+        print(f"{name}: {summary}")
+
+if __name__ == "__main__":
+    main()
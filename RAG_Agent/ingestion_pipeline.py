@@ -0,0 +1,336 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+from document_processor import DocumentProcessor
+from pdf_loader import count_pdf_pages, iter_pdf_pages, open_pdf
+from context_packer import estimate_tokens
+
+# Marks the end of a stage's output on a queue
+_DONE = object()
+
+# Per-process chunker, created once by the pool initializer
+_worker_processor = None
+
+# (path, PdfReader) of the PDF a worker read last, so consecutive page ranges reuse it
+_worker_pdf = (None, None)
+
+def _init_chunk_worker(chunk_size: int, chunk_overlap: int, mode: str, sentences_per_chunk: int,
+                       spacy_pipeline: str):
+    """Build the DocumentProcessor used by a chunking worker process"""
+    global _worker_processor
+    _worker_processor = DocumentProcessor(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        mode=mode,
+        spacy_sentences_per_chunk=sentences_per_chunk,
+        spacy_pipeline=spacy_pipeline
+    )
+    # Load the model here so it isn't timed as part of the first group's chunking
+    _worker_processor.load()
+
+def _chunk_items(items: List[Tuple[str, str, int]]) -> List[Tuple[str, int, List]]:
+    """Chunk (text, source, page) items, returning (source, page, documents) for each"""
+    chunks = _worker_processor.create_chunks_many(items, batch_size=max(len(items), 1))
+    return [(source, page, documents) for (_, source, page), documents in zip(items, chunks)]
+
+def _chunk_files(file_paths: List[str]) -> Tuple[List[Tuple[str, str, int, List]], float]:
+    """Read and chunk a group of text files inside a worker process.
+
+    Returns (path, source, page, documents) per file and the seconds spent,
+    so the parent can record the chunking stage.
+    """
+    start = time.perf_counter()
+    items = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            items.append((f.read(), os.path.basename(file_path), 0))
+    results = [(path,) + result for path, result in zip(file_paths, _chunk_items(items))]
+    return results, time.perf_counter() - start
+
+def _chunk_pdf_pages(file_path: str, first_page: int, last_page: int) -> Tuple[List[Tuple[str, str, int, List]], float]:
+    """Extract and chunk a range of PDF pages inside a worker process"""
+    global _worker_pdf
+    start = time.perf_counter()
+    if _worker_pdf[0] != file_path:
+        _worker_pdf = (file_path, open_pdf(file_path))
+    source = os.path.basename(file_path)
+    items = [(text, source, number) for number, text in
+             iter_pdf_pages(file_path, first_page, last_page, reader=_worker_pdf[1])]
+    return [(file_path,) + result for result in _chunk_items(items)], time.perf_counter() - start
+
+class IngestionPipeline:
+    """Pipelined ingestion of many text files or PDFs into a RAGSystem.
+
+    Files (or ranges of PDF pages) are chunked on a process pool, chunks are
+    embedded in batches that span file boundaries, and a writer thread adds
+    them to the vector store. Stages are connected by bounded queues so no
+    stage runs far ahead.
+
+    The writer also deletes chunks left over from longer previous versions of
+    a page, once per stale_check_pages pages and only after flushing what it
+    has buffered, so files sharing a name end up as with consecutive add_file
+    calls.
+    """
+    def __init__(self, rag_system, workers: Optional[int] = None, embed_batch_size: int = 256,
+                 write_batch_size: int = 1000, queue_size: int = 8, files_per_task: int = 8,
+                 stale_check_pages: int = 256):
+        self.rag_system = rag_system
+        self.workers = workers or os.cpu_count() or 1
+        self.files_per_task = files_per_task
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.stale_check_pages = stale_check_pages
+        self.queue_size = queue_size
+        self._errors = []
+
+    def run(self, file_paths: List[str]) -> Dict[str, Any]:
+        """Ingest the given text files and return throughput statistics"""
+        return self._run(self._file_tasks(file_paths))
+
+    def run_pdfs(self, pdf_paths: List[str], pages_per_task: int = 4) -> Dict[str, Any]:
+        """Ingest PDFs page by page, each chunk tagged with its 1-based page number.
+
+        Every PDF is split into ranges of pages_per_task pages that workers
+        extract and chunk independently, so one large PDF is spread over all
+        workers and only the ranges in flight are held in memory. Chunks of
+        pages past the end of a PDF that got shorter are deleted afterwards.
+        """
+        page_counts = {}
+        stats = self._run(self._pdf_tasks(pdf_paths, pages_per_task, page_counts))
+        for source, page_count in page_counts.items():
+            stats["chunks_deleted"] += self.rag_system._delete_pages_after(source, page_count)
+        return stats
+
+    def _file_tasks(self, file_paths: List[str]) -> Iterator[Tuple[Callable, tuple]]:
+        paths = iter(file_paths)
+        while True:
+            # Small groups of files let each worker batch them through nlp.pipe
+            group = list(itertools.islice(paths, self.files_per_task))
+            if not group:
+                return
+            yield _chunk_files, (group,)
+
+    def _pdf_tasks(self, pdf_paths: List[str], pages_per_task: int,
+                   page_counts: Dict[str, int]) -> Iterator[Tuple[Callable, tuple]]:
+        for pdf_path in pdf_paths:
+            page_count = count_pdf_pages(pdf_path)
+            page_counts[os.path.basename(pdf_path)] = page_count
+            for first_page in range(1, page_count + 1, pages_per_task):
+                yield _chunk_pdf_pages, (pdf_path, first_page, min(first_page + pages_per_task - 1, page_count))
+
+    def _run(self, tasks: Iterator[Tuple[Callable, tuple]]) -> Dict[str, Any]:
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        # A text file counts as one page
+        stats = {"files": 0, "pages": 0, "chunks": 0, "chunks_embedded": 0, "chunks_skipped": 0,
+                 "chunks_updated": 0, "chunks_deleted": 0}
+        self._errors = []
+
+        start = time.perf_counter()
+        stages = [
+            threading.Thread(target=self._chunk_stage, args=(tasks, chunk_queue, stats), daemon=True),
+            threading.Thread(target=self._embed_stage, args=(chunk_queue, write_queue, stats), daemon=True),
+            threading.Thread(target=self._write_stage, args=(write_queue, stats), daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+        elapsed = time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+
+        for key in ("chunks_embedded", "chunks_skipped", "chunks_updated"):
+            self.rag_system.ingest_stats[key] += stats[key]
+        stats["elapsed_seconds"] = elapsed
+        stats["files_per_sec"] = stats["files"] / elapsed if elapsed > 0 else 0.0
+        stats["chunks_per_sec"] = stats["chunks"] / elapsed if elapsed > 0 else 0.0
+        self.rag_system.progress(f"Ingested {stats['files']} files ({stats['pages']} pages, {stats['chunks']} chunks) in {elapsed:.1f}s: "
+              f"{stats['files_per_sec']:.1f} files/sec, {stats['chunks_per_sec']:.1f} chunks/sec")
+        return stats
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Put on a bounded queue, giving up if another stage has failed"""
+        while not self._errors:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @staticmethod
+    def _drain(q: queue.Queue):
+        """Consume a queue up to its end marker so the producer never blocks"""
+        while q.get() is not _DONE:
+            pass
+
+    def _chunk_stage(self, tasks: Iterator[Tuple[Callable, tuple]], chunk_queue: queue.Queue, stats: Dict[str, Any]):
+        """Run chunking tasks on a process pool, keeping a bounded number in flight"""
+        processor = self.rag_system.document_processor
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_chunk_worker,
+                initargs=(
+                    processor.chunk_size,
+                    processor.chunk_overlap,
+                    processor.mode,
+                    processor.spacy_sentences_per_chunk,
+                    processor.spacy_pipeline
+                )
+            ) as pool:
+                pending = set()
+                paths = set()
+                max_in_flight = self.workers * 2
+                exhausted = False
+                while pending or not exhausted:
+                    if self._errors:
+                        # A later stage failed: submit nothing more and drop what has not started
+                        for future in pending:
+                            future.cancel()
+                        return
+                    while not exhausted and len(pending) < max_in_flight:
+                        task = next(tasks, None)
+                        if task is None:
+                            exhausted = True
+                        else:
+                            function, args = task
+                            pending.add(pool.submit(function, *args))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results, seconds = future.result()
+                        self.rag_system.metrics.record(
+                            "ingest.chunk", seconds, sum(len(documents) for _, _, _, documents in results)
+                        )
+                        for path, source, page, documents in results:
+                            paths.add(path)
+                            stats["files"] = len(paths)
+                            stats["pages"] += 1
+                            stats["chunks"] += len(documents)
+                            if not self._put(chunk_queue, (source, page, documents)):
+                                return
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            # Downstream stages drain their input on failure, so this cannot block forever
+            chunk_queue.put(_DONE)
+
+    def _embed_stage(self, chunk_queue: queue.Queue, write_queue: queue.Queue, stats: Dict[str, Any]):
+        """Embed new chunks in batches that span file boundaries"""
+        buffer = []
+        # (source, page, chunk count, end of its chunks in the stream) of pages not yet handed on
+        chunk_counts = []
+        buffered = emitted = 0
+        input_done = False
+        try:
+            while True:
+                item = chunk_queue.get()
+                if item is _DONE:
+                    input_done = True
+                    break
+                source, page, documents = item
+                buffer.extend(documents)
+                buffered += len(documents)
+                chunk_counts.append((source, page, len(documents), buffered))
+                while len(buffer) >= self.embed_batch_size:
+                    batch, buffer = buffer[:self.embed_batch_size], buffer[self.embed_batch_size:]
+                    emitted += len(batch)
+                    # Pages whose chunks have all been embedded go to the writer with the batch
+                    complete = [count[:3] for count in chunk_counts if count[3] <= emitted]
+                    chunk_counts = chunk_counts[len(complete):]
+                    if not self._embed_batch(batch, complete, write_queue, stats):
+                        return
+            self._embed_batch(buffer, [count[:3] for count in chunk_counts], write_queue, stats)
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            if not input_done:
+                self._drain(chunk_queue)
+            write_queue.put(_DONE)
+
+    def _embed_batch(self, documents: List, chunk_counts: List[Tuple[str, int, int]],
+                     write_queue: queue.Queue, stats: Dict[str, Any]) -> bool:
+        """Skip unchanged stored chunks, embed the rest and hand them to the writer"""
+        if self._errors:
+            return False
+        # Files with the same name share chunk IDs; the later one wins, as with add_file
+        documents = list({doc.metadata["chunk_id"]: doc for doc in documents}.values())
+        new_documents, changed_documents, unchanged = [], [], 0
+        if documents:
+            new_documents, changed_documents, unchanged = self.rag_system._partition_chunks(documents)
+        stats["chunks_skipped"] += unchanged
+        to_embed = new_documents + changed_documents
+        embeddings = []
+        if to_embed:
+            texts = [doc.page_content for doc in to_embed]
+            with self.rag_system.metrics.span("ingest.embed", items=len(texts),
+                                              tokens=sum(estimate_tokens(text) for text in texts)):
+                embeddings = self.rag_system.embeddings.embed_documents(texts)
+            stats["chunks_embedded"] += len(to_embed)
+            stats["chunks_updated"] += len(changed_documents)
+        elif not chunk_counts:
+            return True
+        return self._put(write_queue, (new_documents, changed_documents, embeddings, chunk_counts))
+
+    def _write(self, pending: Dict[str, Tuple[Any, List[float]]]):
+        if not pending:
+            return
+        documents = [doc for doc, _ in pending.values()]
+        embeddings = [embedding for _, embedding in pending.values()]
+        with self.rag_system.metrics.span("ingest.write", items=len(documents)):
+            self.rag_system.vector_store.add_documents(documents, embeddings, check_existing=False)
+
+    def _delete_stale(self, pending: Dict[str, Tuple[Any, List[float]]], chunk_counts: Dict[Tuple[str, int], int],
+                      stats: Dict[str, Any]):
+        """Flush buffered chunks, then delete chunks past each page's latest chunk count"""
+        self._write(pending)
+        pending.clear()
+        stats["chunks_deleted"] += self.rag_system._delete_stale_chunks(
+            [(source, page, count) for (source, page), count in chunk_counts.items()]
+        )
+        chunk_counts.clear()
+
+    def _write_stage(self, write_queue: queue.Queue, stats: Dict[str, Any]):
+        """Write embedded chunks to the vector store in large batches"""
+        # New chunks by ID, so a later version of a buffered chunk replaces it
+        pending = {}
+        # Latest chunk count per (source, page) whose stale chunks are still to be checked
+        chunk_counts = {}
+        input_done = False
+        try:
+            while True:
+                item = write_queue.get()
+                if item is _DONE:
+                    input_done = True
+                    break
+                new_documents, changed_documents, item_embeddings, item_counts = item
+                # Changed chunks are rare and overwrite in place, so write them straight away
+                for doc in changed_documents:
+                    pending.pop(doc.metadata["chunk_id"], None)
+                if changed_documents:
+                    with self.rag_system.metrics.span("ingest.write", items=len(changed_documents)):
+                        self.rag_system.vector_store.update_documents(
+                            changed_documents, item_embeddings[len(new_documents):]
+                        )
+                for doc, embedding in zip(new_documents, item_embeddings):
+                    pending[doc.metadata["chunk_id"]] = (doc, embedding)
+                for source, page, count in item_counts:
+                    chunk_counts[(source, page)] = count
+                if len(chunk_counts) >= self.stale_check_pages:
+                    self._delete_stale(pending, chunk_counts, stats)
+                elif len(pending) >= self.write_batch_size:
+                    self._write(pending)
+                    pending = {}
+            self._delete_stale(pending, chunk_counts, stats)
+        except Exception as e:
+            self._errors.append(e)
+            if not input_done:
+                self._drain(write_queue)
@@ -0,0 +1,188 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger("rag.metrics")
+
+# Progress messages go to stdout unless turned off with set_progress_output(False)
+_progress_output = True
+
+def set_progress_output(enabled: bool):
+    """Turn stdout progress messages on or off for the whole process.
+
+    Components built by a RAGSystem follow its own Progress instead, so this
+    only matters for stores, pipelines and scripts used on their own.
+    """
+    global _progress_output
+    _progress_output = enabled
+
+def progress(message: str):
+    """Print a progress message if progress output is enabled"""
+    if _progress_output:
+        print(message)
+
+class Progress:
+    """Progress output for one RAGSystem and the components it drives.
+
+    Prints like progress() unless disabled, without touching the
+    process-wide setting, so one instance's PRINT_PROGRESS doesn't silence
+    (or re-enable) another's.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def __call__(self, message: str):
+        if self.enabled:
+            progress(message)
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean of latencies given in seconds, in milliseconds (zeros if empty)"""
+    if not latencies:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean())
+    }
+
+class Span:
+    """A timed stage; add() item and token counts while it is open"""
+    __slots__ = ("stage", "labels", "items", "tokens")
+
+    def __init__(self, stage: str, items: int = 0, tokens: int = 0, labels: Optional[Dict[str, Any]] = None):
+        self.stage = stage
+        self.items = items
+        self.tokens = tokens
+        self.labels = labels or {}
+
+    def add(self, items: int = 0, tokens: int = 0):
+        self.items += items
+        self.tokens += tokens
+
+class Metrics:
+    """Per-stage durations, item counts and token counts.
+
+    Every finished span updates a duration histogram and counters for its
+    stage and is logged as one JSON line on the "rag.metrics" logger (at
+    INFO, so it only appears once logging is configured). Aggregates are
+    available as a dict (snapshot) or in Prometheus text format.
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, namespace: str = "rag", buckets: Tuple[float, ...] = DEFAULT_BUCKETS, log_spans: bool = True):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self.log_spans = log_spans
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def span(self, stage: str, items: int = 0, tokens: int = 0, **labels) -> Iterator[Span]:
+        """Time a block as one occurrence of a stage"""
+        span = Span(stage, items, tokens, labels)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            self.record(stage, time.perf_counter() - start, span.items, span.tokens, error=True, **span.labels)
+            raise
+        self.record(stage, time.perf_counter() - start, span.items, span.tokens, **span.labels)
+
+    def timed_iter(self, iterable: Iterable, stage: str, **labels) -> Iterator:
+        """Yield from iterable, recording the time spent producing items as one span.
+
+        Useful for lazy stages such as streamed chunking, whose work happens
+        between the consumer's own stages.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        count = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    break
+                elapsed += time.perf_counter() - start
+                count += 1
+                yield item
+        finally:
+            self.record(stage, elapsed, count, **labels)
+
+    def record(self, stage: str, duration: float, items: int = 0, tokens: int = 0, error: bool = False, **labels):
+        """Record one finished occurrence of a stage"""
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "items": 0, "tokens": 0, "errors": 0,
+                         "buckets": [0] * len(self.buckets)}
+                self._stages[stage] = entry
+            entry["count"] += 1
+            entry["seconds"] += duration
+            entry["max_seconds"] = max(entry["max_seconds"], duration)
+            entry["items"] += items
+            entry["tokens"] += tokens
+            entry["errors"] += int(error)
+            # Cumulative, as Prometheus histograms expect
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    entry["buckets"][i] += 1
+        if self.log_spans and logger.isEnabledFor(logging.INFO):
+            event = {"event": "span", "stage": stage, "duration_ms": round(duration * 1000, 3),
+                     "items": items, "tokens": tokens, "error": error}
+            event.update(labels)
+            logger.info(json.dumps(event, default=str))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Totals per stage"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": entry["count"],
+                    "seconds": entry["seconds"],
+                    "mean_ms": 1000 * entry["seconds"] / entry["count"],
+                    "max_ms": 1000 * entry["max_seconds"],
+                    "items": entry["items"],
+                    "tokens": entry["tokens"],
+                    "errors": entry["errors"]
+                }
+                for stage, entry in self._stages.items()
+            }
+
+    def to_prometheus(self) -> str:
+        """All stages in Prometheus text exposition format"""
+        name = f"{self.namespace}_stage"
+        lines = [
+            f"# HELP {name}_duration_seconds Time spent in each pipeline stage",
+            f"# TYPE {name}_duration_seconds histogram"
+        ]
+        with self._lock:
+            stages = sorted((stage, dict(entry, buckets=list(entry["buckets"]))) for stage, entry in self._stages.items())
+        for stage, entry in stages:
+            label = f'stage="{stage}"'
+            for bound, bucket_count in zip(self.buckets, entry["buckets"]):
+                lines.append(f'{name}_duration_seconds_bucket{{{label},le="{bound}"}} {bucket_count}')
+            lines.append(f'{name}_duration_seconds_bucket{{{label},le="+Inf"}} {entry["count"]}')
+            lines.append(f"{name}_duration_seconds_sum{{{label}}} {entry['seconds']}")
+            lines.append(f"{name}_duration_seconds_count{{{label}}} {entry['count']}")
+        for metric, help_text in (("items", "Items processed by each pipeline stage"),
+                                  ("tokens", "Estimated tokens processed by each pipeline stage"),
+                                  ("errors", "Failed occurrences of each pipeline stage")):
+            lines.append(f"# HELP {name}_{metric}_total {help_text}")
+            lines.append(f"# TYPE {name}_{metric}_total counter")
+            for stage, entry in stages:
+                lines.append(f'{name}_{metric}_total{{stage="{stage}"}} {entry[metric]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._stages.clear()
@@ -0,0 +1,212 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable
+from langchain_core.documents import Document
+from metadata_filters import to_sql
+
+# Emails, dotted names and codes like "CS-101" stay whole; their parts are indexed too
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._@+\-][a-z0-9]+)*")
+_PART_PATTERN = re.compile(r"[a-z0-9]+")
+_LETTER_DIGIT_PATTERN = re.compile(r"[a-z]+|[0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its of on or she "
+    "that the their there they this to was were which who will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms for BM25.
+
+    "jane.doe@uni.edu" yields the address plus "jane", "doe", "uni", "edu";
+    "CS101" and "CS-101" both also yield "cs" and "101".
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        terms.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) == 1:
+            parts = _LETTER_DIGIT_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part not in _STOPWORDS)
+    return terms
+
+class BM25Index:
+    """Persistent BM25 inverted index over chunks, kept in step with the vector store.
+
+    Postings (term, chunk, term frequency) and each chunk's length, text and
+    metadata live in SQLite. It is updated incrementally through
+    index_documents/remove_documents, so it can be registered as a document
+    listener on either vector store backend.
+    """
+
+    _LOOKUP_BATCH_SIZE = 500
+    # Filterable metadata stored in its own column
+    _FILTER_COLUMNS = ("source", "page", "chunk_index")
+
+    def __init__(self, db_path: str = "./lexical_index.sqlite", k1: float = 1.5, b: float = 0.75):
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "  chunk_id TEXT PRIMARY KEY, source TEXT, page INTEGER, chunk_index INTEGER,"
+            "  length INTEGER NOT NULL, content TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "  term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,"
+            "  PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);"
+            "CREATE INDEX IF NOT EXISTS documents_source ON documents (source, page, chunk_index);"
+        )
+        self._conn.commit()
+        # (document count, total length), recomputed after writes
+        self._totals = None
+        self.searches = 0
+
+    def index_documents(self, documents: List[Document]):
+        """Add chunks, replacing any already indexed under the same chunk ID"""
+        if not documents:
+            return
+        with self._lock:
+            self._delete([doc.metadata["chunk_id"] for doc in documents])
+            document_rows = []
+            posting_rows = []
+            for doc in documents:
+                chunk_id = doc.metadata["chunk_id"]
+                counts = Counter(tokenize(doc.page_content))
+                document_rows.append((
+                    chunk_id, doc.metadata.get("source"), doc.metadata.get("page"), doc.metadata.get("chunk_index"),
+                    sum(counts.values()), doc.page_content, json.dumps(doc.metadata)
+                ))
+                posting_rows.extend((term, chunk_id, tf) for term, tf in counts.items())
+            self._conn.executemany(
+                "INSERT INTO documents (chunk_id, source, page, chunk_index, length, content, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                document_rows
+            )
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+            self._conn.commit()
+            self._totals = None
+
+    def remove_documents(self, ids: List[str]):
+        """Remove chunks by ID"""
+        if not ids:
+            return
+        with self._lock:
+            self._delete(list(ids))
+            self._conn.commit()
+            self._totals = None
+
+    def _delete(self, ids: List[str]):
+        for start in range(0, len(ids), self._LOOKUP_BATCH_SIZE):
+            batch = ids[start:start + self._LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+            self._conn.execute(f"DELETE FROM documents WHERE chunk_id IN ({placeholders})", batch)
+
+    def rebuild(self, documents: Iterable[List[Document]]):
+        """Replace the index with every chunk from batches of documents, e.g. from VectorStore.iter_documents"""
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+            self._totals = None
+        for batch in documents:
+            self.index_documents(batch)
+
+    def count(self) -> int:
+        """Number of indexed chunks"""
+        with self._lock:
+            return self._get_totals()[0]
+
+    def _get_totals(self):
+        if self._totals is None:
+            count, total_length = self._conn.execute("SELECT COUNT(*), SUM(length) FROM documents").fetchone()
+            self._totals = (count, total_length or 0)
+        return self._totals
+
+    def search(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Top-k chunks by BM25 score, optionally restricted by metadata filters"""
+        terms = sorted(set(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            self.searches += 1
+            count, total_length = self._get_totals()
+            if count == 0:
+                return []
+            average_length = total_length / count
+            placeholders = ",".join("?" * len(terms))
+            document_frequencies = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+            clause, params = to_sql(filters, self._FILTER_COLUMNS)
+            postings = self._conn.execute(
+                "SELECT postings.term, postings.chunk_id, postings.tf, documents.length "
+                "FROM postings JOIN documents ON documents.chunk_id = postings.chunk_id "
+                f"WHERE postings.term IN ({placeholders}) AND {clause}",
+                terms + params
+            ).fetchall()
+
+            scores = {}
+            for term, chunk_id, tf, length in postings:
+                df = document_frequencies[term]
+                idf = math.log(1.0 + (count - df + 0.5) / (df + 0.5))
+                norm = tf + self.k1 * (1.0 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1.0) / norm
+            top = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+            if not top:
+                return []
+
+            placeholders = ",".join("?" * len(top))
+            stored = {
+                chunk_id: (content, metadata)
+                for chunk_id, content, metadata in self._conn.execute(
+                    f"SELECT chunk_id, content, metadata FROM documents WHERE chunk_id IN ({placeholders})",
+                    [chunk_id for chunk_id, _ in top]
+                )
+            }
+        return [
+            {"content": stored[chunk_id][0], "metadata": json.loads(stored[chunk_id][1]), "score": score}
+            for chunk_id, score in top
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index size and search count"""
+        with self._lock:
+            count, total_length = self._get_totals()
+            terms = self._conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {
+            "chunks": count,
+            "terms": terms,
+            "average_length": total_length / count if count else 0.0,
+            "searches": self.searches
+        }
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict[str, Any]]], k: int,
+                           rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked result lists by reciprocal rank fusion.
+
+    Each chunk scores sum(1 / (rrf_k + rank)) over the lists it appears in
+    (rank starting at 1). Results keep the fields of their first occurrence,
+    plus "fusion_score"; chunks found only lexically get distance None.
+    """
+    fused = {}
+    for results in ranked_lists:
+        for rank, result in enumerate(results, start=1):
+            chunk_id = result["metadata"]["chunk_id"]
+            if chunk_id not in fused:
+                fused[chunk_id] = dict(result, fusion_score=0.0)
+                fused[chunk_id].setdefault("distance", None)
+            fused[chunk_id]["fusion_score"] += 1.0 / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda result: -result["fusion_score"])[:k]
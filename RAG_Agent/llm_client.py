@@ -1,23 +1,45 @@
-from typing import List, Dict, Any
-from langchain_ollama import OllamaLLM
-from langchain.schema import HumanMessage
+from typing import List, Dict, Any, Optional, Sequence, Union
+from ollama_pool import get_pool
+
+# Prefix of the answer returned when generation fails
+GENERATION_ERROR_PREFIX = "Error generating response"
 
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "mistral"):
-        self.llm = OllamaLLM(
-            model=model,
+    """LLM client over one or more Ollama endpoints (a URL, a list or a comma-separated string).
+
+    Requests are balanced across endpoints by the shared OllamaPool, which
+    also keeps the model loaded on each server for keep_alive.
+    """
+    def __init__(self, base_url: Union[str, Sequence[str]] = "http://localhost:11434", model: str = "mistral",
+                 keep_alive: Optional[int] = 1800):
+        self.pool = get_pool(base_url, keep_alive)
+        self.model = model
+    
+    def _make_llm(self, base_url: str):
+        """Build the LLM client for one endpoint (created once per endpoint by the pool)"""
+        # Imported here: langchain_ollama takes over a second to import
+        from langchain_ollama import OllamaLLM
+        return OllamaLLM(
+            model=self.model,
             base_url=base_url,
             temperature=0.1,
             top_p=0.9,
-            num_predict=500
+            num_predict=500,
+            keep_alive=self.pool.keep_alive
         )
-        self.model = model
     
-    def generate_response(self, prompt: str, context: List[str]) -> str:
-        """Generate response using Ollama via LangChain"""
-        # Construct the full prompt with context
+    def load(self):
+        """Build the client for every endpoint now (no request is sent)"""
+        for endpoint in self.pool.endpoints:
+            self.pool.client(endpoint, f"llm:{self.model}", self._make_llm)
+    
+    def _invoke(self, prompt: str) -> str:
+        return self.pool.run(f"llm:{self.model}", self._make_llm, lambda llm: llm.invoke(prompt))
+    
+    def _build_prompt(self, prompt: str, context: List[str]) -> str:
+        """Construct the full prompt with context"""
         context_text = "\n\n".join(context)
-        full_prompt = f"""Based on the following context, answer the question. If the answer is not in the context, answer normally.
+        return f"""Based on the following context, answer the question. If the answer is not in the context, answer normally.
 
             Context:
             {context_text}
@@ -25,15 +47,37 @@ class OllamaClient:
             Question: {prompt}
 
             Answer:"""
+    
+    def generate_response(self, prompt: str, context: List[str]) -> str:
+        """Generate response using Ollama via LangChain"""
+        full_prompt = self._build_prompt(prompt, context)
+        
+        try:
+            response = self._invoke(full_prompt)
+            return response.strip()
+        except Exception as e:
+            return f"{GENERATION_ERROR_PREFIX}: {str(e)}"
+    
+    async def agenerate_response(self, prompt: str, context: List[str]) -> str:
+        """Generate response without blocking the event loop (async Ollama HTTP client)"""
+        full_prompt = self._build_prompt(prompt, context)
         
         try:
-            response = self.llm.invoke(full_prompt)
+            response = await self.pool.arun(f"llm:{self.model}", self._make_llm,
+                                            lambda llm: llm.ainvoke(full_prompt))
             return response.strip()
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            return f"{GENERATION_ERROR_PREFIX}: {str(e)}"
     
     def evaluate_answer(self, question: str, expected: str, actual: str) -> bool:
-        """Use LLM to evaluate if answers are equivalent"""
+        """Use LLM to evaluate if answers are equivalent (False if the judge call fails)"""
+        try:
+            return self.judge_answer(question, expected, actual)
+        except:
+            return False
+    
+    def judge_answer(self, question: str, expected: str, actual: str) -> bool:
+        """Like evaluate_answer, but a failed judge call raises instead of counting as NO"""
         eval_prompt = f"""You are an evaluation assistant. Compare two answers to the same question and determine if they convey the same information, even if worded differently.
 
             Question: {question}
@@ -44,9 +88,5 @@ class OllamaClient:
 
             Are these answers equivalent in meaning? Respond with only "YES" or "NO"."""
         
-        try:
-            response = self.llm.invoke(eval_prompt)
-            result = response.strip().upper()
-            return "YES" in result
-        except:
-            return False
\ No newline at end of file
+        response = self._invoke(eval_prompt)
+        return "YES" in response.strip().upper()
\ No newline at end of file
@@ -0,0 +1,81 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Operators accepted in filters, with their SQL equivalents (Chroma's where syntax)
+_SQL_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+_LIST_OPERATORS = {"$in": "IN", "$nin": "NOT IN"}
+_FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def validate_filters(filters: Optional[Dict[str, Any]]):
+    """Check a metadata filter such as {"source": "a.txt", "page": {"$gte": 2}}.
+
+    Every key is a metadata field; its value is either a literal (equality)
+    or a dict of operators. Conditions on several fields must all hold.
+    """
+    if not filters:
+        return
+    if not isinstance(filters, dict):
+        raise ValueError(f"Filters must be a dict of field conditions, got {type(filters).__name__}")
+    for field, condition in filters.items():
+        if not _FIELD_PATTERN.match(field):
+            raise ValueError(f"Invalid metadata field name in filter: {field!r}")
+        conditions = condition if isinstance(condition, dict) else {"$eq": condition}
+        if not conditions:
+            raise ValueError(f"Empty condition for metadata field {field!r}")
+        for operator, value in conditions.items():
+            if operator in _LIST_OPERATORS:
+                if not isinstance(value, (list, tuple)) or not value:
+                    raise ValueError(f"{operator} on {field!r} needs a non-empty list")
+            elif operator not in _SQL_OPERATORS:
+                raise ValueError(f"Unsupported filter operator {operator!r} on {field!r}")
+            elif value is None or isinstance(value, (dict, list, tuple)):
+                raise ValueError(f"{operator} on {field!r} needs a string, number or bool")
+
+def to_chroma_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Translate a filter into a Chroma where clause (one condition per clause)"""
+    validate_filters(filters)
+    if not filters:
+        return None
+    clauses = []
+    for field, condition in filters.items():
+        conditions = condition if isinstance(condition, dict) else {"$eq": condition}
+        for operator, value in conditions.items():
+            clauses.append({field: {operator: list(value) if operator in _LIST_OPERATORS else value}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def to_sql(filters: Optional[Dict[str, Any]], columns: Tuple[str, ...],
+           metadata_column: str = "metadata") -> Tuple[str, List[Any]]:
+    """Translate a filter into a SQL WHERE clause and its parameters.
+
+    Fields stored in their own columns are compared directly so their indexes
+    apply; other fields are read from the JSON metadata with json_extract,
+    which can use an expression index on the same path.
+    """
+    validate_filters(filters)
+    if not filters:
+        return "1", []
+    clauses = []
+    params = []
+    for field, condition in filters.items():
+        expression = field if field in columns else metadata_expression(field, metadata_column)
+        conditions = condition if isinstance(condition, dict) else {"$eq": condition}
+        for operator, value in conditions.items():
+            if operator in _LIST_OPERATORS:
+                placeholders = ",".join("?" * len(value))
+                clauses.append(f"{expression} {_LIST_OPERATORS[operator]} ({placeholders})")
+                params.extend(value)
+            else:
+                clauses.append(f"{expression} {_SQL_OPERATORS[operator]} ?")
+                params.append(value)
+    return " AND ".join(clauses), params
+
+def metadata_expression(field: str, metadata_column: str = "metadata") -> str:
+    """SQL expression reading one field of the JSON metadata column"""
+    if not _FIELD_PATTERN.match(field):
+        raise ValueError(f"Invalid metadata field name: {field!r}")
+    return f"json_extract({metadata_column}, '$.{field}')"
+
+def filter_key(filters: Optional[Dict[str, Any]]) -> str:
+    """Stable string for a filter, e.g. to scope cache entries"""
+    return json.dumps(filters or {}, sort_keys=True, default=str)
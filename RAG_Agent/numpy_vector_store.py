@@ -0,0 +1,619 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Iterator, List, Dict, Any, Optional, Set
+import numpy as np
+from langchain_core.documents import Document
+from quantization import get_codec
+from metadata_filters import to_sql, metadata_expression
+from instrumentation import progress
+
+class NumpyVectorStore:
+    """In-process vector store with the same interface as VectorStore.
+
+    Embeddings live in a memory-mapped float32 matrix (one row per chunk) and
+    chunk text/metadata in a small SQLite side table. Search is exact: one
+    matrix product against all live rows followed by argpartition for top-k.
+    Distances are squared L2, matching Chroma's default space. Deleted rows
+    are masked out; once more than compact_threshold of the rows are dead
+    (and at least _COMPACT_MIN_ROWS), compact() rewrites the array files
+    without them, so churn from re-ingestion doesn't grow the files without
+    bound. Searches hold the lock only to take a snapshot of the arrays, so
+    concurrent queries score in parallel.
+
+    With quantization set to "float16", "int8" or "binary", candidates are
+    found by scanning compact codes instead, and a shortlist of
+    k * rerank_factor rows (a per-codec default when None) is re-scored against the full-precision vectors,
+    which stay on disk and are only paged in for shortlisted rows. The codes
+    are stored in addition to the float32 matrix, so this shrinks what each
+    query scans (and memory), not disk use. With keep_full_precision=False
+    the float32 matrix is not stored at all (an existing one is encoded and
+    then deleted), cutting disk use too, and results are ranked on the codes
+    alone (not supported for binary codes).
+
+    Metadata filters are resolved in SQLite first (source/page/chunk_index
+    are indexed columns; other fields use expression indexes for the names in
+    index_fields). Selective filters score only the matching rows; broad
+    ones scan as usual with non-matching rows masked out.
+    """
+
+    # Rows added to the matrix files whenever they run out of space (grows geometrically)
+    _MIN_CAPACITY = 1024
+    _LOOKUP_BATCH_SIZE = 500
+    # Rows scored per step when scanning codes, bounding temporary float32 copies
+    _SCAN_BLOCK_ROWS = 65536
+    # Filters matching at most this many rows (and this fraction of the collection)
+    # score just those rows instead of scanning everything
+    _PREFILTER_MAX_ROWS = 16384
+    _PREFILTER_MAX_FRACTION = 0.1
+    # Metadata stored in its own indexed column rather than only in the JSON
+    _FILTER_COLUMNS = ("source", "page", "chunk_index", "content_hash")
+    # Dead rows needed before deletions trigger an automatic compact()
+    _COMPACT_MIN_ROWS = 1024
+
+    def __init__(self, db_path: str, collection_name: str, quantization: str = "none",
+                 rerank_factor: Optional[int] = None, keep_full_precision: bool = True,
+                 index_fields: Optional[List[str]] = None, compact_threshold: Optional[float] = 0.5,
+                 progress_output: Optional[Callable[[str], None]] = None):
+        self.progress = progress_output or progress
+        self.directory = os.path.join(db_path, collection_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.matrix_path = os.path.join(self.directory, "vectors.f32")
+        self.norms_path = os.path.join(self.directory, "norms.f32")
+        self.scales_path = os.path.join(self.directory, "scales.f32")
+        self.codec = get_codec(quantization)
+        self.quantization = self.codec.name if self.codec is not None else "none"
+        self.codes_path = os.path.join(self.directory, f"codes.{self.quantization}")
+        self.rerank_factor = rerank_factor or (self.codec.rerank_factor if self.codec is not None else 1)
+        self.keep_full_precision = keep_full_precision or self.codec is None
+        self.compact_threshold = compact_threshold
+        if self.codec is not None and self.codec.name == "binary" and not keep_full_precision:
+            raise ValueError("Binary codes need full-precision vectors for re-ranking")
+        self._lock = threading.RLock()
+        self._change_listeners = []
+        self._document_listeners = []
+
+        self._conn = sqlite3.connect(os.path.join(self.directory, "chunks.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "  row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, source TEXT, page INTEGER,"
+            "  chunk_index INTEGER, content_hash TEXT, document TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source, page, chunk_index);"
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value NOT NULL);"
+        )
+        for field in index_fields or []:
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS chunks_meta_{field} ON chunks ({metadata_expression(field)})"
+            )
+        self._conn.commit()
+        self.prefiltered_searches = 0
+        self.masked_searches = 0
+
+        info = dict(self._conn.execute("SELECT key, value FROM info").fetchall())
+        self._dimension = info.get("dimension")
+        self._rows = info.get("rows", 0)
+        self._capacity = info.get("capacity", 0)
+        self._matrix = None
+        self._norms = None
+        self._codes = None
+        self._scales = None
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        # Bumped whenever rows are renumbered, so searches scored on an old layout retry
+        self._layout = 0
+        if self._dimension is not None:
+            stored_full_precision = bool(info.get("full_precision", 1))
+            if self.keep_full_precision and not stored_full_precision:
+                raise ValueError("This collection was stored without full-precision vectors")
+            self._open_arrays()
+            if info.get("quantization", "none") != self.quantization and self.codec is not None:
+                if not stored_full_precision:
+                    raise ValueError("Cannot change quantization without full-precision vectors")
+                self._rebuild_codes()
+            if stored_full_precision and not self.keep_full_precision:
+                self._drop_full_precision()
+            for (row,) in self._conn.execute("SELECT row FROM chunks"):
+                self._alive[row] = True
+
+    def add_change_listener(self, callback: Callable[[], None]):
+        """Register a callback invoked whenever the collection's contents change"""
+        self._change_listeners.append(callback)
+
+    def add_document_listener(self, listener):
+        """Register an index kept in step with the collection.
+
+        listener.index_documents(documents) receives every added or updated
+        chunk and listener.remove_documents(ids) every deleted chunk ID.
+        """
+        self._document_listeners.append(listener)
+
+    def _notify_change(self):
+        for callback in self._change_listeners:
+            callback()
+
+    def _notify_indexed(self, documents: List[Document]):
+        for listener in self._document_listeners:
+            listener.index_documents(documents)
+
+    def _notify_removed(self, ids: List[str]):
+        for listener in self._document_listeners:
+            listener.remove_documents(ids)
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[List[Document]]:
+        """Yield every stored chunk, in batches"""
+        last_row = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT row, document, metadata FROM chunks WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [Document(page_content=document, metadata=json.loads(metadata)) for _, document, metadata in rows]
+            last_row = rows[-1][0]
+
+    def _array_files(self) -> List[tuple]:
+        """(attribute, path, dtype, row width) for every memory-mapped array in use"""
+        files = [("_norms", self.norms_path, np.float32, None)]
+        if self.keep_full_precision:
+            files.append(("_matrix", self.matrix_path, np.float32, self._dimension))
+        if self.codec is not None:
+            files.append(("_codes", self.codes_path, self.codec.dtype, self.codec.width(self._dimension)))
+            if self.codec.has_scales:
+                files.append(("_scales", self.scales_path, np.float32, None))
+        return files
+
+    def _open_arrays(self):
+        """Memory-map every array file at the current capacity, creating or growing files"""
+        for attribute, path, dtype, width in self._array_files():
+            shape = (self._capacity,) if width is None else (self._capacity, width)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < nbytes:
+                    f.truncate(nbytes)
+            setattr(self, attribute, np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+
+    def _stored_matrix(self) -> np.ndarray:
+        """The float32 vectors on disk, even when they are no longer kept"""
+        if self._matrix is not None:
+            return self._matrix
+        return np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(self._capacity, self._dimension))
+
+    def _rebuild_codes(self):
+        """Re-encode every stored vector, e.g. after switching quantization"""
+        matrix = self._stored_matrix()
+        for start in range(0, self._rows, self._SCAN_BLOCK_ROWS):
+            end = min(start + self._SCAN_BLOCK_ROWS, self._rows)
+            codes, scales = self.codec.encode(np.asarray(matrix[start:end]))
+            self._codes[start:end] = codes
+            if scales is not None:
+                self._scales[start:end] = scales
+        self._codes.flush()
+        self._save_info()
+        self._conn.commit()
+
+    def _drop_full_precision(self):
+        """Delete the float32 vectors of a collection now stored as codes only"""
+        if not os.path.exists(self.matrix_path):
+            return
+        if self._codes is not None:
+            self._codes.flush()
+        self._save_info()
+        self._conn.commit()
+        os.remove(self.matrix_path)
+        self.progress("Deleted full-precision vectors; the collection is now stored as codes only")
+
+    def _ensure_capacity(self, rows_needed: int):
+        """Grow the array files (and the in-memory mask) to hold rows_needed rows"""
+        if rows_needed <= self._capacity:
+            return
+        capacity = max(self._MIN_CAPACITY, self._capacity * 2)
+        while capacity < rows_needed:
+            capacity *= 2
+        self._flush()
+        # New, larger maps replace the old ones; searches still holding the old maps keep reading them
+        self._capacity = capacity
+        self._open_arrays()
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    def _flush(self):
+        for attribute, _, _, _ in self._array_files():
+            array = getattr(self, attribute)
+            if array is not None:
+                array.flush()
+
+    def _save_info(self):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+            [("dimension", self._dimension), ("rows", self._rows), ("capacity", self._capacity),
+             ("quantization", self.quantization), ("full_precision", int(self.keep_full_precision))]
+        )
+
+    def _lookup_rows(self, ids: List[str], columns: str = "id, row") -> List[tuple]:
+        """Fetch chunk rows for IDs, in batches below SQLite's parameter limit"""
+        rows = []
+        for start in range(0, len(ids), self._LOOKUP_BATCH_SIZE):
+            batch = ids[start:start + self._LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(self._conn.execute(
+                f"SELECT {columns} FROM chunks WHERE id IN ({placeholders})", batch
+            ).fetchall())
+        return rows
+
+    def get_existing_ids(self, ids: List[str]) -> Set[str]:
+        """Return the subset of chunk IDs already stored, in one lookup"""
+        with self._lock:
+            return {chunk_id for chunk_id, _ in self._lookup_rows(list(ids))}
+
+    def get_existing_hashes(self, ids: List[str]) -> Dict[str, Optional[str]]:
+        """Map each already stored chunk ID to its content hash, in one lookup"""
+        with self._lock:
+            return dict(self._lookup_rows(list(ids), "id, content_hash"))
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """Stored chunks by ID, in one lookup; IDs that are not stored are left out"""
+        with self._lock:
+            rows = self._lookup_rows(list(ids), "id, document, metadata")
+        return {
+            chunk_id: Document(page_content=document, metadata=json.loads(metadata))
+            for chunk_id, document, metadata in rows
+        }
+
+    def _write(self, documents: List[Document], embeddings: List[List[float]]):
+        """Write chunks, overwriting the rows of chunk IDs that are already stored"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self._dimension is None:
+            self._dimension = int(vectors.shape[1])
+        elif vectors.shape[1] != self._dimension:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self._dimension}"
+            )
+
+        ids = [doc.metadata["chunk_id"] for doc in documents]
+        if len(set(ids)) != len(ids):
+            duplicates = sorted({chunk_id for chunk_id in ids if ids.count(chunk_id) > 1})
+            raise ValueError(f"Duplicate chunk IDs in one write: {', '.join(duplicates[:5])}")
+        # Reusing the row keeps exactly one live row per ID
+        existing = dict(self._lookup_rows(ids))
+        new_count = sum(1 for chunk_id in ids if chunk_id not in existing)
+        self._ensure_capacity(self._rows + new_count)
+
+        rows = []
+        for chunk_id in ids:
+            if chunk_id in existing:
+                rows.append(existing[chunk_id])
+            else:
+                rows.append(self._rows)
+                self._rows += 1
+        rows = np.asarray(rows)
+        self._norms[rows] = np.einsum("ij,ij->i", vectors, vectors)
+        if self._matrix is not None:
+            self._matrix[rows] = vectors
+        if self.codec is not None:
+            codes, scales = self.codec.encode(vectors)
+            self._codes[rows] = codes
+            if scales is not None:
+                self._scales[rows] = scales
+        self._flush()
+        self._alive[rows] = True
+
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO chunks "
+            "(row, id, source, page, chunk_index, content_hash, document, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (int(row), doc.metadata["chunk_id"], doc.metadata.get("source"), doc.metadata.get("page"),
+                 doc.metadata.get("chunk_index"), doc.metadata.get("content_hash"),
+                 doc.page_content, json.dumps(doc.metadata))
+                for row, doc in zip(rows, documents)
+            ]
+        )
+        self._save_info()
+        self._conn.commit()
+
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]], check_existing: bool = True):
+        """Add documents to the vector store with incremental updates"""
+        with self._lock:
+            if check_existing:
+                existing_ids = self.get_existing_ids([doc.metadata["chunk_id"] for doc in documents])
+                pairs = [(doc, emb) for doc, emb in zip(documents, embeddings)
+                         if doc.metadata["chunk_id"] not in existing_ids]
+                documents = [doc for doc, _ in pairs]
+                embeddings = [emb for _, emb in pairs]
+            if not documents:
+                self.progress("No new chunks to add")
+                return
+            self._write(documents, embeddings)
+        self.progress(f"Added {len(documents)} new chunks to the database")
+        self._notify_indexed(documents)
+        self._notify_change()
+
+    def update_documents(self, documents: List[Document], embeddings: List[List[float]]):
+        """Overwrite stored chunks whose content has changed"""
+        if not documents:
+            return
+        with self._lock:
+            self._write(documents, embeddings)
+        self.progress(f"Updated {len(documents)} changed chunks in the database")
+        self._notify_indexed(documents)
+        self._notify_change()
+
+    def get_chunk_ids_from(self, source: str, page: int, first_chunk_index: int) -> List[str]:
+        """Get IDs of a source page's chunks at or beyond a chunk index"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM chunks WHERE source = ? AND page = ? AND chunk_index >= ?",
+                (source, page, first_chunk_index)
+            ).fetchall()
+        return [chunk_id for (chunk_id,) in rows]
+
+    def get_chunk_ids_after_page(self, source: str, last_page: int) -> List[str]:
+        """Get IDs of a source's chunks on pages after last_page"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM chunks WHERE source = ? AND page > ?", (source, last_page)
+            ).fetchall()
+        return [chunk_id for (chunk_id,) in rows]
+
+    def delete_documents(self, ids: List[str]):
+        """Delete chunks by ID"""
+        if not ids:
+            return
+        with self._lock:
+            rows = [row for _, row in self._lookup_rows(list(ids))]
+            self._alive[rows] = False
+            for start in range(0, len(ids), self._LOOKUP_BATCH_SIZE):
+                batch = list(ids)[start:start + self._LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self._conn.commit()
+            dead = self._rows - int(self._alive[:self._rows].sum())
+            if (self.compact_threshold is not None and dead >= self._COMPACT_MIN_ROWS
+                    and dead > self.compact_threshold * self._rows):
+                self.compact()
+        self.progress(f"Deleted {len(ids)} stale chunks from the database")
+        self._notify_removed(list(ids))
+        self._notify_change()
+
+    def compact(self) -> int:
+        """Rewrite the array files without deleted rows, renumbering the live ones.
+
+        Returns the number of rows reclaimed. Each file is written beside the
+        old one and swapped in, so searches already scoring keep reading the
+        old maps and rescore against the new layout before loading results.
+        """
+        with self._lock:
+            if self._dimension is None:
+                return 0
+            live = np.flatnonzero(self._alive[:self._rows])
+            reclaimed = self._rows - len(live)
+            if reclaimed == 0:
+                return 0
+            capacity = self._MIN_CAPACITY
+            while capacity < len(live):
+                capacity *= 2
+            self._flush()
+            for attribute, path, dtype, width in self._array_files():
+                old = getattr(self, attribute)
+                shape = (capacity,) if width is None else (capacity, width)
+                compacted = np.memmap(path + ".compact", dtype=dtype, mode="w+", shape=shape)
+                for start in range(0, len(live), self._SCAN_BLOCK_ROWS):
+                    block = live[start:start + self._SCAN_BLOCK_ROWS]
+                    compacted[start:start + len(block)] = old[block]
+                compacted.flush()
+                del compacted
+                os.replace(path + ".compact", path)
+            # Ascending order: each live row moves down to a row that is already free
+            self._conn.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?", [(i, int(row)) for i, row in enumerate(live) if i != row]
+            )
+            self._rows = len(live)
+            self._capacity = capacity
+            self._save_info()
+            self._conn.commit()
+            self._open_arrays()
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._alive[:self._rows] = True
+            self._layout += 1
+        self.progress(f"Compacted the vector files: reclaimed {reclaimed} deleted rows")
+        return reclaimed
+
+    def similarity_search(self, query_embedding: List[float], k: int = 5,
+                          filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search for similar documents, optionally restricted by metadata filters"""
+        return self.similarity_search_many([query_embedding], k=k, filters=filters)[0]
+
+    def similarity_search_many(self, query_embeddings: List[List[float]], k: int = 5,
+                               filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Top-k search for many queries at once, optionally restricted by metadata filters.
+
+        The lock is held only to take a snapshot of the arrays and resolve
+        filters, and again to load the results, so concurrent searches score
+        in parallel (NumPy releases the GIL in the matrix products).
+        """
+        if not query_embeddings:
+            return []
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        while True:
+            with self._lock:
+                if self._dimension is None or self._rows == 0:
+                    return [[] for _ in query_embeddings]
+                view = self._view()
+                candidates = None
+                if filters:
+                    candidates = self._filter_rows(filters)
+                    if len(candidates) > min(self._PREFILTER_MAX_ROWS, self._PREFILTER_MAX_FRACTION * view.rows):
+                        view.alive = np.zeros(view.rows, dtype=bool)
+                        view.alive[candidates] = True
+                        candidates = None
+                        self.masked_searches += 1
+                    else:
+                        self.prefiltered_searches += 1
+                else:
+                    # Copied so deletions during scoring don't change the mask under us
+                    view.alive = view.alive[:view.rows].copy()
+            top_rows = self._search_view(view, queries, k, candidates)
+            with self._lock:
+                # Rows are renumbered by compact(); score again against the new layout
+                if view.layout == self._layout:
+                    return [self._fetch_results(rows) for rows in top_rows]
+
+    def _view(self) -> "_ArrayView":
+        """The current arrays and row count (lock held); arrays are replaced, never resized in place"""
+        return _ArrayView(self._rows, self._alive, self._matrix, self._norms, self._codes, self._scales, self._layout)
+
+    def _search_view(self, view: "_ArrayView", queries: np.ndarray, k: int,
+                     candidates: Optional[np.ndarray]) -> List[List[tuple]]:
+        """Top-k (row, distance) pairs per query, computed without the lock"""
+        k = min(k, len(candidates) if candidates is not None else int(view.alive.sum()))
+        if k == 0:
+            return [[] for _ in queries]
+        if candidates is not None:
+            return self._score_rows(view, candidates, queries, k)
+        if self.codec is None:
+            return self._top_k(self._exact_distances(view, None, queries, view.alive), k)
+        shortlist = k * self.rerank_factor if view.matrix is not None else k
+        top_rows = self._scan_codes(view, queries, shortlist)
+        if view.matrix is not None:
+            top_rows = self._rerank(view, top_rows, queries, k)
+        return top_rows
+
+    def _filter_rows(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Rows whose metadata matches the filters, looked up through SQLite's indexes"""
+        clause, params = to_sql(filters, self._FILTER_COLUMNS)
+        rows = self._conn.execute(f"SELECT row FROM chunks WHERE {clause}", params).fetchall()
+        return np.array(sorted(row for (row,) in rows), dtype=np.int64)
+
+    def _score_rows(self, view: "_ArrayView", rows: np.ndarray, queries: np.ndarray, k: int) -> List[List[tuple]]:
+        """Top-k among a small set of rows, without touching any other row"""
+        if view.matrix is not None:
+            distances = self._exact_distances(view, rows, queries)
+        else:
+            scales = view.scales[rows] if view.scales is not None else None
+            distances = self.codec.approximate_distances(view.codes[rows], scales, view.norms[rows], queries)
+        return self._top_k(distances, k, rows=rows)
+
+    @staticmethod
+    def _exact_distances(view: "_ArrayView", rows: Optional[np.ndarray], queries: np.ndarray,
+                         allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """Squared L2 distances |x|^2 - 2 x.q + |q|^2 at full precision, shape (rows, queries).
+
+        rows=None scores every stored row with a single matrix product; rows
+        not set in allowed (default: the live rows) get an infinite distance.
+        """
+        selection = slice(0, view.rows) if rows is None else rows
+        allowed = view.alive if allowed is None else allowed
+        distances = view.norms[selection, None] - 2.0 * (view.matrix[selection] @ queries.T)
+        distances += np.einsum("ij,ij->i", queries, queries)[None, :]
+        distances[~allowed[selection]] = np.inf
+        return distances
+
+    @staticmethod
+    def _top_k(distances: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> List[List[tuple]]:
+        """Pick the k smallest distances per query column as (row, distance) pairs"""
+        top = []
+        for q in range(distances.shape[1]):
+            column = distances[:, q]
+            kk = min(k, len(column))
+            candidates = np.argpartition(column, kk - 1)[:kk]
+            candidates = candidates[np.argsort(column[candidates])]
+            top.append([
+                (int(rows[i] if rows is not None else i), float(max(column[i], 0.0)))
+                for i in candidates if np.isfinite(column[i])
+            ])
+        return top
+
+    def _scan_codes(self, view: "_ArrayView", queries: np.ndarray, shortlist: int) -> List[List[tuple]]:
+        """Find the best `shortlist` rows per query from the compact codes, block by block"""
+        best = [[] for _ in range(len(queries))]
+        for start in range(0, view.rows, self._SCAN_BLOCK_ROWS):
+            end = min(start + self._SCAN_BLOCK_ROWS, view.rows)
+            scales = view.scales[start:end] if view.scales is not None else None
+            distances = self.codec.approximate_distances(
+                view.codes[start:end], scales, view.norms[start:end], queries
+            )
+            distances[~view.alive[start:end]] = np.inf
+            block_top = self._top_k(distances, shortlist, rows=np.arange(start, end))
+            for q in range(len(queries)):
+                merged = sorted(best[q] + block_top[q], key=lambda pair: pair[1])
+                best[q] = merged[:shortlist]
+        return best
+
+    def _rerank(self, view: "_ArrayView", shortlists: List[List[tuple]], queries: np.ndarray,
+                k: int) -> List[List[tuple]]:
+        """Re-score shortlisted rows at full precision and keep the top k"""
+        reranked = []
+        for q, shortlist in enumerate(shortlists):
+            if not shortlist:
+                reranked.append([])
+                continue
+            rows = np.array([row for row, _ in shortlist])
+            distances = self._exact_distances(view, rows, queries[q:q + 1], view.alive)
+            reranked.append(self._top_k(distances, k, rows=rows)[0])
+        return reranked
+
+    def _fetch_results(self, rows_and_distances: List[tuple]) -> List[Dict[str, Any]]:
+        """Load text and metadata for result rows"""
+        if not rows_and_distances:
+            return []
+        rows = [row for row, _ in rows_and_distances]
+        placeholders = ",".join("?" * len(rows))
+        stored = {
+            row: (document, metadata)
+            for row, document, metadata in self._conn.execute(
+                f"SELECT row, document, metadata FROM chunks WHERE row IN ({placeholders})", rows
+            )
+        }
+        # A row deleted while the search was scoring is left out
+        return [
+            {
+                "content": stored[row][0],
+                "metadata": json.loads(stored[row][1]),
+                "distance": distance
+            }
+            for row, distance in rows_and_distances if row in stored
+        ]
+
+    def get_embedding_dimension(self) -> Optional[int]:
+        """Get the dimension of stored embeddings, or None if the collection is empty"""
+        return self._dimension
+
+    def get_collection_stats(self) -> Dict[str, Any]:
+        """Get statistics about the collection"""
+        with self._lock:
+            count = int(self._alive[:self._rows].sum())
+            index_bytes = 0
+            if self._dimension is not None:
+                # Bytes per row scanned at query time: codes (+ scale), or the float32 vector
+                if self.codec is not None:
+                    index_bytes = self.codec.width(self._dimension) * np.dtype(self.codec.dtype).itemsize
+                    index_bytes += 4 if self.codec.has_scales else 0
+                else:
+                    index_bytes = self._dimension * 4
+        disk_bytes = sum(
+            os.path.getsize(path) for _, path, _, _ in self._array_files() if os.path.exists(path)
+        ) if self._dimension is not None else 0
+        return {
+            "total_chunks": count,
+            "dead_rows": self._rows - count,
+            "quantization": self.quantization,
+            "index_bytes": index_bytes * self._rows,
+            "vector_disk_bytes": disk_bytes,
+            "prefiltered_searches": self.prefiltered_searches,
+            "masked_searches": self.masked_searches
+        }
+
+class _ArrayView:
+    """The arrays and row count a search scores against, taken under the store's lock"""
+    __slots__ = ("rows", "alive", "matrix", "norms", "codes", "scales", "layout")
+
+    def __init__(self, rows, alive, matrix, norms, codes, scales, layout):
+        self.rows = rows
+        self.alive = alive
+        self.matrix = matrix
+        self.norms = norms
+        self.codes = codes
+        self.scales = scales
+        self.layout = layout
@@ -0,0 +1,127 @@
+"""
+Deterministic stand-ins for the embedder and LLM, plus a synthetic corpus,
+so the pipeline can be exercised and timed without Ollama or model downloads.
+"""
+import asyncio
+import hashlib
+import time
+from typing import List, Tuple
+import numpy as np
+
+class HashEmbeddings:
+    """Embedder whose vectors are derived from a SHA-256 of the text.
+
+    The same text always maps to the same unit vector. delay seconds are
+    spent per call (plus per_text_delay per text) to mimic a real backend.
+    """
+    def __init__(self, dimension: int = 768, delay: float = 0.0, per_text_delay: float = 0.0):
+        self.dimension = dimension
+        self.delay = delay
+        self.per_text_delay = per_text_delay
+        self.model_name = f"hash-{dimension}"
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _wait(self, count: int):
+        seconds = self.delay + self.per_text_delay * count
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents"""
+        self.calls += 1
+        self.texts += len(texts)
+        self._wait(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query"""
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query without blocking the event loop"""
+        return await asyncio.to_thread(self.embed_query, text)
+
+class FakeLLMClient:
+    """Stand-in for OllamaClient that answers after a fixed delay.
+
+    The answer names the question and the number of context chunks, so
+    results stay deterministic.
+    """
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.judge_calls = 0
+        self.prompt_chars = 0
+
+    def _answer(self, prompt: str, context: List[str]) -> str:
+        self.calls += 1
+        self.prompt_chars += len(prompt) + sum(len(chunk) for chunk in context)
+        return f"Answer to '{prompt}' from {len(context)} chunks"
+
+    def generate_response(self, prompt: str, context: List[str]) -> str:
+        """Generate a canned response after the configured delay"""
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return self._answer(prompt, context)
+
+    async def agenerate_response(self, prompt: str, context: List[str]) -> str:
+        """Generate a canned response without blocking the event loop"""
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        return self._answer(prompt, context)
+
+    def evaluate_answer(self, question: str, expected: str, actual: str) -> bool:
+        """True if the expected answer appears in the actual one, ignoring case"""
+        return self.judge_answer(question, expected, actual)
+
+    def judge_answer(self, question: str, expected: str, actual: str) -> bool:
+        """Same as evaluate_answer; counts calls in judge_calls"""
+        self.judge_calls += 1
+        return expected.strip().lower() in actual.lower()
+
+_WORDS = (
+    "research student course faculty professor department lecture laboratory university campus "
+    "project paper journal conference algorithm network system data model analysis learning "
+    "theory design method result study program semester credit exam office schedule award "
+    "grant publication seminar thesis advisor engineering science mathematics physics chemistry"
+).split()
+_FIRST_NAMES = "alice bob carol david erin frank grace henry irene jacob karen liam".split()
+_LAST_NAMES = "zimmerman quint yates walker vance turner stone reed patel ortiz nguyen morgan".split()
+
+def generate_corpus(num_documents: int = 100, words_per_document: int = 2000,
+                    seed: int = 0) -> List[Tuple[str, str]]:
+    """Synthetic faculty-page-like documents as (text, source) pairs.
+
+    Sentences of 8-20 vocabulary words are mixed with names, emails and
+    course codes. The same arguments always produce the same corpus.
+    """
+    rng = np.random.default_rng(seed)
+    documents = []
+    for d in range(num_documents):
+        first = _FIRST_NAMES[d % len(_FIRST_NAMES)]
+        last = _LAST_NAMES[(d // len(_FIRST_NAMES)) % len(_LAST_NAMES)]
+        sentences = [f"Professor {first.title()} {last.title()} can be reached at {first}.{last}{d}@uni.edu."]
+        words = 0
+        while words < words_per_document:
+            length = int(rng.integers(8, 21))
+            sentence = " ".join(_WORDS[i] for i in rng.integers(0, len(_WORDS), size=length))
+            if rng.random() < 0.1:
+                sentence += f" in CS{int(rng.integers(100, 500))}"
+            sentences.append(sentence.capitalize() + ".")
+            words += length
+        paragraphs = [" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6)]
+        documents.append(("\n\n".join(paragraphs), f"faculty-{d}.html"))
+    return documents
+
+def random_unit_vectors(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """Unit-norm random vectors, for filling a vector store without embedding text"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
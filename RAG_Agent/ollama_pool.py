@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from resilient_embeddings import CircuitBreaker
+
+logger = logging.getLogger("rag.ollama")
+
+class NoHealthyEndpointError(Exception):
+    """Raised when every Ollama endpoint in a pool is failing"""
+    pass
+
+class OllamaEndpoint:
+    """One Ollama server: cached clients, in-flight count and a circuit breaker"""
+    def __init__(self, base_url: str, failure_threshold: int, recovery_timeout: float, health_timeout: float):
+        self.base_url = base_url
+        self.health_timeout = health_timeout
+        self.outstanding = 0
+        self.peak_outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.loaded_models = []
+        # Clients are created once per endpoint so their HTTP connections are reused
+        self._clients: Dict[str, Any] = {}
+        self._health_client = None
+        self.breaker = CircuitBreaker(
+            failure_threshold=failure_threshold,
+            recovery_timeout=recovery_timeout,
+            probe=self.check_health,
+            name=f"ollama@{base_url}"
+        )
+
+    def check_health(self) -> List[str]:
+        """Ask the server which models it has loaded; raises if it is unreachable"""
+        if self._health_client is None:
+            import ollama
+            self._health_client = ollama.Client(host=self.base_url, timeout=self.health_timeout)
+        running = self._health_client.ps()
+        self.loaded_models = [model.model for model in running.models]
+        return self.loaded_models
+
+class OllamaPool:
+    """Spreads Ollama requests over several endpoints.
+
+    Each request goes to the healthy endpoint with the fewest requests in
+    flight. An endpoint that keeps failing is skipped by its circuit breaker
+    until a background health check succeeds, and a failed request is
+    retried on each other healthy endpoint in turn. Clients built through the
+    pool carry keep_alive so servers keep the models loaded between queries.
+    """
+    def __init__(self, base_urls: Sequence[str], keep_alive: Optional[int] = 1800,
+                 failure_threshold: int = 3, recovery_timeout: float = 30.0, health_timeout: float = 5.0):
+        if not base_urls:
+            raise ValueError("OllamaPool needs at least one endpoint")
+        self.keep_alive = keep_alive
+        self.endpoints = [
+            OllamaEndpoint(url, failure_threshold, recovery_timeout, health_timeout) for url in base_urls
+        ]
+        self._lock = threading.Lock()
+        self._client_lock = threading.Lock()
+
+    def client(self, endpoint: OllamaEndpoint, name: str, factory: Callable[[str], Any]):
+        """The endpoint's client called name, built with factory(base_url) on first use"""
+        client = endpoint._clients.get(name)
+        if client is None:
+            with self._client_lock:
+                client = endpoint._clients.get(name)
+                if client is None:
+                    client = factory(endpoint.base_url)
+                    endpoint._clients[name] = client
+        return client
+
+    def _acquire(self, exclude: List[OllamaEndpoint]) -> Optional[OllamaEndpoint]:
+        """Reserve the healthy endpoint with the fewest outstanding requests"""
+        candidates = [e for e in self.endpoints if e not in exclude and e.breaker.allow_request()]
+        if not candidates:
+            return None
+        with self._lock:
+            endpoint = min(candidates, key=lambda e: (e.outstanding, e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            endpoint.peak_outstanding = max(endpoint.peak_outstanding, endpoint.outstanding)
+        return endpoint
+
+    def _release(self, endpoint: OllamaEndpoint, started: float, error: Optional[Exception]):
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.total_seconds += time.perf_counter() - started
+            if error is not None:
+                endpoint.failures += 1
+        if error is None:
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.record_failure(error)
+
+    def run(self, name: str, factory: Callable[[str], Any], call: Callable[[Any], Any]):
+        """Run call(client) on the least busy endpoint, failing over to the others"""
+        tried = []
+        last_error = None
+        while len(tried) < len(self.endpoints):
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            started = time.perf_counter()
+            try:
+                result = call(self.client(endpoint, name, factory))
+            except Exception as e:
+                self._release(endpoint, started, e)
+                logger.warning("Ollama request to %s failed: %s", endpoint.base_url, e)
+                last_error = e
+            else:
+                self._release(endpoint, started, None)
+                return result
+        raise last_error or NoHealthyEndpointError("No healthy Ollama endpoint available")
+
+    async def arun(self, name: str, factory: Callable[[str], Any], call: Callable[[Any], Awaitable[Any]]):
+        """Async version of run(); call(client) returns an awaitable"""
+        tried = []
+        last_error = None
+        while len(tried) < len(self.endpoints):
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            started = time.perf_counter()
+            try:
+                result = await call(self.client(endpoint, name, factory))
+            except Exception as e:
+                self._release(endpoint, started, e)
+                logger.warning("Ollama request to %s failed: %s", endpoint.base_url, e)
+                last_error = e
+            else:
+                self._release(endpoint, started, None)
+                return result
+        raise last_error or NoHealthyEndpointError("No healthy Ollama endpoint available")
+
+    def check_health(self) -> Dict[str, Dict[str, Any]]:
+        """Probe every endpoint now and report reachability and loaded models"""
+        report = {}
+        for endpoint in self.endpoints:
+            try:
+                models = endpoint.check_health()
+            except Exception as e:
+                endpoint.breaker.record_failure(e)
+                report[endpoint.base_url] = {"healthy": False, "error": str(e)}
+            else:
+                endpoint.breaker.record_success()
+                report[endpoint.base_url] = {"healthy": True, "loaded_models": models}
+        return report
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint queue depth, request counts and breaker state"""
+        with self._lock:
+            stats = [
+                {
+                    "base_url": e.base_url,
+                    "outstanding": e.outstanding,
+                    "peak_outstanding": e.peak_outstanding,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                    "average_seconds": e.total_seconds / e.requests if e.requests else 0.0,
+                    "loaded_models": list(e.loaded_models)
+                }
+                for e in self.endpoints
+            ]
+        for entry, endpoint in zip(stats, self.endpoints):
+            entry["breaker"] = endpoint.breaker.get_state()["state"]
+        return stats
+
+# Process-wide pools, keyed by (endpoints, keep_alive), so embedders and the LLM client share them
+_pools: Dict[Tuple[Tuple[str, ...], Any], OllamaPool] = {}
+_pools_lock = threading.Lock()
+
+def normalize_base_urls(base_urls: Union[str, Sequence[str]]) -> Tuple[str, ...]:
+    """Accept one URL, a comma-separated string of URLs or a list of URLs"""
+    if isinstance(base_urls, str):
+        base_urls = base_urls.split(",")
+    return tuple(url.strip().rstrip("/") for url in base_urls if url.strip())
+
+def get_pool(base_urls: Union[str, Sequence[str]], keep_alive: Optional[int] = 1800) -> OllamaPool:
+    """Return the shared pool for a set of endpoints"""
+    key = (normalize_base_urls(base_urls), keep_alive)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = OllamaPool(key[0], keep_alive=keep_alive)
+            _pools[key] = pool
+    return pool
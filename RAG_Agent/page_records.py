@@ -0,0 +1,129 @@
+"""
+Crawl output as JSON lines: one record per page, appended as each page is
+scraped, so memory does not grow with the crawl and a crash loses at most
+the page being written.
+
+Records are {"url", "markdown_content", "timestamp", "changed"} objects.
+Readers stream the file line by line; a truncated last line (from a crash
+mid-write) is skipped, and is cut off before the file is appended to again.
+Legacy JSON list files (the old faculty_data.json) can still be read.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger("rag.page_records")
+
+def _iter_lines(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(byte offset, record) for each complete, valid line"""
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            if not line.endswith(b"\n"):
+                logger.warning("Skipping truncated last record in %s", path)
+                break
+            try:
+                yield start, json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning("Skipping invalid record at byte %d of %s: %s", start, path, e)
+
+def _is_json_list(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(64).lstrip().startswith(b"[")
+
+def _end_of_last_line(path: str, size: int, block_size: int = 65536) -> int:
+    """Offset just past the last newline, scanning back from the end in blocks"""
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+def iter_page_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream the records of a crawl output file, one page at a time"""
+    if _is_json_list(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+    for _, record in _iter_lines(path):
+        yield record
+
+class PageRecordLog:
+    """Append-only JSON lines file of page records.
+
+    append() writes and flushes one line per page. On a resumed run,
+    urls() tells which pages are already written; lookup() reads back a
+    single record by URL without loading the rest of the file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._offsets: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return iter(())
+        return iter_page_records(self.path)
+
+    def urls(self) -> Set[str]:
+        """URLs that already have a complete record"""
+        return set(self._index())
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """The last record written for a URL, or None"""
+        offset = self._index().get(url)
+        if offset is None:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def _index(self) -> Dict[str, int]:
+        """Byte offset of the last record per URL (only offsets are kept in memory)"""
+        if self._offsets is None:
+            self._offsets = {}
+            if os.path.exists(self.path) and not _is_json_list(self.path):
+                for offset, record in _iter_lines(self.path):
+                    self._offsets[record["url"]] = offset
+        return self._offsets
+
+    def append(self, record: Dict[str, Any]):
+        """Write one record and flush it to disk"""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                self._open_for_append()
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if self._offsets is not None:
+                self._offsets[record["url"]] = offset
+
+    def _open_for_append(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        # Cut off a partial line left by a crash, so the next record starts on its own line
+        size = self._file.seek(0, os.SEEK_END)
+        end = _end_of_last_line(self.path, size)
+        if end < size:
+            self._file.truncate(end)
+            self._file.seek(end)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
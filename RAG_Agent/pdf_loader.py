@@ -0,0 +1,37 @@
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+def open_pdf(file: Union[str, BinaryIO]):
+    """PdfReader over a path or binary file object.
+
+    A path is opened as a file rather than handed to pypdf, which would read
+    the whole PDF into memory; the file stays open as long as the reader.
+    Pages are only parsed when accessed.
+    """
+    # Imported here: only PDF ingestion needs pypdf
+    from pypdf import PdfReader
+    if isinstance(file, str):
+        file = open(file, 'rb')
+    return PdfReader(file)
+
+def count_pdf_pages(file_path: str) -> int:
+    """Number of pages in a PDF"""
+    with open(file_path, 'rb') as f:
+        return len(open_pdf(f).pages)
+
+def iter_pdf_pages(file_path: str, start: int = 1, end: Optional[int] = None, reader=None) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for pages start..end (1-based, inclusive).
+
+    Pages are parsed one at a time as the iterator advances and pypdf's
+    cache of parsed objects is dropped after each one, so memory does not
+    grow with the number of pages. Pass reader to reuse an open PdfReader.
+    """
+    if reader is None:
+        with open(file_path, 'rb') as f:
+            yield from iter_pdf_pages(file_path, start, end, open_pdf(f))
+        return
+    last = min(end or len(reader.pages), len(reader.pages))
+    for number in range(start, last + 1):
+        text = reader.pages[number - 1].extract_text() or ""
+        # Fonts and content streams parsed for this page would otherwise stay cached
+        reader.resolved_objects.clear()
+        yield number, text
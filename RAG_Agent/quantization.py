@@ -0,0 +1,89 @@
+from typing import Optional, Tuple
+import numpy as np
+
+# Number of set bits in every byte value, for NumPy versions without bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Per-element count of set bits of a uint64 array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    return _POPCOUNT[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1)
+
+class Float16Codec:
+    """Half-precision copy of each vector (2x smaller than float32)"""
+    name = "float16"
+    dtype = np.float16
+    has_scales = False
+    rerank_factor = 2
+
+    def width(self, dimension: int) -> int:
+        return dimension
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        return vectors.astype(np.float16), None
+
+    def approximate_distances(self, codes: np.ndarray, scales: Optional[np.ndarray], norms: np.ndarray,
+                              queries: np.ndarray) -> np.ndarray:
+        """Approximate squared L2 distances, shape (rows, queries)"""
+        dots = codes.astype(np.float32) @ queries.T
+        return norms[:, None] - 2.0 * dots + np.einsum("ij,ij->i", queries, queries)[None, :]
+
+class Int8Codec:
+    """Symmetric int8 quantization with one float32 scale per vector (4x smaller)"""
+    name = "int8"
+    dtype = np.int8
+    has_scales = True
+    rerank_factor = 4
+
+    def width(self, dimension: int) -> int:
+        return dimension
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def approximate_distances(self, codes: np.ndarray, scales: Optional[np.ndarray], norms: np.ndarray,
+                              queries: np.ndarray) -> np.ndarray:
+        """Approximate squared L2 distances, shape (rows, queries)"""
+        dots = (codes.astype(np.float32) @ queries.T) * scales[:, None]
+        return norms[:, None] - 2.0 * dots + np.einsum("ij,ij->i", queries, queries)[None, :]
+
+class BinaryCodec:
+    """One sign bit per dimension (32x smaller); ranks by Hamming distance"""
+    name = "binary"
+    dtype = np.uint8
+    has_scales = False
+    # Hamming order is coarse, so the exact re-rank needs a much wider shortlist
+    rerank_factor = 10
+
+    def width(self, dimension: int) -> int:
+        # Padded to whole 64-bit words so codes can be compared a word at a time
+        return (dimension + 63) // 64 * 8
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        codes = np.packbits(vectors > 0, axis=1)
+        padding = self.width(vectors.shape[1]) - codes.shape[1]
+        return np.pad(codes, ((0, 0), (0, padding))), None
+
+    def approximate_distances(self, codes: np.ndarray, scales: Optional[np.ndarray], norms: np.ndarray,
+                              queries: np.ndarray) -> np.ndarray:
+        """Hamming distances between sign codes, shape (rows, queries)"""
+        words = np.ascontiguousarray(codes).view(np.uint64)
+        query_words = self.encode(queries)[0].view(np.uint64)
+        distances = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for q, query_code in enumerate(query_words):
+            distances[:, q] = _popcount(np.bitwise_xor(words, query_code)).sum(axis=1)
+        return distances
+
+CODECS = {codec.name: codec for codec in (Float16Codec(), Int8Codec(), BinaryCodec())}
+
+def get_codec(quantization: str):
+    """Return the codec for a quantization mode, or None for full precision"""
+    if quantization in (None, "none", "float32"):
+        return None
+    if quantization not in CODECS:
+        raise ValueError(f"Unknown quantization: {quantization} (expected none, {', '.join(CODECS)})")
+    return CODECS[quantization]
@@ -0,0 +1,109 @@
+"""
+Recall-vs-size report for quantized vector storage.
+
+Builds a NumpyVectorStore per quantization mode on a fixed, seeded fixture
+corpus of clustered embeddings and compares each mode's top-k against exact
+float32 search. Run: python quantization_report.py [--chunks 20000] [--output report.json]
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from typing import List, Dict, Any, Optional
+import numpy as np
+from langchain_core.documents import Document
+from numpy_vector_store import NumpyVectorStore
+
+MODES = ["none", "float16", "int8", "binary"]
+
+def make_fixture_corpus(num_chunks: int = 20000, dimension: int = 768, num_clusters: int = 200,
+                        num_queries: int = 200, seed: int = 42):
+    """Clustered unit-norm vectors that loosely mimic text embeddings, plus queries"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dimension)).astype(np.float32)
+    assignment = rng.integers(0, num_clusters, size=num_chunks)
+    vectors = centers[assignment] + 0.6 * rng.normal(size=(num_chunks, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_assignment = rng.integers(0, num_clusters, size=num_queries)
+    queries = centers[query_assignment] + 0.6 * rng.normal(size=(num_queries, dimension)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+def build_store(path: str, vectors: np.ndarray, quantization: str, rerank_factor: Optional[int],
+                keep_full_precision: bool = True) -> NumpyVectorStore:
+    store = NumpyVectorStore(path, "fixture", quantization=quantization, rerank_factor=rerank_factor,
+                             keep_full_precision=keep_full_precision)
+    batch_size = 5000
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        documents = [
+            Document(page_content=f"chunk {i}", metadata={
+                "source": "fixture", "page": 0, "chunk_index": i, "chunk_id": f"chunk-{i}", "content_hash": str(i)
+            })
+            for i in range(start, start + len(batch))
+        ]
+        store.add_documents(documents, batch, check_existing=False)
+    return store
+
+def search_ids(store: NumpyVectorStore, queries: np.ndarray, k: int) -> List[List[str]]:
+    results = store.similarity_search_many(queries.tolist(), k=k)
+    return [[result["metadata"]["chunk_id"] for result in hits] for hits in results]
+
+def recall(truth: List[List[str]], found: List[List[str]]) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / sum(len(t) for t in truth)
+
+def run_report(num_chunks: int, dimension: int, k: int, rerank_factor: Optional[int]) -> List[Dict[str, Any]]:
+    vectors, queries = make_fixture_corpus(num_chunks, dimension)
+    rows = []
+    truth = None
+    for mode in MODES:
+        variants = [(True, rerank_factor)]
+        if mode in ("float16", "int8"):
+            variants.append((False, 1))
+        for keep_full_precision, factor in variants:
+            path = tempfile.mkdtemp()
+            try:
+                store = build_store(path, vectors, mode, factor, keep_full_precision)
+                start = time.perf_counter()
+                found = search_ids(store, queries, k)
+                elapsed = time.perf_counter() - start
+                if truth is None:
+                    truth = found
+                stats = store.get_collection_stats()
+                rows.append({
+                    "quantization": mode,
+                    "rerank": keep_full_precision and mode != "none",
+                    "recall_at_k": recall(truth, found),
+                    "index_bytes_per_vector": stats["index_bytes"] / num_chunks,
+                    "index_compression": (dimension * 4) / (stats["index_bytes"] / num_chunks),
+                    "disk_bytes": stats["vector_disk_bytes"],
+                    "query_ms": 1000 * elapsed / len(queries)
+                })
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs size for quantized vector storage")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, help="Shortlist size as a multiple of k (default: per mode)")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    rows = run_report(args.chunks, args.dimension, args.k, args.rerank_factor)
+    print(f"\n{'mode':<10}{'rerank':<8}{'recall@' + str(args.k):<11}{'bytes/vec':<11}{'x smaller':<11}{'disk MB':<10}{'ms/query':<9}")
+    for row in rows:
+        print(f"{row['quantization']:<10}{str(row['rerank']):<8}{row['recall_at_k']:<11.3f}"
+              f"{row['index_bytes_per_vector']:<11.0f}{row['index_compression']:<11.1f}"
+              f"{row['disk_bytes'] / 1e6:<10.1f}{row['query_ms']:<9.2f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
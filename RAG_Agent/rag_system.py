@@ -1,107 +1,652 @@
-from typing import List, Dict, Any
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, TextIO, Tuple, Union
+from langchain_core.documents import Document
 from config import Config
-from document_processor import DocumentProcessor
-from vector_store import VectorStore
-from llm_client import OllamaClient
-from embeddings import LocalEmbeddings, OllamaEmbeddingsWrapper
+from document_processor import DocumentProcessor, RESERVED_METADATA_KEYS
+from pdf_loader import iter_pdf_pages
+from vector_backends import create_vector_store, lexical_index_path
+from llm_client import OllamaClient, GENERATION_ERROR_PREFIX
+from answer_cache import AnswerCache
+from metadata_filters import filter_key, validate_filters
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from context_packer import ContextPacker, estimate_tokens
+from instrumentation import Metrics, Progress
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from embedder_registry import get_embedder, warm_up
+from resilient_embeddings import CircuitBreaker, FallbackEmbeddings, EmbeddingDimensionError
+
+logger = logging.getLogger("rag.system")
+
+NO_RESULTS_ANSWER = "No relevant information found."
+EMBEDDING_UNAVAILABLE_ANSWER = "The embedding service is unavailable and the fallback model is incompatible with this collection."
 
 class RAGSystem:
-    def __init__(self):
-        self.config = Config()
-        self.document_processor = DocumentProcessor(
-            chunk_size=self.config.CHUNK_SIZE,
-            chunk_overlap=self.config.CHUNK_OVERLAP,
-            mode="spacy"
-        )
+    def __init__(self, config: Optional[Config] = None, embeddings=None, llm_client=None):
+        """Build the system from config (default: Config()).
+
+        embeddings and llm_client replace the configured embedder and Ollama
+        client, e.g. with the offline stand-ins used by the benchmarks.
+        """
+        self.config = config or Config()
+        # Progress messages of this instance, its vector store and the pipelines that use it
+        self.progress = Progress(self.config.PRINT_PROGRESS)
+        # Per-stage durations, item and token counts for ingestion and queries
+        self.metrics = Metrics(log_spans=self.config.METRICS_LOG_SPANS)
+        # Chunker, created on first ingestion (never in query-only mode)
+        self.query_only = self.config.QUERY_ONLY
+        self._document_processor = None
+        self._processor_lock = threading.Lock()
+        
+        self.vector_store = create_vector_store(self.config, self.progress)
+        
+        # BM25 index over chunk text, updated alongside every vector store write
+        self.lexical_index = None
+        if self.config.HYBRID_SEARCH_ENABLED:
+            self.lexical_index = BM25Index(lexical_index_path(self.config))
+            self.vector_store.add_document_listener(self.lexical_index)
+            # Out of step if it was missing, or the collection was changed without it
+            if self.lexical_index.count() != self.vector_store.get_collection_stats()["total_chunks"]:
+                self.progress("Building lexical index from the existing collection...")
+                self.lexical_index.rebuild(self.vector_store.iter_documents())
         
-        # Initialize embeddings based on config
-        if self.config.EMBEDDING_TYPE == "local":
-            self.embeddings = LocalEmbeddings(self.config.LOCAL_EMBEDDING_MODEL)
+        # Persistent embedding cache, shared by whichever backends are used
+        self.embedding_cache = None
+        if self.config.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                self.config.EMBEDDING_CACHE_PATH,
+                self.config.EMBEDDING_CACHE_MEMORY_SIZE
+            )
+        
+        # Initialize embeddings based on config; models come from the process-wide registry
+        if embeddings is not None:
+            self._primary_embeddings = embeddings
+            self.embeddings = self._with_cache(embeddings)
         elif self.config.EMBEDDING_TYPE == "ollama":
-            self.embeddings = OllamaEmbeddingsWrapper(
+            ollama_embeddings = self._primary_embeddings = get_embedder(
+                "ollama",
                 self.config.OLLAMA_EMBEDDING_MODEL,
-                self.config.OLLAMA_BASE_URL
+                self.config.OLLAMA_BASE_URLS,
+                self.config.OLLAMA_KEEP_ALIVE
+            )
+            breaker = CircuitBreaker(
+                failure_threshold=self.config.EMBEDDING_BREAKER_FAILURE_THRESHOLD,
+                recovery_timeout=self.config.EMBEDDING_BREAKER_RECOVERY_SECONDS,
+                # Probe the raw backend, not the cache, so a hit can't fake recovery
+                probe=lambda: ollama_embeddings.embed_query("health check"),
+                name="ollama-embeddings"
+            )
+            self.embeddings = FallbackEmbeddings(
+                self._with_cache(ollama_embeddings),
+                lambda: self._with_cache(get_embedder("local", self.config.LOCAL_EMBEDDING_MODEL)),
+                breaker,
+                dimension_provider=self.vector_store.get_embedding_dimension
             )
         else:  # Default to local
-            self.embeddings = LocalEmbeddings(self.config.LOCAL_EMBEDDING_MODEL)
+            self._primary_embeddings = get_embedder("local", self.config.LOCAL_EMBEDDING_MODEL)
+            self.embeddings = self._with_cache(self._primary_embeddings)
         
-        self.vector_store = VectorStore(
-            self.config.CHROMA_DB_PATH,
-            self.config.COLLECTION_NAME
-        )
-        self.llm_client = OllamaClient(
-            self.config.OLLAMA_BASE_URL,
-            self.config.OLLAMA_LLM_MODEL
+        if self.config.WARM_UP_EMBEDDERS:
+            warm_up([("local", self.config.LOCAL_EMBEDDING_MODEL, None)], background=True)
+        
+        self.llm_client = llm_client or OllamaClient(
+            self.config.OLLAMA_BASE_URLS,
+            self.config.OLLAMA_LLM_MODEL,
+            keep_alive=self.config.OLLAMA_KEEP_ALIVE
         )
+        
+        # Dedupes, diversifies and trims retrieved chunks to a prompt token budget
+        self.context_packer = None
+        if self.config.CONTEXT_PACKING_ENABLED:
+            self.context_packer = ContextPacker(
+                token_budget=self.config.CONTEXT_TOKEN_BUDGET,
+                mmr_lambda=self.config.CONTEXT_MMR_LAMBDA
+            )
+        self.context_stats = {"packed_queries": 0, "context_tokens": 0, "prompt_tokens_saved": 0}
+        
+        # Ingestion counters
+        self.ingest_stats = {"chunks_embedded": 0, "chunks_skipped": 0, "chunks_updated": 0, "chunks_deleted": 0}
+        
+        # (event loop, semaphores) used by aquery, created on first use
+        self._async_limits = None
+        
+        # Answer cache, cleared whenever the collection changes
+        self.answer_cache = None
+        if self.config.ANSWER_CACHE_ENABLED:
+            self.answer_cache = AnswerCache(
+                max_entries=self.config.ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=self.config.ANSWER_CACHE_TTL_SECONDS,
+                similarity_threshold=self.config.ANSWER_CACHE_SIMILARITY_THRESHOLD
+            )
+            self.vector_store.add_change_listener(self.answer_cache.invalidate)
+        
+        if self.config.WARM_UP_ON_START:
+            self.warm_up(background=True)
+    
+    @property
+    def document_processor(self) -> DocumentProcessor:
+        """The chunker, built on first use; unavailable in query-only mode"""
+        if self.query_only:
+            raise RuntimeError("Ingestion is disabled: this RAGSystem was started in query-only mode")
+        if self._document_processor is None:
+            with self._processor_lock:
+                if self._document_processor is None:
+                    self._document_processor = DocumentProcessor(
+                        chunk_size=self.config.CHUNK_SIZE,
+                        chunk_overlap=self.config.CHUNK_OVERLAP,
+                        mode="spacy",
+                        spacy_pipeline=self.config.SPACY_PIPELINE
+                    )
+        return self._document_processor
+    
+    def warm_up(self, background: bool = False) -> Optional[threading.Thread]:
+        """Load models and clients now rather than on the first request.
+
+        Covers the embedder, the LLM client and, unless query-only, the chunker.
+        With background=True this runs on a daemon thread, which is returned;
+        requests made meanwhile simply wait for whatever they need.
+        """
+        loaders = [getattr(self._primary_embeddings, "load", None), getattr(self.llm_client, "load", None)]
+        if not self.query_only:
+            loaders.append(lambda: self.document_processor.load())
+        
+        def load_all():
+            for load in loaders:
+                if load is None:
+                    continue
+                try:
+                    load()
+                except Exception as e:
+                    logger.warning("Error during warm-up: %s", e)
+        
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="rag-warm-up", daemon=True)
+        thread.start()
+        return thread
     
-    def add_text(self, text: str, source: str, page: int = 0):
-        """Add text to the RAG system"""
-        print(f"Processing text from {source}...")
+    def _with_cache(self, embeddings):
+        """Wrap an embedder with the persistent cache, if enabled"""
+        if self.embedding_cache is None:
+            return embeddings
+        return CachedEmbeddings(embeddings, self.embedding_cache)
+    
+    def add_text(self, text: Union[str, TextIO], source: str, page: int = 0,
+                 metadata: Optional[Dict[str, Any]] = None):
+        """Add text to the RAG system.
+
+        text may be a string or a readable text stream; streams are chunked
+        incrementally and embedded/stored batch by batch. Re-adding a source
+        only re-embeds chunks whose content changed and deletes chunks that
+        no longer exist. metadata (e.g. {"crawl_date": "2024-05-01"}) is
+        stored on every chunk and can be used in query filters; changing it
+        rewrites the chunks even if the text is the same.
+        """
+        reserved = RESERVED_METADATA_KEYS.intersection(metadata or {})
+        if reserved:
+            raise ValueError(f"metadata may not set {', '.join(sorted(reserved))}")
+        self.progress(f"Processing text from {source}...")
         
         # Create chunks
-        documents = self.document_processor.create_chunks(text, source, page)
-        print(f"Created {len(documents)} chunks")
+        if isinstance(text, str):
+            with self.metrics.span("ingest.chunk", source=source) as span:
+                documents = self.document_processor.create_chunks(text, source, page)
+                span.add(items=len(documents))
+        else:
+            # Streams are chunked lazily, so time the work as the chunks are pulled
+            documents = self.metrics.timed_iter(
+                self.document_processor.iter_chunks(text, source, page), "ingest.chunk", source=source
+            )
         
-        # Generate embeddings
-        texts = [doc.page_content for doc in documents]
-        try:
+        total = 0
+        batch = []
+        for doc in documents:
+            if metadata:
+                self.document_processor.add_metadata(doc, metadata)
+            batch.append(doc)
+            if len(batch) >= self.config.INGEST_EMBED_BATCH_SIZE:
+                self._add_chunk_batch(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self._add_chunk_batch(batch)
+            total += len(batch)
+        
+        # Remove chunks that no longer exist in this version of the text
+        self._delete_stale_chunks([(source, page, total)])
+        self.progress(f"Processed {total} chunks")
+    
+    def add_file(self, file_path: str, source: Optional[str] = None, page: int = 0,
+                 metadata: Optional[Dict[str, Any]] = None):
+        """Stream a text file into the RAG system"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            self.add_text(f, source or os.path.basename(file_path), page, metadata)
+    
+    def add_pdf(self, file_path: str, source: Optional[str] = None,
+                metadata: Optional[Dict[str, Any]] = None):
+        """Add a PDF page by page, passing each page's 1-based number to add_text.
+
+        Pages are extracted one at a time, so memory stays bounded on large
+        PDFs. For many PDFs use IngestionPipeline.run_pdfs, which spreads pages
+        over worker processes.
+        """
+        source = source or os.path.basename(file_path)
+        pages = 0
+        for page, text in iter_pdf_pages(file_path):
+            self.add_text(text, source, page, metadata)
+            pages += 1
+        # The PDF may have lost pages since it was last added
+        self._delete_pages_after(source, pages)
+        self.progress(f"Processed {pages} pages from {source}")
+    
+    def _add_chunk_batch(self, documents: List[Document]):
+        """Embed and store a batch of chunks, skipping those already stored unchanged"""
+        new_documents, changed_documents, unchanged = self._partition_chunks(documents)
+        self.ingest_stats["chunks_skipped"] += unchanged
+        if unchanged:
+            self.progress(f"Skipped {unchanged} unchanged chunks already in the database")
+        to_embed = new_documents + changed_documents
+        if not to_embed:
+            self.progress("No new chunks to add")
+            return
+        
+        # Generate embeddings (falls back to the local model if Ollama is down)
+        texts = [doc.page_content for doc in to_embed]
+        with self.metrics.span("ingest.embed", items=len(texts),
+                               tokens=sum(estimate_tokens(text) for text in texts)):
             embeddings = self.embeddings.embed_documents(texts)
-            print("Generated embeddings")
-        except Exception as e:
-            print(f"Error generating embeddings: {e}")
-            print("Falling back to local embeddings...")
-            # Fallback to local embeddings
-            local_embeddings = LocalEmbeddings()
-            embeddings = local_embeddings.embed_documents(texts)
+        self.progress("Generated embeddings")
+        self.ingest_stats["chunks_embedded"] += len(to_embed)
+        self.ingest_stats["chunks_updated"] += len(changed_documents)
         
         # Add to vector store
-        self.vector_store.add_documents(documents, embeddings)
-        print("Added documents to vector store")
+        # (existence was already checked above)
+        with self.metrics.span("ingest.write", items=len(to_embed)):
+            if new_documents:
+                self.vector_store.add_documents(new_documents, embeddings[:len(new_documents)], check_existing=False)
+            self.vector_store.update_documents(changed_documents, embeddings[len(new_documents):])
+        self.progress("Added documents to vector store")
+    
+    def _partition_chunks(self, documents: List[Document]) -> Tuple[List[Document], List[Document], int]:
+        """Split chunks into new and changed ones, counting unchanged ones.
+
+        One bulk lookup fetches the stored content hash of every chunk ID.
+        """
+        with self.metrics.span("ingest.existence_check", items=len(documents)):
+            stored_hashes = self.vector_store.get_existing_hashes(
+                [doc.metadata["chunk_id"] for doc in documents]
+            )
+        new_documents = []
+        changed_documents = []
+        for doc in documents:
+            chunk_id = doc.metadata["chunk_id"]
+            if chunk_id not in stored_hashes:
+                new_documents.append(doc)
+            elif stored_hashes[chunk_id] != doc.metadata["content_hash"]:
+                changed_documents.append(doc)
+        unchanged = len(documents) - len(new_documents) - len(changed_documents)
+        return new_documents, changed_documents, unchanged
     
-    def query(self, question: str) -> Dict[str, Any]:
-        """Query the RAG system"""
-        print(f"Processing query: {question}")
+    def _delete_stale_chunks(self, chunk_counts: List[Tuple[str, int, int]]) -> int:
+        """Delete chunks left over from longer previous versions of source pages.
+
+        chunk_counts holds (source, page, number of chunks now). Chunk indices are
+        contiguous, so a page has stale chunks only if the chunk right after its
+        new last one still exists; that is checked for all pages in one lookup.
+        """
+        if not chunk_counts:
+            return 0
+        next_ids = [
+            self.document_processor._generate_chunk_id(source, page, count)
+            for source, page, count in chunk_counts
+        ]
+        with self.metrics.span("ingest.delete_stale") as span:
+            existing_ids = self.vector_store.get_existing_ids(next_ids)
+            stale_ids = []
+            for (source, page, count), next_id in zip(chunk_counts, next_ids):
+                if next_id in existing_ids:
+                    stale_ids.extend(self.vector_store.get_chunk_ids_from(source, page, count))
+            self.vector_store.delete_documents(stale_ids)
+            span.add(items=len(stale_ids))
+        self.ingest_stats["chunks_deleted"] += len(stale_ids)
+        return len(stale_ids)
+    
+    def _delete_pages_after(self, source: str, last_page: int) -> int:
+        """Delete a source's chunks from pages after last_page"""
+        with self.metrics.span("ingest.delete_stale") as span:
+            stale_ids = self.vector_store.get_chunk_ids_after_page(source, last_page)
+            self.vector_store.delete_documents(stale_ids)
+            span.add(items=len(stale_ids))
+        self.ingest_stats["chunks_deleted"] += len(stale_ids)
+        return len(stale_ids)
+    
+    def query(self, question: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Query the RAG system.
+
+        filters restrict retrieval to chunks whose metadata matches, e.g.
+        {"source": "rules.txt", "page": {"$gte": 2, "$lte": 5}}; they are
+        applied inside the vector search, so all k chunks match.
+        """
+        self.progress(f"Processing query: {question}")
+        start = time.perf_counter()
+        validate_filters(filters)
+        
+        cached = self._cached_answer(question, filters=filters)
+        if cached is not None:
+            return cached
+        generation = self._answer_cache_generation()
         
         try:
-            # Generate query embedding
-            query_embedding = self.embeddings.embed_query(question)
-        except Exception as e:
-            print(f"Error generating query embedding: {e}")
-            # Fallback to local embeddings
-            local_embeddings = LocalEmbeddings()
-            query_embedding = local_embeddings.embed_query(question)
+            # Generate query embedding (falls back to the local model if Ollama is down)
+            with self.metrics.span("query.embed", items=1, tokens=estimate_tokens(question)):
+                query_embedding = self.embeddings.embed_query(question)
+        except EmbeddingDimensionError as e:
+            logger.error("Error generating query embedding: %s", e)
+            return self._empty_result(question, EMBEDDING_UNAVAILABLE_ANSWER)
+        
+        cached = self._cached_answer(question, query_embedding, filters)
+        if cached is not None:
+            return cached
         
         # Retrieve relevant chunks
-        results = self.vector_store.similarity_search(
-            query_embedding, 
-            k=self.config.TOP_K_CHUNKS
-        )
+        with self.metrics.span("query.retrieve") as span:
+            results = self._retrieve(question, query_embedding, filters)
+            span.add(items=len(results))
         
         if not results:
-            return {
-                "question": question,
-                "answer": "No relevant information found.",
-                "sources": [],
-                "context_chunks": []
-            }
+            return self._empty_result(question, NO_RESULTS_ANSWER)
         
         # Extract context
-        context_chunks = [result["content"] for result in results]
+        results, packing, context_chunks = self._build_context(question, results)
         
         # Generate response
-        answer = self.llm_client.generate_response(question, context_chunks)
+        with self.metrics.span("query.generate", items=1) as span:
+            answer = self.llm_client.generate_response(question, context_chunks)
+            span.add(tokens=estimate_tokens(answer))
+        
+        result = self._build_result(question, answer, results, packing)
+        self._remember_answer(question, query_embedding, result, time.perf_counter() - start, filters, generation)
+        return result
+    
+    async def aquery(self, question: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Query the RAG system without blocking the event loop.
+
+        Embedding and generation use the async Ollama client, Chroma calls run in
+        worker threads, and each backend is limited to a configured number of
+        concurrent requests so many questions can share one process. filters
+        work as in query().
+        """
+        self.progress(f"Processing query: {question}")
+        start = time.perf_counter()
+        validate_filters(filters)
+        limits = self._get_async_limits()
+        
+        cached = self._cached_answer(question, filters=filters)
+        if cached is not None:
+            return cached
+        generation = self._answer_cache_generation()
+        
+        try:
+            async with limits["embed"]:
+                with self.metrics.span("query.embed", items=1, tokens=estimate_tokens(question)):
+                    query_embedding = await self.embeddings.aembed_query(question)
+        except EmbeddingDimensionError as e:
+            logger.error("Error generating query embedding: %s", e)
+            return self._empty_result(question, EMBEDDING_UNAVAILABLE_ANSWER)
+        
+        cached = self._cached_answer(question, query_embedding, filters)
+        if cached is not None:
+            return cached
+        
+        async with limits["retrieval"]:
+            with self.metrics.span("query.retrieve") as span:
+                results = await asyncio.to_thread(self._retrieve, question, query_embedding, filters)
+                span.add(items=len(results))
+        
+        if not results:
+            return self._empty_result(question, NO_RESULTS_ANSWER)
+        
+        results, packing, context_chunks = self._build_context(question, results)
+        async with limits["llm"]:
+            with self.metrics.span("query.generate", items=1) as span:
+                answer = await self.llm_client.agenerate_response(question, context_chunks)
+                span.add(tokens=estimate_tokens(answer))
+        
+        result = self._build_result(question, answer, results, packing)
+        self._remember_answer(question, query_embedding, result, time.perf_counter() - start, filters, generation)
+        return result
+    
+    def query_many(self, questions: List[str], max_concurrency: Optional[int] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Answer many questions with batched embedding and retrieval.
+
+        All questions are embedded in one batch and retrieved with one
+        collection.query call; answers are then generated with at most
+        max_concurrency LLM calls in flight. Results are in input order.
+        filters, as in query(), apply to every question.
+        """
+        if not questions:
+            return []
+        self.progress(f"Processing {len(questions)} queries")
+        validate_filters(filters)
+        
+        try:
+            with self.metrics.span("query.embed", items=len(questions),
+                                   tokens=sum(estimate_tokens(question) for question in questions)):
+                query_embeddings = self.embeddings.embed_documents(questions)
+        except EmbeddingDimensionError as e:
+            logger.error("Error generating query embeddings: %s", e)
+            return [self._empty_result(question, EMBEDDING_UNAVAILABLE_ANSWER) for question in questions]
+        
+        # Serve what we can from the answer cache; only the rest is retrieved and generated
+        generation = self._answer_cache_generation()
+        results_in_order = [self._cached_answer(question, filters=filters) or
+                            self._cached_answer(question, embedding, filters)
+                            for question, embedding in zip(questions, query_embeddings)]
+        pending = [i for i, result in enumerate(results_in_order) if result is None]
+        if not pending:
+            return results_in_order
+        
+        with self.metrics.span("query.retrieve") as span:
+            all_results = self.vector_store.similarity_search_many(
+                [query_embeddings[i] for i in pending],
+                k=self._candidate_count(),
+                filters=filters
+            )
+            all_results = [self._fuse(questions[i], results, filters) for i, results in zip(pending, all_results)]
+            span.add(items=sum(len(results) for results in all_results))
+        packed_results = [
+            self._build_context(questions[i], results) if results else (results, None, [])
+            for i, results in zip(pending, all_results)
+        ]
         
+        def answer(item):
+            i, (results, packing, context_chunks) = item
+            question = questions[i]
+            if not results:
+                return self._empty_result(question, NO_RESULTS_ANSWER)
+            start = time.perf_counter()
+            with self.metrics.span("query.generate", items=1) as span:
+                response = self.llm_client.generate_response(question, context_chunks)
+                span.add(tokens=estimate_tokens(response))
+            result = self._build_result(question, response, results, packing)
+            self._remember_answer(question, query_embeddings[i], result, time.perf_counter() - start, filters,
+                                  generation)
+            return result
+        
+        max_workers = max_concurrency or self.config.QUERY_MANY_CONCURRENCY
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields results in input order
+            for i, result in zip(pending, executor.map(answer, zip(pending, packed_results))):
+                results_in_order[i] = result
+        return results_in_order
+    
+    def _retrieve(self, question: str, query_embedding: List[float],
+                  filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Retrieve context chunks for a question, hybrid when the lexical index is enabled"""
+        results = self.vector_store.similarity_search(query_embedding, k=self._candidate_count(), filters=filters)
+        return self._fuse(question, results, filters)
+    
+    def _candidate_count(self) -> int:
+        """Vector hits to retrieve per question: extra candidates for fusion in hybrid mode"""
+        if self.lexical_index is None:
+            return self.config.TOP_K_CHUNKS
+        return max(self.config.HYBRID_CANDIDATES, self.config.TOP_K_CHUNKS)
+    
+    def _fuse(self, question: str, vector_results: List[Dict[str, Any]],
+              filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Fuse vector hits with BM25 hits by reciprocal rank fusion and keep the top k"""
+        if self.lexical_index is None:
+            return vector_results[:self.config.TOP_K_CHUNKS]
+        lexical_results = self.lexical_index.search(question, k=self._candidate_count(), filters=filters)
+        lexical_results = self._check_lexical_hits(lexical_results, vector_results)
+        return reciprocal_rank_fusion(
+            [vector_results, lexical_results], k=self.config.TOP_K_CHUNKS, rrf_k=self.config.RRF_K
+        )
+    
+    def _check_lexical_hits(self, lexical_results: List[Dict[str, Any]],
+                            vector_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop lexical hits that no longer match the stored chunk, and re-index those chunks.
+
+        The BM25 index can lag the collection (e.g. text re-ingested while hybrid
+        search was off), so hits not also found by vector search are checked
+        against the store in one lookup. A chunk that is gone is removed from the
+        index; one whose content hash differs is re-indexed and left out of this
+        query, since its old text is what matched.
+        """
+        found = {result["metadata"]["chunk_id"] for result in vector_results}
+        ids = [result["metadata"]["chunk_id"] for result in lexical_results
+               if result["metadata"]["chunk_id"] not in found]
+        if not ids:
+            return lexical_results
+        stored = self.vector_store.get_documents(ids)
+        missing = []
+        changed = []
+        current = []
+        for result in lexical_results:
+            chunk_id = result["metadata"]["chunk_id"]
+            if chunk_id in found:
+                current.append(result)
+            elif chunk_id not in stored:
+                missing.append(chunk_id)
+            elif stored[chunk_id].metadata.get("content_hash") != result["metadata"].get("content_hash"):
+                changed.append(stored[chunk_id])
+            else:
+                current.append(result)
+        if missing:
+            self.lexical_index.remove_documents(missing)
+        if changed:
+            self.lexical_index.index_documents(changed)
+        return current
+    
+    def _build_context(self, question: str, results: List[Dict[str, Any]]):
+        """Pack retrieved chunks and extract the context passed to the LLM"""
+        with self.metrics.span("query.prompt_build", items=len(results)) as span:
+            results, packing = self._pack_context(results)
+            context_chunks = [result["content"] for result in results]
+            span.add(tokens=estimate_tokens(question) + sum(estimate_tokens(chunk) for chunk in context_chunks))
+        return results, packing, context_chunks
+    
+    def _pack_context(self, results: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, int]]]:
+        """Pack retrieved chunks into the prompt budget, counting tokens saved"""
+        if self.context_packer is None:
+            return results, None
+        packed, packing = self.context_packer.pack(results)
+        self.context_stats["packed_queries"] += 1
+        self.context_stats["context_tokens"] += packing["context_tokens"]
+        self.context_stats["prompt_tokens_saved"] += packing["prompt_tokens_saved"]
+        self.progress(f"Packed context: {packing['context_tokens']} tokens, {packing['prompt_tokens_saved']} saved")
+        return packed, packing
+    
+    def _cached_answer(self, question: str, query_embedding: Optional[List[float]] = None,
+                       filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Look up the answer cache by exact text, or by similarity once the embedding is known"""
+        if self.answer_cache is None:
+            return None
+        if query_embedding is None:
+            cached = self.answer_cache.get_exact(question, filter_key(filters))
+        else:
+            cached = self.answer_cache.get_similar(question, query_embedding, filter_key(filters))
+        if cached is not None:
+            self.progress(f"Answered from cache ({cached['cached']} match)")
+        return cached
+    
+    def _answer_cache_generation(self) -> Optional[int]:
+        """The answer cache's generation, read before retrieval so stale answers are not stored"""
+        return self.answer_cache.generation if self.answer_cache is not None else None
+    
+    def _remember_answer(self, question: str, query_embedding: List[float], result: Dict[str, Any], latency: float,
+                         filters: Optional[Dict[str, Any]] = None, generation: Optional[int] = None):
+        """Store a generated answer in the answer cache, scoped to the filters used"""
+        if self.answer_cache is None or result["answer"].startswith(GENERATION_ERROR_PREFIX):
+            return
+        self.answer_cache.put(question, query_embedding, result, latency, filter_key(filters), generation)
+    
+    def _get_async_limits(self) -> Dict[str, asyncio.Semaphore]:
+        """Per-backend concurrency limits for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_limits is None or self._async_limits[0] is not loop:
+            self._async_limits = (loop, {
+                "embed": asyncio.Semaphore(self.config.ASYNC_EMBED_CONCURRENCY),
+                "retrieval": asyncio.Semaphore(self.config.ASYNC_RETRIEVAL_CONCURRENCY),
+                "llm": asyncio.Semaphore(self.config.ASYNC_LLM_CONCURRENCY)
+            })
+        return self._async_limits[1]
+    
+    def _empty_result(self, question: str, answer: str) -> Dict[str, Any]:
+        """Result for a query that could not be answered from the collection"""
+        return {
+            "question": question,
+            "answer": answer,
+            "sources": [],
+            "context_chunks": []
+        }
+    
+    def _build_result(self, question: str, answer: str, results: List[Dict[str, Any]],
+                      packing: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Assemble the query result from the answer and retrieved chunks"""
         # Extract sources
         sources = list(set([result["metadata"]["source"] for result in results]))
         
-        return {
+        result = {
             "question": question,
             "answer": answer,
             "sources": sources,
-            "context_chunks": context_chunks,
-            "similarity_scores": [result["distance"] for result in results]
+            "context_chunks": [result["content"] for result in results],
+            # Vector distances only: chunks found only by BM25 have none
+            "similarity_scores": [result["distance"] for result in results if result.get("distance") is not None]
         }
+        if self.lexical_index is not None:
+            result["fusion_scores"] = [chunk.get("fusion_score", 0.0) for chunk in results]
+        if packing is not None:
+            result["context_tokens"] = packing["context_tokens"]
+            result["prompt_tokens_saved"] = packing["prompt_tokens_saved"]
+        return result
+    
+    def export_metrics(self) -> str:
+        """Per-stage metrics in Prometheus text format"""
+        return self.metrics.to_prometheus()
     
     def get_stats(self) -> Dict[str, Any]:
         """Get system statistics"""
-        return self.vector_store.get_collection_stats()
\ No newline at end of file
+        stats = self.vector_store.get_collection_stats()
+        stats.update(self.ingest_stats)
+        if self.context_packer is not None:
+            stats["context_packing"] = dict(self.context_stats)
+        if self.embedding_cache is not None:
+            stats["embedding_cache"] = self.embedding_cache.get_stats()
+        if self.answer_cache is not None:
+            stats["answer_cache"] = self.answer_cache.get_stats()
+        if self.lexical_index is not None:
+            stats["lexical_index"] = self.lexical_index.get_stats()
+        if isinstance(self.embeddings, FallbackEmbeddings):
+            stats["embedding_breaker"] = self.embeddings.get_stats()
+        if isinstance(self.llm_client, OllamaClient):
+            stats["ollama_endpoints"] = self.llm_client.pool.get_stats()
+        stats["stages"] = self.metrics.snapshot()
+        return stats
\ No newline at end of file
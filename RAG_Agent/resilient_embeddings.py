@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("rag.embeddings")
+
+class EmbeddingDimensionError(Exception):
+    """Raised when an embedder's vectors don't match the collection's dimension"""
+    pass
+
+class CircuitBreaker:
+    """Tracks failures of a backend and stops calling it while it is down.
+
+    After failure_threshold consecutive failures the breaker opens and callers
+    should route elsewhere. Once recovery_timeout seconds have passed, a probe
+    runs in a background thread; if it succeeds the breaker closes again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self, failure_threshold: int = 3, recovery_timeout: float = 30.0,
+                 probe: Optional[Callable[[], Any]] = None, name: str = "backend"):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe = probe
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._total_failures = 0
+        self._opened_at = None
+        self._last_error = None
+        self._probe_thread = None
+        self._probes = 0
+
+    def allow_request(self) -> bool:
+        """Whether the protected backend should be called right now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                return False
+            if self.probe is None:
+                # No probe: let this call through as the recovery trial
+                self._opened_at = time.monotonic()
+                return True
+            self._start_probe()
+            return False
+
+    def record_success(self):
+        """Note a successful call"""
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state == self.OPEN:
+                logger.info("%s recovered, closing circuit breaker", self.name)
+            self._state = self.CLOSED
+            self._opened_at = None
+
+    def record_failure(self, error: Exception):
+        """Note a failed call, opening the breaker past the threshold"""
+        with self._lock:
+            self._consecutive_failures += 1
+            self._total_failures += 1
+            self._last_error = str(error)
+            if self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold:
+                logger.warning("%s failed %d times, opening circuit breaker", self.name, self._consecutive_failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            elif self._state == self.OPEN:
+                self._opened_at = time.monotonic()
+
+    def _start_probe(self):
+        """Start a background recovery probe unless one is already running"""
+        if self._probe_thread is not None and self._probe_thread.is_alive():
+            return
+        self._probes += 1
+        self._probe_thread = threading.Thread(target=self._run_probe, name=f"{self.name}-probe", daemon=True)
+        self._probe_thread.start()
+
+    def _run_probe(self):
+        try:
+            self.probe()
+        except Exception as e:
+            self.record_failure(e)
+        else:
+            self.record_success()
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get the breaker state for monitoring"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "total_failures": self._total_failures,
+                "open_for_seconds": time.monotonic() - self._opened_at if self._opened_at is not None else 0.0,
+                "probes": self._probes,
+                "last_error": self._last_error
+            }
+
+class FallbackEmbeddings:
+    """Primary embedder guarded by a circuit breaker, with a fallback embedder.
+
+    Every returned vector is checked against the dimension of the target
+    collection (from dimension_provider); vectors from a backend whose
+    dimension differs raise EmbeddingDimensionError instead of being mixed
+    into a collection built with another embedding space.
+    """
+    def __init__(self, primary, fallback_factory: Callable[[], Any], breaker: CircuitBreaker,
+                 dimension_provider: Optional[Callable[[], Optional[int]]] = None):
+        self.primary = primary
+        self.fallback_factory = fallback_factory
+        self.breaker = breaker
+        self.dimension_provider = dimension_provider
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self.primary_calls = 0
+        self.fallback_calls = 0
+
+    @property
+    def fallback(self):
+        """The fallback embedder, created on first use"""
+        if self._fallback is None:
+            with self._fallback_lock:
+                if self._fallback is None:
+                    self._fallback = self.fallback_factory()
+        return self._fallback
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a list of documents"""
+        return self._call("embed_documents", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query"""
+        return self._call("embed_query", text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a single query without blocking the event loop"""
+        if self.breaker.allow_request():
+            try:
+                result = await self.primary.aembed_query(text)
+            except Exception as e:
+                logger.warning("Error generating embeddings: %s", e)
+                self.breaker.record_failure(e)
+            else:
+                self.breaker.record_success()
+                self.primary_calls += 1
+                # The collection's dimension may come from a Chroma lookup, so keep it off the loop
+                await asyncio.to_thread(self._check_dimension, result, "embed_query", "primary")
+                return result
+
+        logger.warning("Falling back to local embeddings")
+        # Creating the fallback may load a model from disk, so keep it off the loop
+        fallback = await asyncio.to_thread(lambda: self.fallback)
+        result = await fallback.aembed_query(text)
+        self.fallback_calls += 1
+        await asyncio.to_thread(self._check_dimension, result, "embed_query", "fallback")
+        return result
+
+    def _call(self, method: str, arg):
+        if self.breaker.allow_request():
+            try:
+                result = getattr(self.primary, method)(arg)
+            except Exception as e:
+                logger.warning("Error generating embeddings: %s", e)
+                self.breaker.record_failure(e)
+            else:
+                self.breaker.record_success()
+                self.primary_calls += 1
+                self._check_dimension(result, method, "primary")
+                return result
+
+        logger.warning("Falling back to local embeddings")
+        result = getattr(self.fallback, method)(arg)
+        self.fallback_calls += 1
+        self._check_dimension(result, method, "fallback")
+        return result
+
+    def _check_dimension(self, result, method: str, backend: str):
+        """Refuse vectors whose dimension differs from the collection's"""
+        if self.dimension_provider is None:
+            return
+        expected = self.dimension_provider()
+        vectors = result if method == "embed_documents" else [result]
+        if expected is None or not vectors:
+            return
+        actual = len(vectors[0])
+        if actual != expected:
+            raise EmbeddingDimensionError(
+                f"The {backend} embedder produced {actual}-dimensional vectors but the collection "
+                f"holds {expected}-dimensional ones; refusing to mix embedding spaces"
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get breaker state and call counters"""
+        stats = self.breaker.get_state()
+        stats["primary_calls"] = self.primary_calls
+        stats["fallback_calls"] = self.fallback_calls
+        return stats
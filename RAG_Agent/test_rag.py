@@ -1,5 +1,37 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pytest
+from langchain_core.documents import Document
 from rag_system import RAGSystem
+from benchmark import make_config, _STARTUP_SCRIPT
+from evaluation import EvaluationRunner, JudgmentCache
+from crawl_ingestion import CrawlIngestionPipeline
+from crawl_cache import CrawlCache
+from ingestion_pipeline import IngestionPipeline
+from pdf_loader import count_pdf_pages
+from page_records import PageRecordLog, iter_page_records
+from text_loader import load_scraped_pages
+from numpy_vector_store import NumpyVectorStore
+from context_packer import ContextPacker
+from answer_cache import AnswerCache
+from document_processor import DocumentProcessor
+from resilient_embeddings import CircuitBreaker, EmbeddingDimensionError, FallbackEmbeddings
+from embedder_registry import get_embedder
+from ollama_pool import NoHealthyEndpointError, OllamaPool, normalize_base_urls
+from instrumentation import Metrics
+from offline_fakes import HashEmbeddings, FakeLLMClient, random_unit_vectors
+
+# The OCR stage lives in the Extractor directory next to this one
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Extractor"))
+from vision import OcrCache, OcrPipeline, ingestion_sink
 
 class TestRAGSystem:
     @pytest.fixture(scope="class")
@@ -54,3 +86,1053 @@ class TestRAGSystem:
             "cannot answer",
             "no information"
         ])
+
+class TestEvaluationRunner:
+    """Offline: stand-in embedder, LLM and judge, so no Ollama is needed"""
+    @pytest.fixture
+    def rag_system(self, tmp_path):
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        rag.add_text("Monopoly is a board game. There are 40 spaces on the Monopoly board.", "monopoly_rules.txt")
+        return rag
+    
+    def test_accuracy_and_latency(self, rag_system):
+        """Test that each answer is judged and latencies are reported"""
+        dataset = [
+            {"question": "What is Monopoly?", "expected": "monopoly"},  # The stand-in LLM repeats the question
+            {"question": "How many spaces are on the board?", "expected": "forty"}
+        ]
+        report = EvaluationRunner(rag_system, judge=FakeLLMClient(), max_concurrency=2).run(dataset)
+        assert report["questions"] == 2
+        assert report["correct"] == 1
+        assert report["accuracy"] == 0.5
+        assert [item["correct"] for item in report["items"]] == [True, False]
+        assert report["query_latency"]["p95_ms"] >= report["query_latency"]["p50_ms"] > 0
+    
+    def test_judgments_are_cached(self, rag_system, tmp_path):
+        """Test that re-running an unchanged dataset reuses stored judgments"""
+        dataset = [{"question": f"Question {i} about Monopoly?", "expected": "monopoly"} for i in range(5)]
+        judge = FakeLLMClient()
+        cache = JudgmentCache(str(tmp_path / "judgments.sqlite"))
+        first = EvaluationRunner(rag_system, judge=judge, cache=cache, max_concurrency=3).run(dataset)
+        second = EvaluationRunner(rag_system, judge=judge, cache=cache, max_concurrency=3).run(dataset)
+        assert first["judged"] == 5 and first["judgments_cached"] == 0
+        assert second["judged"] == 0 and second["judgments_cached"] == 5
+        assert judge.judge_calls == 5
+        assert second["accuracy"] == first["accuracy"] == 1.0
+
+class _FacultyPageHandler(BaseHTTPRequestHandler):
+    """Serves /faculty-<n> after a fixed delay, tracking requests in flight.
+
+    Pages carry an ETag for their version (server.versions) when
+    server.send_etags is set, and a matching If-None-Match gets a 304.
+    Version 0 serves a page with no text.
+    """
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        if not self.path.startswith("/faculty-"):
+            self.send_error(404)
+            return
+        number = self.path.rsplit("-", 1)[1]
+        version = server.versions.get(number, 1)
+        etag = f'"{number}-v{version}"'
+        if server.send_etags and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = (f"<html><head><title>Faculty {number}</title><script>var x = {version};</script></head>"
+                f"<body><h1>Professor {number}</h1><p>Professor {number} teaches CS{number}{version} and "
+                f"researches distributed systems.</p></body></html>").encode("utf-8")
+        if version == 0:
+            body = b"<html><body></body></html>"
+        self.send_response(200)
+        if server.send_etags:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class TestCrawlIngestion:
+    """Offline: pages come from a local HTTP fixture server"""
+    @pytest.fixture
+    def server(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _FacultyPageHandler)
+        server.delay = 0.3
+        server.lock = threading.Lock()
+        server.in_flight = server.peak_in_flight = 0
+        server.versions = {}
+        server.send_etags = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+    
+    @pytest.fixture
+    def rag_system(self, tmp_path):
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        rag.warm_up()  # Keep the one-off spaCy import out of the crawl timings
+        return rag
+    
+    def test_pages_are_fetched_concurrently_and_indexed(self, server, rag_system):
+        """Test that every page is indexed and the crawl takes about one page's delay, not the sum"""
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        urls = [f"{base}/faculty-{i}" for i in range(12)]
+        pipeline = CrawlIngestionPipeline(rag_system, max_concurrency=12, max_per_host=12, host_delay=0)
+        stats = pipeline.run(urls + [f"{base}/missing"])
+        assert stats["pages_indexed"] == 12
+        assert stats["failed_urls"] == [f"{base}/missing"]
+        assert stats["elapsed_seconds"] < 12 * server.delay / 2
+        results = rag_system.vector_store.similarity_search(
+            rag_system.embeddings.embed_query("x"), k=50, filters={"source": urls[3]}
+        )
+        assert results and "Professor 3 teaches CS31" in results[0]["content"]
+        assert "var x" not in results[0]["content"]
+    
+    def test_per_host_limit(self, server, rag_system):
+        """Test that no more than max_per_host requests reach one host at a time"""
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        server.delay = 0.05
+        pipeline = CrawlIngestionPipeline(rag_system, max_concurrency=8, max_per_host=2, host_delay=0)
+        stats = pipeline.run([f"{base}/faculty-{i}" for i in range(8)])
+        assert stats["pages_indexed"] == 8
+        assert server.peak_in_flight <= 2
+    
+    @pytest.mark.parametrize("send_etags", [True, False])
+    def test_unchanged_pages_are_skipped(self, server, rag_system, tmp_path, send_etags):
+        """Test that a re-crawl only indexes changed pages, via 304s or the content hash"""
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        server.delay = 0
+        server.send_etags = send_etags
+        urls = [f"{base}/faculty-{i}" for i in range(4)]
+        cache = CrawlCache(str(tmp_path / "crawl_cache.sqlite"))
+        pipeline = CrawlIngestionPipeline(rag_system, max_concurrency=4, max_per_host=4, host_delay=0, cache=cache)
+        
+        first = pipeline.run(urls)
+        assert first["pages_changed"] == 4 and first["pages_indexed"] == 4
+        
+        second = pipeline.run(urls)
+        assert second["pages_unchanged"] == 4 and second["pages_indexed"] == 0
+        assert second["pages_fetched"] == (0 if send_etags else 4)
+        
+        server.versions["2"] = 2
+        embedded_before = rag_system.ingest_stats["chunks_embedded"]
+        third = pipeline.run(urls)
+        assert third["changed_urls"] == [urls[2]]
+        assert third["pages_unchanged"] == 3 and third["pages_indexed"] == 1
+        assert rag_system.ingest_stats["chunks_embedded"] > embedded_before
+    
+    def test_emptied_page_chunks_are_deleted(self, server, rag_system, tmp_path):
+        """Test that a page that now has no text loses its old chunks and is cached as empty"""
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        server.delay = 0
+        urls = [f"{base}/faculty-{i}" for i in range(2)]
+        cache = CrawlCache(str(tmp_path / "crawl_cache.sqlite"))
+        pipeline = CrawlIngestionPipeline(rag_system, max_concurrency=2, max_per_host=2, host_delay=0, cache=cache)
+        pipeline.run(urls)
+        
+        def chunks_for(url):
+            return rag_system.vector_store.similarity_search(
+                rag_system.embeddings.embed_query("x"), k=50, filters={"source": url}
+            )
+        assert chunks_for(urls[1])
+        
+        server.versions["1"] = 0
+        second = pipeline.run(urls)
+        assert second["changed_urls"] == [urls[1]]
+        assert second["pages_emptied"] == 1 and second["pages_indexed"] == 0
+        assert chunks_for(urls[1]) == [] and chunks_for(urls[0])
+        
+        third = pipeline.run(urls)
+        assert third["pages_unchanged"] == 2
+
+class TestPdfIngestion:
+    """Offline: uses the faculty PDFs saved by the crawler"""
+    PDF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Extractor", "pdfs", "dr-praveen.pdf")
+    
+    def make_rag(self, path):
+        return RAGSystem(make_config(str(path), "numpy"), embeddings=HashEmbeddings(64),
+                         llm_client=FakeLLMClient())
+    
+    def stored_chunks(self, rag):
+        results = rag.vector_store.similarity_search(rag.embeddings.embed_query("x"), k=1000)
+        return sorted((r["metadata"]["page"], r["content"]) for r in results)
+    
+    def test_pages_are_numbered(self, tmp_path):
+        """Test that each chunk carries the 1-based page it came from"""
+        pytest.importorskip("pypdf")
+        rag = self.make_rag(tmp_path)
+        rag.add_pdf(self.PDF_PATH)
+        pages = {page for page, _ in self.stored_chunks(rag)}
+        assert min(pages) == 1
+        assert pages <= set(range(1, count_pdf_pages(self.PDF_PATH) + 1))
+    
+    def test_pipeline_matches_serial(self, tmp_path):
+        """Test that page-range tasks on worker processes store the same chunks as add_pdf"""
+        pytest.importorskip("pypdf")
+        serial = self.make_rag(tmp_path / "serial")
+        serial.add_pdf(self.PDF_PATH)
+        piped = self.make_rag(tmp_path / "piped")
+        stats = IngestionPipeline(piped, workers=2).run_pdfs([self.PDF_PATH], pages_per_task=1)
+        assert stats["pages"] == count_pdf_pages(self.PDF_PATH)
+        assert self.stored_chunks(piped) == self.stored_chunks(serial)
+    
+    def write_pages(self, path, page_count):
+        from pypdf import PdfReader, PdfWriter
+        writer = PdfWriter()
+        for page in PdfReader(self.PDF_PATH).pages[:page_count]:
+            writer.add_page(page)
+        with open(path, "wb") as f:
+            writer.write(f)
+    
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_removed_pages_are_deleted(self, tmp_path, parallel):
+        """Test that re-adding a PDF that lost pages deletes the chunks of the missing pages"""
+        pytest.importorskip("pypdf")
+        rag = self.make_rag(tmp_path)
+        path = str(tmp_path / "handbook.pdf")
+        for page_count in (3, 2):
+            self.write_pages(path, page_count)
+            if parallel:
+                IngestionPipeline(rag, workers=1).run_pdfs([path], pages_per_task=1)
+            else:
+                rag.add_pdf(path)
+            assert max(page for page, _ in self.stored_chunks(rag)) == page_count
+
+class TestPageRecords:
+    """Offline: JSONL crawl output written the way Extractor/faculty_scraper.py does"""
+    def record(self, i, changed=True):
+        return {"url": f"https://example.edu/faculty-{i}", "markdown_content": f"Professor {i} teaches CS{i}1.",
+                "timestamp": "2026-01-01T00:00:00", "changed": changed}
+    
+    def test_resume_after_crash(self, tmp_path):
+        """Test that a truncated last line is skipped on resume and cut off before appending"""
+        path = str(tmp_path / "faculty_data.jsonl")
+        log = PageRecordLog(path)
+        for i in range(3):
+            log.append(self.record(i))
+        log.close()
+        with open(path, 'ab') as f:
+            f.write(b'{"url": "https://example.edu/faculty-3", "markdown_')  # Crash mid-write
+        
+        resumed = PageRecordLog(path)
+        assert resumed.urls() == {f"https://example.edu/faculty-{i}" for i in range(3)}
+        resumed.append(self.record(3))
+        resumed.close()
+        assert [r["url"] for r in iter_page_records(path)] == [f"https://example.edu/faculty-{i}" for i in range(4)]
+        assert PageRecordLog(path).lookup("https://example.edu/faculty-1") == self.record(1)
+    
+    def test_load_changed_pages(self, tmp_path):
+        """Test that ingestion streams the records and loads each page again only once it changed"""
+        path = str(tmp_path / "faculty_data.jsonl")
+        log = PageRecordLog(path)
+        for i in range(4):
+            log.append(self.record(i))
+        log.close()
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        assert load_scraped_pages(path, rag) == 4
+        assert load_scraped_pages(path, rag) == 0
+        
+        # Two scrapes before the next load: the second marks the page unchanged, but it was never loaded
+        changed = dict(self.record(1), markdown_content="Professor 1 now teaches CS99.")
+        for record in (changed, dict(changed, changed=False)):
+            log = PageRecordLog(path + ".new")
+            log.append(record)
+            log.close()
+            os.replace(path + ".new", path)
+        assert load_scraped_pages(path, rag) == 1
+        assert load_scraped_pages(path, rag, changed_only=False) == 1
+
+class TestHybridSearch:
+    """Offline: BM25 fused with vector hits"""
+    @pytest.fixture
+    def rag_system(self, tmp_path):
+        config = make_config(str(tmp_path), "numpy")
+        config.TOP_K_CHUNKS = 3
+        config.HYBRID_CANDIDATES = 3
+        rag = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        for i in range(20):
+            rag.add_text(f"Professor {i} teaches course CS{i}1.", f"faculty-{i}.txt")
+        rag.add_text("The xylophone club meets on Fridays.", "clubs.txt")
+        return rag
+    
+    def test_lexical_only_hit(self, rag_system):
+        """Test that a chunk found only by BM25 is retrieved and scores stay numeric"""
+        vector_hits = rag_system.vector_store.similarity_search(rag_system.embeddings.embed_query("xylophone"), k=3)
+        assert "clubs.txt" not in [hit["metadata"]["source"] for hit in vector_hits]
+        result = rag_system.query("xylophone")
+        assert "clubs.txt" in result["sources"]
+        assert all(isinstance(score, float) for score in result["similarity_scores"])
+        assert sum(result["similarity_scores"]) > 0
+        assert len(result["fusion_scores"]) == len(result["context_chunks"])
+    
+    def test_lexical_index_follows_collection(self, rag_system, tmp_path):
+        """Test that a lexical index never returns chunks from another collection"""
+        config = make_config(str(tmp_path), "numpy")
+        config.COLLECTION_NAME = "other"
+        other = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        assert other.lexical_index.search("xylophone") == []
+        
+        # An index shared by both collections is rebuilt when its chunk count is off
+        config.LEXICAL_INDEX_PATH = str(tmp_path / "shared.sqlite")
+        other = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        other.add_text("Only in the other collection.", "other.txt")
+        config.COLLECTION_NAME = rag_system.config.COLLECTION_NAME
+        rebuilt = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        assert rebuilt.lexical_index.count() == 21
+        assert rebuilt.lexical_index.search("other collection") == []
+
+    def test_text_changed_without_the_index_is_not_served(self, rag_system, tmp_path):
+        """Test that BM25 hits for text re-ingested while hybrid search was off don't reach the LLM"""
+        config = make_config(str(tmp_path), "numpy")
+        config.HYBRID_SEARCH_ENABLED = False
+        vector_only = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        vector_only.add_text("The marimba club meets on Fridays.", "clubs.txt")
+        
+        config.HYBRID_SEARCH_ENABLED = True
+        config.TOP_K_CHUNKS = rag_system.config.TOP_K_CHUNKS
+        config.HYBRID_CANDIDATES = rag_system.config.HYBRID_CANDIDATES
+        hybrid = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        assert hybrid.lexical_index.count() == 21
+        result = hybrid.query("xylophone")
+        assert all("xylophone" not in chunk for chunk in result["context_chunks"])
+        # The hit's chunk was re-indexed with its current text
+        assert hybrid.lexical_index.search("xylophone") == []
+        assert hybrid.lexical_index.search("marimba")[0]["content"] == "The marimba club meets on Fridays."
+
+class TestNumpyVectorStore:
+    """Offline: the in-process NumPy backend"""
+    def make_store(self, tmp_path):
+        return NumpyVectorStore(str(tmp_path / "numpy_db"), "chunks")
+    
+    def chunk(self, chunk_id, text):
+        return Document(page_content=text, metadata={"chunk_id": chunk_id, "source": "notes.txt", "page": 0,
+                                                     "chunk_index": int(chunk_id[-1])})
+    
+    def test_rewriting_an_id_keeps_one_row(self, tmp_path):
+        """Test that adding a stored chunk ID again overwrites it instead of adding a second live row"""
+        store = self.make_store(tmp_path)
+        vectors = random_unit_vectors(3, 8).tolist()
+        store.add_documents([self.chunk("c0", "old"), self.chunk("c1", "other")], vectors[:2])
+        store.add_documents([self.chunk("c0", "new")], vectors[2:], check_existing=False)
+        assert store.get_collection_stats()["total_chunks"] == 2
+        results = store.similarity_search(vectors[2], k=5)
+        assert [result["content"] for result in results][0] == "new"
+        assert "old" not in [result["content"] for result in results]
+    
+    def test_searches_score_outside_the_lock(self, tmp_path):
+        """Test that a search can finish while another one is still scoring"""
+        store = self.make_store(tmp_path)
+        vectors = random_unit_vectors(3, 8).tolist()
+        store.add_documents([self.chunk(f"c{i}", f"text {i}") for i in range(3)], vectors)
+        scoring, release = threading.Event(), threading.Event()
+        search_view = store._search_view
+        def blocking_search_view(*args):
+            if threading.current_thread() is not threading.main_thread():
+                scoring.set()
+                release.wait(5)
+            return search_view(*args)
+        store._search_view = blocking_search_view
+        results = []
+        slow = threading.Thread(target=lambda: results.append(store.similarity_search(vectors[0], k=1)))
+        slow.start()
+        assert scoring.wait(5)
+        assert store.similarity_search(vectors[1], k=1)[0]["content"] == "text 1"
+        store.delete_documents(["c0"])
+        release.set()
+        slow.join()
+        assert results == [[]]  # Deleted while it was being scored
+    
+    @pytest.mark.parametrize("quantization", ["none", "int8"])
+    def test_deleted_rows_are_compacted(self, tmp_path, quantization):
+        """Test that deleting most rows compacts the files and keeps search results and IDs intact"""
+        store = NumpyVectorStore(str(tmp_path / "numpy_db"), "chunks", quantization=quantization)
+        vectors = random_unit_vectors(2000, 8)
+        documents = [Document(page_content=f"text {i}", metadata={"chunk_id": f"c{i}", "source": "notes.txt",
+                                                                   "page": 0, "chunk_index": i}) for i in range(2000)]
+        store.add_documents(documents, vectors.tolist())
+        disk_bytes = store.get_collection_stats()["vector_disk_bytes"]
+        kept = list(range(0, 2000, 4))
+        store.delete_documents([f"c{i}" for i in range(2000) if i % 4])
+        stats = store.get_collection_stats()
+        assert (stats["total_chunks"], stats["dead_rows"]) == (500, 0)
+        assert stats["vector_disk_bytes"] < disk_bytes
+        
+        reopened = NumpyVectorStore(str(tmp_path / "numpy_db"), "chunks", quantization=quantization)
+        for i in kept[::50]:
+            assert reopened.similarity_search(vectors[i].tolist(), k=1)[0]["content"] == f"text {i}"
+        assert reopened.get_existing_ids(["c4", "c5"]) == {"c4"}
+        assert reopened.compact() == 0
+    
+    def test_duplicate_ids_in_one_batch_are_rejected(self, tmp_path):
+        """Test that one write may not contain the same chunk ID twice"""
+        store = self.make_store(tmp_path)
+        with pytest.raises(ValueError):
+            store.add_documents([self.chunk("c0", "a"), self.chunk("c0", "b")], random_unit_vectors(2, 8).tolist())
+    
+    def test_pipeline_with_same_named_files(self, tmp_path):
+        """Test that files sharing a name are ingested like consecutive add_file calls"""
+        for directory, text in (("a", "Alpha notes about the first course."), ("b", "Beta notes about the second course.")):
+            os.makedirs(tmp_path / directory)
+            (tmp_path / directory / "notes.txt").write_text(text)
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        stats = IngestionPipeline(rag, workers=1).run([str(tmp_path / "a" / "notes.txt"), str(tmp_path / "b" / "notes.txt")])
+        assert stats["files"] == 2
+        result = rag.query("Which notes are about a course?")
+        assert result["sources"] == ["notes.txt"]
+        assert result["context_chunks"] == ["Beta notes about the second course."]
+
+class TestMetadataFilters:
+    """Offline: filtered retrieval on both backends"""
+    @pytest.fixture(params=["numpy", "chroma"])
+    def rag_system(self, request, tmp_path):
+        if request.param == "chroma":
+            pytest.importorskip("chromadb")
+        return RAGSystem(make_config(str(tmp_path), request.param), embeddings=HashEmbeddings(64),
+                         llm_client=FakeLLMClient())
+    
+    def search(self, rag, filters):
+        return rag.vector_store.similarity_search(rag.embeddings.embed_query("x"), k=10, filters=filters)
+    
+    def test_filters_restrict_results(self, rag_system):
+        """Test that only chunks matching the filters are returned"""
+        for page in range(1, 5):
+            rag_system.add_text(f"Page {page} of the handbook.", "handbook.pdf", page)
+        rag_system.add_text("A separate note.", "note.txt")
+        results = self.search(rag_system, {"source": "handbook.pdf", "page": {"$gte": 2, "$lte": 3}})
+        assert sorted(result["metadata"]["page"] for result in results) == [2, 3]
+    
+    def test_new_metadata_is_written_on_reingest(self, rag_system):
+        """Test that re-adding unchanged text with new metadata updates the stored chunks"""
+        rag_system.add_text("Professor Reed teaches CS101.", "reed.html", metadata={"crawl_date": "2026-01-01"})
+        rag_system.add_text("Professor Reed teaches CS101.", "reed.html", metadata={"crawl_date": "2026-02-01"})
+        assert len(self.search(rag_system, {"crawl_date": "2026-02-01"})) == 1
+        assert self.search(rag_system, {"crawl_date": "2026-01-01"}) == []
+        rag_system.add_text("Professor Reed teaches CS101.", "reed.html", metadata={"crawl_date": "2026-02-01"})
+        assert rag_system.ingest_stats["chunks_skipped"] == 1
+    
+    def test_metadata_cannot_replace_chunk_keys(self, rag_system):
+        """Test that metadata may not overwrite the chunker's identity fields"""
+        with pytest.raises(ValueError):
+            rag_system.add_text("Some text.", "a.txt", metadata={"source": "b.txt"})
+
+class TestContextPacker:
+    """Offline: packing retrieved chunks into the prompt budget"""
+    def result(self, content, rank):
+        return {"content": content, "metadata": {"chunk_id": f"c{rank}", "source": f"doc-{rank}.txt"}, "distance": float(rank)}
+    
+    def test_overlap_is_dropped(self):
+        """Test that sentences repeated from a higher-ranked chunk are not sent twice"""
+        shared = "The department office is in building seven."
+        packer = ContextPacker(token_budget=1024, mmr_lambda=1.0)
+        packed, packing = packer.pack([self.result(f"Intro sentence one. {shared}", 0),
+                                       self.result(f"{shared} Office hours are on Monday.", 1)])
+        assert [result["content"] for result in packed] == [f"Intro sentence one. {shared}", "Office hours are on Monday."]
+        assert packing["duplicate_sentences_dropped"] == 1
+    
+    def test_unpunctuated_chunk_is_truncated(self, tmp_path):
+        """Test that a chunk with no sentence breaks is cut to the budget rather than dropped"""
+        text = " ".join(f"word{i}" for i in range(2000))
+        packed, packing = ContextPacker(token_budget=100).pack([self.result(text, 0)])
+        assert len(packed) == 1 and packing["chunks_dropped"] == 0
+        assert 0 < packing["context_tokens"] <= 100
+        assert text.startswith(packed[0]["content"])
+        
+        config = make_config(str(tmp_path), "numpy")
+        config.CONTEXT_TOKEN_BUDGET = 100
+        rag = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        rag.document_processor.mode = "default"
+        rag.document_processor.chunk_size = len(text)
+        rag.add_text(text, "ocr.txt")
+        result = rag.query("word7")
+        assert result["sources"] == ["ocr.txt"]
+        assert result["answer"].endswith("from 1 chunks")
+
+class TestQuantization:
+    """Offline: quantized NumPy collections"""
+    def fill(self, store, vectors):
+        documents = [Document(page_content=f"chunk {i}", metadata={"chunk_id": f"c{i}", "source": "s.txt", "page": 0,
+                                                                  "chunk_index": i}) for i in range(len(vectors))]
+        store.add_documents(documents, vectors.tolist())
+    
+    def test_int8_recall_with_rerank(self, tmp_path):
+        """Test that int8 codes with full-precision re-ranking return the exact top k"""
+        vectors = random_unit_vectors(500, 32)
+        exact = NumpyVectorStore(str(tmp_path / "exact"), "chunks")
+        quantized = NumpyVectorStore(str(tmp_path / "int8"), "chunks", quantization="int8")
+        self.fill(exact, vectors)
+        self.fill(quantized, vectors)
+        for query in random_unit_vectors(10, 32, seed=1).tolist():
+            assert [r["content"] for r in quantized.similarity_search(query, k=5)] == \
+                   [r["content"] for r in exact.similarity_search(query, k=5)]
+    
+    def test_switch_to_codes_only(self, tmp_path):
+        """Test that reopening a full-precision collection as codes-only re-encodes it and frees the float32 file"""
+        vectors = random_unit_vectors(200, 32)
+        full = NumpyVectorStore(str(tmp_path), "chunks")
+        self.fill(full, vectors)
+        full_bytes = full.get_collection_stats()["vector_disk_bytes"]
+        store = NumpyVectorStore(str(tmp_path), "chunks", quantization="float16", keep_full_precision=False)
+        assert not os.path.exists(store.matrix_path)
+        assert store.similarity_search(vectors[7].tolist(), k=1)[0]["content"] == "chunk 7"
+        assert store.get_collection_stats()["vector_disk_bytes"] < full_bytes * 0.6
+
+class _FakeOcrBackend:
+    """OCR backend that "reads" image bytes as UTF-8 and fails on b"bad" images"""
+    name = "fake"
+    max_batch_size = 2
+    
+    def __init__(self):
+        self.batches = []
+    
+    def ocr_batch(self, images):
+        self.batches.append(len(images))
+        return [RuntimeError("unreadable") if content.startswith(b"bad") else content.decode() for content in images]
+
+class TestOcrPipeline:
+    """Offline: Extractor/vision.py with a stand-in OCR backend"""
+    IMAGES = [("a", b"Professor A"), ("b", b"Professor B"), ("bad", b"bad image"), ("c", b"Professor C"),
+              ("d", b"Professor D")]
+    
+    def test_batches_cache_and_errors(self, tmp_path):
+        """Test that images are OCR'd in batches, failures are counted and cached text is reused"""
+        backend = _FakeOcrBackend()
+        cache = OcrCache(str(tmp_path / "ocr.sqlite"))
+        received = []
+        sink = lambda name, text, cached: received.append((name, text, cached))
+        first = OcrPipeline(backend, cache, max_concurrency=2, sinks=[sink]).run(self.IMAGES)
+        assert (first["ocr"], first["cached"], first["failed"]) == (4, 0, 1)
+        assert first["failed_names"] == ["bad"]
+        assert sorted(backend.batches) == [1, 2, 2]
+        assert sorted(received) == [(name, content.decode(), False) for name, content in self.IMAGES if name != "bad"]
+        
+        backend.batches = []
+        second = OcrPipeline(backend, cache, sinks=[sink]).run(self.IMAGES)
+        assert (second["ocr"], second["cached"], second["failed"]) == (0, 4, 1)
+        assert backend.batches == [1]  # Only the image that failed is sent again
+    
+    def test_sink_errors_are_counted(self, tmp_path):
+        """Test that a failing sink fails only its image and ingestion receives the rest"""
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        def flaky(name, text, cached):
+            if name == "b":
+                raise RuntimeError("disk full")
+        stats = OcrPipeline(_FakeOcrBackend(), sinks=[flaky, ingestion_sink(rag)]).run(self.IMAGES)
+        assert stats["ocr"] == 3
+        assert sorted(stats["failed_names"]) == ["b", "bad"]
+        assert rag.get_stats()["total_chunks"] == 3
+
+class TestAsyncQuery:
+    """Offline: RAGSystem.aquery"""
+    @pytest.fixture
+    def rag_system(self, tmp_path):
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient(delay=0.2))
+        for i in range(5):
+            rag.add_text(f"Professor {i} teaches CS{i}1 on Mondays.", f"faculty-{i}.txt")
+        return rag
+    
+    def test_concurrent_queries_match_query(self, rag_system):
+        """Test that concurrent aquery calls overlap and answer like query"""
+        questions = [f"Who teaches CS{i}1?" for i in range(4)]
+        rag_system.config.ASYNC_LLM_CONCURRENCY = 4
+        
+        async def ask_all():
+            return await asyncio.gather(*(rag_system.aquery(question) for question in questions))
+        start = time.perf_counter()
+        results = asyncio.run(ask_all())
+        assert time.perf_counter() - start < 4 * 0.2
+        for question, result in zip(questions, results):
+            expected = rag_system.query(question)
+            assert (result["answer"], sorted(result["sources"])) == (expected["answer"], sorted(expected["sources"]))
+    
+    def test_cache_lookups_run_off_the_event_loop(self, rag_system):
+        """Test that the embedding cache's SQLite calls are not made on the event loop thread"""
+        cache = rag_system.embedding_cache
+        threads = []
+        get_many, put_many = cache.get_many, cache.put_many
+        cache.get_many = lambda *args: threads.append(threading.get_ident()) or get_many(*args)
+        cache.put_many = lambda *args: threads.append(threading.get_ident()) or put_many(*args)
+        
+        async def ask():
+            await rag_system.aquery("A question nobody asked before?")
+            return threading.get_ident()
+        loop_thread = asyncio.run(ask())
+        assert threads and loop_thread not in threads
+
+class TestAnswerCache:
+    """Offline: the answer cache in front of the LLM"""
+    @pytest.fixture
+    def rag_system(self, tmp_path):
+        config = make_config(str(tmp_path), "numpy")
+        config.ANSWER_CACHE_ENABLED = True
+        rag = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        rag.add_text("Professor Reed teaches CS101.", "reed.txt")
+        return rag
+    
+    def test_hits_until_collection_changes(self, rag_system):
+        """Test that repeated questions skip the LLM until new documents are added"""
+        rag_system.query("Who teaches CS101?")
+        assert rag_system.query("who teaches cs101")["cached"] == "exact"
+        assert rag_system.llm_client.calls == 1
+        rag_system.add_text("Professor Stone teaches CS102.", "stone.txt")
+        result = rag_system.query("Who teaches CS101?")
+        assert "cached" not in result and result["answer"].endswith("from 2 chunks")
+        assert rag_system.llm_client.calls == 2
+    
+    def test_answer_computed_before_a_change_is_not_stored(self, rag_system):
+        """Test that an answer generated while documents were being added is not cached"""
+        generate = rag_system.llm_client.generate_response
+        def generate_during_ingest(prompt, context):
+            rag_system.llm_client.generate_response = generate
+            rag_system.add_text("Professor Stone now teaches CS101.", "stone.txt")
+            return generate(prompt, context)
+        rag_system.llm_client.generate_response = generate_during_ingest
+        rag_system.query("Who teaches CS101?")
+        assert rag_system.answer_cache.get_stats()["stale_puts"] == 1
+        assert "cached" not in rag_system.query("Who teaches CS101?")
+
+    def test_similar_questions_about_other_codes_miss(self):
+        """Test that a near-identical question naming another course, room or email is not a hit"""
+        cache = AnswerCache(similarity_threshold=0.95)
+        embedding = random_unit_vectors(1, 64)[0].tolist()
+        cache.put("Who teaches CS101?", embedding, {"answer": "Reed"}, 1.0)
+        assert cache.get_similar("Who teaches CS102?", embedding) is None
+        assert cache.get_similar("Who teaches cs101 this term?", embedding)["answer"] == "Reed"
+        cache.put("What is reed@example.edu's office?", embedding, {"answer": "Room 204"}, 1.0)
+        assert cache.get_similar("What is stone@example.edu's office?", embedding) is None
+        assert cache.get_stats()["similar_hits"] == 1
+
+    def test_evicted_rows_are_reused(self):
+        """Test that evicting the least recently used entry frees its embedding row for the next one"""
+        cache = AnswerCache(max_entries=2)
+        vectors = random_unit_vectors(4, 64).tolist()
+        for i in range(3):
+            cache.put(f"Question {'abc'[i]}?", vectors[i], {"answer": str(i)}, 1.0)
+        assert cache.get_similar("Question a?", vectors[0]) is None
+        assert [cache.get_similar(f"Question {'abc'[i]}?", vectors[i])["answer"] for i in (1, 2)] == ["1", "2"]
+        cache.put("Question d?", vectors[3], {"answer": "3"}, 1.0)
+        assert cache.get_similar("Question b?", vectors[1]) is None
+        assert cache.get_stats()["entries"] == 2
+
+class _FailingEmbeddings(HashEmbeddings):
+    def embed_documents(self, texts):
+        raise RuntimeError("embedding server down")
+
+class TestIngestionPipeline:
+    """Offline: the pipelined ingestion of text files"""
+    def write_files(self, directory, count):
+        paths = []
+        for i in range(count):
+            path = directory / f"faculty-{i}.txt"
+            path.write_text(f"Professor {i} teaches CS{i}1. Office hours are on Monday.")
+            paths.append(str(path))
+        return paths
+    
+    def test_matches_serial_ingestion(self, tmp_path):
+        """Test that the pipeline stores the same chunks as add_file and skips them on a re-run"""
+        paths = self.write_files(tmp_path, 12)
+        serial = RAGSystem(make_config(str(tmp_path / "serial"), "numpy"), embeddings=HashEmbeddings(64),
+                           llm_client=FakeLLMClient())
+        for path in paths:
+            serial.add_file(path)
+        piped = RAGSystem(make_config(str(tmp_path / "piped"), "numpy"), embeddings=HashEmbeddings(64),
+                          llm_client=FakeLLMClient())
+        pipeline = IngestionPipeline(piped, workers=2, embed_batch_size=5, files_per_task=3)
+        stats = pipeline.run(paths)
+        assert stats["files"] == 12 and stats["chunks"] == serial.get_stats()["total_chunks"]
+        assert piped.get_stats()["total_chunks"] == serial.get_stats()["total_chunks"]
+        assert pipeline.run(paths)["chunks_skipped"] == stats["chunks"]
+    
+    def stored_texts(self, rag):
+        results = rag.vector_store.similarity_search(rag.embeddings.embed_query("x"), k=1000)
+        return sorted((result["metadata"]["chunk_index"], result["content"]) for result in results)
+    
+    @pytest.mark.parametrize("embed_batch_size,stale_check_pages", [(3, 1), (256, 256)])
+    def test_same_named_files_of_different_lengths(self, tmp_path, embed_batch_size, stale_check_pages):
+        """Test that a shorter file sharing a longer one's name leaves none of the longer one's chunks"""
+        paths = []
+        for directory, count in (("a", 80), ("b", 40)):
+            os.makedirs(tmp_path / directory)
+            path = tmp_path / directory / "notes.txt"
+            path.write_text(" ".join(f"Note {i} from the {directory} folder." for i in range(count)))
+            paths.append(str(path))
+        serial = RAGSystem(make_config(str(tmp_path / "serial"), "numpy"), embeddings=HashEmbeddings(64),
+                           llm_client=FakeLLMClient())
+        for path in paths:
+            serial.add_file(path)
+        piped = RAGSystem(make_config(str(tmp_path / "piped"), "numpy"), embeddings=HashEmbeddings(64),
+                          llm_client=FakeLLMClient())
+        stats = IngestionPipeline(piped, workers=1, embed_batch_size=embed_batch_size, files_per_task=1,
+                                  stale_check_pages=stale_check_pages).run(paths)
+        assert stats["chunks_deleted"] == 5
+        assert self.stored_texts(piped) == self.stored_texts(serial)
+        assert len(self.stored_texts(piped)) == 5
+    
+    def test_workers_use_the_processor_settings(self, tmp_path):
+        """Test that workers chunk with the RAGSystem's processor, not the config defaults"""
+        paths = self.write_files(tmp_path, 3)
+        rags = []
+        for name in ("serial", "piped"):
+            rag = RAGSystem(make_config(str(tmp_path / name), "numpy"), embeddings=HashEmbeddings(64),
+                            llm_client=FakeLLMClient())
+            rag._document_processor = DocumentProcessor(chunk_size=20, chunk_overlap=0)
+            rags.append(rag)
+        for path in paths:
+            rags[0].add_file(path)
+        IngestionPipeline(rags[1], workers=1).run(paths)
+        assert self.stored_texts(rags[1]) == self.stored_texts(rags[0])
+        assert rags[1].get_stats()["total_chunks"] > len(paths)
+    
+    def test_stops_after_a_stage_fails(self, tmp_path):
+        """Test that chunking stops submitting work once embedding has failed"""
+        paths = self.write_files(tmp_path, 200)
+        consumed = []
+        def tracked_paths():
+            for path in paths:
+                consumed.append(path)
+                yield path
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=_FailingEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        with pytest.raises(RuntimeError, match="embedding server down"):
+            IngestionPipeline(rag, workers=1, embed_batch_size=1, files_per_task=1).run(tracked_paths())
+        assert len(consumed) < 50
+
+class TestExistenceCheck:
+    """Offline: stored chunk IDs are looked up in bulk before embedding"""
+    TEXT = " ".join(f"Professor {i} teaches course CS{i}1." for i in range(40))
+    
+    def test_one_lookup_per_batch(self, tmp_path):
+        """Test that each embedding batch costs one ID lookup and a re-add embeds nothing"""
+        config = make_config(str(tmp_path), "numpy")
+        config.INGEST_EMBED_BATCH_SIZE = 2
+        rag = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        lookups = []
+        get_existing_hashes = rag.vector_store.get_existing_hashes
+        rag.vector_store.get_existing_hashes = lambda ids: lookups.append(len(ids)) or get_existing_hashes(ids)
+        rag.add_text(self.TEXT, "faculty.txt")
+        assert rag.get_stats()["total_chunks"] == 5
+        assert lookups == [2, 2, 1]
+        
+        rag.add_text(self.TEXT, "faculty.txt")
+        assert rag.ingest_stats["chunks_embedded"] == 5
+        assert rag.ingest_stats["chunks_skipped"] == 5
+
+class TestEmbeddingCache:
+    """Offline: the persistent embedding cache shared across processes and stores"""
+    TEXT = " ".join(f"Professor {i} teaches course CS{i}1." for i in range(40))
+    
+    def make_rag(self, workdir, cache_path, embeddings):
+        config = make_config(str(workdir), "numpy")
+        config.EMBEDDING_CACHE_PATH = str(cache_path)
+        return RAGSystem(config, embeddings=embeddings, llm_client=FakeLLMClient())
+    
+    def test_second_system_reuses_vectors(self, tmp_path):
+        """Test that a new RAGSystem on the same cache file embeds nothing it has seen, per model"""
+        cache_path = tmp_path / "embedding_cache.sqlite"
+        first = self.make_rag(tmp_path / "first", cache_path, HashEmbeddings(64))
+        first.add_text(self.TEXT, "faculty.txt")
+        first.query("Who teaches CS31?")
+        
+        embeddings = HashEmbeddings(64)
+        second = self.make_rag(tmp_path / "second", cache_path, embeddings)
+        second.add_text(self.TEXT, "faculty.txt")
+        second.query("Who teaches CS31?")
+        assert embeddings.texts == 0
+        assert second.get_stats()["total_chunks"] == 5
+        
+        # Vectors are keyed by model, so another model does not get them
+        other_model = HashEmbeddings(32)
+        self.make_rag(tmp_path / "third", cache_path, other_model).add_text(self.TEXT, "faculty.txt")
+        assert other_model.texts == 5
+
+class TestBatchChunking:
+    """Offline: spaCy chunking of many texts through nlp.pipe"""
+    ITEMS = [
+        ("Professor Reed teaches CS101. She holds office hours on Monday. Her lab studies compilers.", "reed.txt", 0),
+        ("", "empty.txt", 0),
+        ("Professor Stone teaches CS102. He advises the robotics club.", "stone.pdf", 3),
+    ]
+    
+    @pytest.mark.parametrize("mode", ["spacy", "default"])
+    def test_matches_one_at_a_time(self, mode):
+        """Test that create_chunks_many gives the same chunks and IDs as create_chunks per text"""
+        processor = DocumentProcessor(chunk_size=60, chunk_overlap=0, mode=mode,
+                                      spacy_sentences_per_chunk=2, spacy_pipeline="sentencizer")
+        batched = processor.create_chunks_many(self.ITEMS, batch_size=2)
+        single = [processor.create_chunks(text, source, page) for text, source, page in self.ITEMS]
+        assert [[(doc.page_content, doc.metadata) for doc in docs] for docs in batched] == \
+            [[(doc.page_content, doc.metadata) for doc in docs] for docs in single]
+        assert [len(docs) for docs in batched][:2] == [2, 0]
+        if mode == "spacy":
+            assert batched[0][1].page_content == "Her lab studies compilers."
+
+class TestStreamingChunker:
+    """Offline: chunking a text stream window by window"""
+    TEXT = " ".join(f"Professor {i} teaches course CS{i}1." for i in range(40))
+    
+    def test_sentence_chunks_match_whole_text(self):
+        """Test that windows much smaller than the text give the same sentence chunks"""
+        processor = DocumentProcessor(mode="spacy", spacy_pipeline="sentencizer")
+        streamed = list(processor.iter_chunks(io.StringIO(self.TEXT), "faculty.txt", window_size=50))
+        whole = processor.create_chunks(self.TEXT, "faculty.txt")
+        assert [(doc.page_content, doc.metadata) for doc in streamed] == \
+            [(doc.page_content, doc.metadata) for doc in whole]
+    
+    def test_character_chunks_cover_the_text(self):
+        """Test that character chunks stay within chunk_size and keep every word"""
+        processor = DocumentProcessor(chunk_size=80, chunk_overlap=0)
+        streamed = list(processor.iter_chunks(io.StringIO(self.TEXT), "faculty.txt", window_size=100))
+        assert all(len(doc.page_content) <= 80 for doc in streamed)
+        assert " ".join(doc.page_content for doc in streamed).split() == self.TEXT.split()
+        assert [doc.metadata["chunk_index"] for doc in streamed] == list(range(len(streamed)))
+    
+    def test_add_text_from_stream(self, tmp_path):
+        """Test that a stream is stored under the same chunk IDs as the same string"""
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        rag.add_text(io.StringIO(self.TEXT), "faculty.txt")
+        assert rag.get_stats()["total_chunks"] == 5
+        rag.add_text(self.TEXT, "faculty.txt")
+        assert rag.ingest_stats["chunks_skipped"] == 5
+
+class TestEmbeddingFallback:
+    """Offline: the circuit breaker around the primary embedder"""
+    def test_breaker_opens_and_recovers(self, caplog, capsys):
+        """Test that repeated failures route calls to the fallback until a probe succeeds, logging instead of printing"""
+        primary = _FailingEmbeddings(64)
+        fallback = HashEmbeddings(64)
+        probe_ok = threading.Event()
+        def probe():
+            if not probe_ok.is_set():
+                raise RuntimeError("still down")
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05, probe=probe, name="test")
+        embeddings = FallbackEmbeddings(primary, lambda: fallback, breaker, dimension_provider=lambda: 64)
+        with caplog.at_level(logging.INFO, logger="rag.embeddings"):
+            for _ in range(4):
+                assert embeddings.embed_documents(["a", "b"]) == fallback.embed_documents(["a", "b"])
+        assert "test failed 2 times, opening circuit breaker" in caplog.messages
+        assert capsys.readouterr().out == ""
+        stats = embeddings.get_stats()
+        assert stats["state"] == "open" and stats["total_failures"] == 2 and stats["fallback_calls"] == 4
+        
+        probe_ok.set()
+        time.sleep(0.06)
+        assert not breaker.allow_request()  # Starts the probe instead of calling the backend
+        breaker._probe_thread.join()
+        assert breaker.get_state()["state"] == "closed"
+    
+    def test_dimension_mismatch_is_refused(self):
+        """Test that fallback vectors of another dimension are not returned"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+        embeddings = FallbackEmbeddings(_FailingEmbeddings(64), lambda: HashEmbeddings(32), breaker,
+                                        dimension_provider=lambda: 64)
+        with pytest.raises(EmbeddingDimensionError):
+            embeddings.embed_documents(["a"])
+        with pytest.raises(EmbeddingDimensionError):
+            asyncio.run(embeddings.aembed_query("a"))
+    
+    def test_registry_shares_embedders(self):
+        """Test that the registry hands out one embedder per backend, model and endpoints"""
+        first = get_embedder("ollama", "nomic-embed-text", ["http://a:11434", "http://b:11434"])
+        assert get_embedder("ollama", "nomic-embed-text", ["http://a:11434", "http://b:11434"]) is first
+        assert get_embedder("ollama", "nomic-embed-text", "http://a:11434") is not first
+
+class TestQueryMany:
+    """Offline: RAGSystem.query_many"""
+    @pytest.fixture
+    def rag_system(self, tmp_path):
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient(delay=0.2))
+        for i in range(5):
+            rag.add_text(f"Professor {i} teaches CS{i}1 on Mondays.", f"faculty-{i}.txt", metadata={"group": i % 2})
+        return rag
+    
+    def test_batched_results_match_query(self, rag_system):
+        """Test that one embedding call and one search serve every question, answered in order"""
+        questions = [f"Who teaches CS{i}1?" for i in range(4)]
+        searches = []
+        similarity_search_many = rag_system.vector_store.similarity_search_many
+        def counted_search(*args, **kwargs):
+            searches.append(len(args[0]))
+            return similarity_search_many(*args, **kwargs)
+        rag_system.vector_store.similarity_search_many = counted_search
+        calls_before = rag_system._primary_embeddings.calls
+        
+        start = time.perf_counter()
+        results = rag_system.query_many(questions, max_concurrency=4)
+        assert time.perf_counter() - start < 4 * 0.2
+        assert rag_system._primary_embeddings.calls == calls_before + 1
+        assert searches == [4]
+        for question, result in zip(questions, results):
+            expected = rag_system.query(question)
+            assert result["question"] == question
+            assert (result["answer"], sorted(result["sources"])) == (expected["answer"], sorted(expected["sources"]))
+    
+    def test_filters_apply_to_every_question(self, rag_system):
+        """Test that filters restrict the sources of every answer"""
+        results = rag_system.query_many(["Who teaches CS01?", "Who teaches CS11?"], filters={"group": 1})
+        for result in results:
+            assert result["sources"] and set(result["sources"]) <= {"faculty-1.txt", "faculty-3.txt"}
+        assert rag_system.query_many([]) == []
+
+class TestReingestion:
+    """Offline: re-adding a changed document by content hash"""
+    SENTENCES = [f"Professor {i} teaches course CS{i}1." for i in range(40)]
+    
+    def test_only_changed_chunks_are_rewritten(self, tmp_path):
+        """Test that an edit re-embeds one chunk and a shorter text deletes the chunks past its end"""
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        rag.add_text(" ".join(self.SENTENCES), "faculty.txt")
+        assert rag.get_stats()["total_chunks"] == 5
+        
+        edited = list(self.SENTENCES)
+        edited[20] = "Professor 20 now teaches course CS999."
+        rag.add_text(" ".join(edited), "faculty.txt")
+        assert rag.ingest_stats["chunks_embedded"] == 6
+        assert rag.ingest_stats["chunks_updated"] == 1 and rag.ingest_stats["chunks_skipped"] == 4
+        results = rag.vector_store.similarity_search(rag.embeddings.embed_query("x"), k=10)
+        contents = " ".join(result["content"] for result in results)
+        assert "CS999" in contents and "CS201" not in contents
+        
+        rag.add_text(" ".join(edited[:16]), "faculty.txt")
+        assert rag.ingest_stats["chunks_deleted"] == 3
+        assert rag.get_stats()["total_chunks"] == 2
+        assert rag.ingest_stats["chunks_embedded"] == 6
+
+class TestOllamaPool:
+    """Offline: endpoint selection and failover, with clients that are just their base URL"""
+    URLS = ["http://a:11434", "http://b:11434"]
+    
+    def test_requests_spread_over_endpoints(self):
+        """Test that concurrent requests go to the least busy endpoint"""
+        pool = OllamaPool(self.URLS)
+        def slow_call(base_url):
+            time.sleep(0.1)
+            return base_url
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.run("llm", lambda url: url, slow_call)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(results) == sorted(self.URLS * 2)
+        assert [(entry["requests"], entry["peak_outstanding"]) for entry in pool.get_stats()] == [(2, 2), (2, 2)]
+    
+    def test_failing_endpoint_is_skipped(self):
+        """Test that a failed request is retried elsewhere and the endpoint's breaker then skips it"""
+        pool = OllamaPool(self.URLS, failure_threshold=1, recovery_timeout=60)
+        def call(base_url):
+            if base_url == self.URLS[0]:
+                raise ConnectionError("connection refused")
+            return base_url
+        assert [pool.run("llm", lambda url: url, call) for _ in range(3)] == [self.URLS[1]] * 3
+        assert asyncio.run(pool.arun("llm", lambda url: url, lambda url: asyncio.sleep(0, call(url)))) == self.URLS[1]
+        stats = pool.get_stats()
+        assert stats[0]["requests"] == 1 and stats[0]["breaker"] == "open"
+        assert stats[1]["requests"] == 4
+    
+    def test_no_healthy_endpoint(self):
+        """Test that the last error is raised, then NoHealthyEndpointError once every breaker is open"""
+        pool = OllamaPool(self.URLS, failure_threshold=1, recovery_timeout=60)
+        def call(base_url):
+            raise ConnectionError(f"{base_url} refused")
+        with pytest.raises(ConnectionError):
+            pool.run("llm", lambda url: url, call)
+        with pytest.raises(NoHealthyEndpointError):
+            pool.run("llm", lambda url: url, call)
+    
+    def test_base_urls_are_normalized(self):
+        """Test that one comma-separated string and a list name the same endpoints"""
+        assert normalize_base_urls("http://a:11434/, http://b:11434") == tuple(self.URLS)
+        assert normalize_base_urls(self.URLS) == tuple(self.URLS)
+
+class TestMetrics:
+    """Offline: per-stage spans and their export"""
+    TEXT = " ".join(f"Professor {i} teaches course CS{i}1." for i in range(40))
+    
+    def test_stages_are_recorded_and_exported(self, tmp_path):
+        """Test that ingestion and a query record every stage, with item counts, in Prometheus format"""
+        rag = RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                        llm_client=FakeLLMClient())
+        rag.add_text(self.TEXT, "faculty.txt")
+        rag.query("Who teaches CS31?")
+        snapshot = rag.metrics.snapshot()
+        for stage in ("ingest.chunk", "ingest.existence_check", "ingest.embed", "ingest.write",
+                      "query.embed", "query.retrieve", "query.prompt_build", "query.generate"):
+            assert snapshot[stage]["count"] == 1 and snapshot[stage]["errors"] == 0, stage
+        assert snapshot["ingest.chunk"]["items"] == 5 and snapshot["ingest.embed"]["items"] == 5
+        assert snapshot["ingest.embed"]["tokens"] > 0
+        
+        exported = rag.export_metrics()
+        assert "# TYPE rag_stage_duration_seconds histogram" in exported
+        assert 'rag_stage_duration_seconds_count{stage="query.generate"} 1' in exported
+        assert 'rag_stage_duration_seconds_bucket{stage="query.generate",le="+Inf"} 1' in exported
+        assert 'rag_stage_items_total{stage="ingest.embed"} 5' in exported
+    
+    def test_failed_span_and_log_line(self, caplog):
+        """Test that a failing span counts as an error, re-raises, and is logged as JSON"""
+        metrics = Metrics()
+        with caplog.at_level(logging.INFO, logger="rag.metrics"):
+            with pytest.raises(RuntimeError):
+                with metrics.span("query.generate", items=1, model="fake"):
+                    raise RuntimeError("LLM down")
+            assert list(metrics.timed_iter(iter("abc"), "ingest.chunk")) == ["a", "b", "c"]
+        snapshot = metrics.snapshot()
+        assert snapshot["query.generate"]["errors"] == 1
+        assert snapshot["ingest.chunk"]["items"] == 3
+        event = json.loads(caplog.records[0].getMessage())
+        assert (event["stage"], event["error"], event["model"]) == ("query.generate", True, "fake")
+
+    def test_progress_output_is_per_instance(self, tmp_path, capsys):
+        """Test that a quiet RAGSystem built after a loud one leaves the loud one printing"""
+        loud = RAGSystem(make_config(str(tmp_path / "loud"), "numpy"), embeddings=HashEmbeddings(64),
+                         llm_client=FakeLLMClient())
+        config = make_config(str(tmp_path / "quiet"), "numpy")
+        config.PRINT_PROGRESS = False
+        quiet = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        capsys.readouterr()
+        quiet.add_text(self.TEXT, "faculty.txt")
+        assert capsys.readouterr().out == ""
+        loud.add_text(self.TEXT, "faculty.txt")
+        assert "Added 5 new chunks" in capsys.readouterr().out
+
+class TestQueryOnly:
+    """Offline: lazy imports and the query-only mode"""
+    def test_startup_imports_no_heavy_modules(self, tmp_path):
+        """Test that importing rag_system and building a RAGSystem loads no model libraries"""
+        for query_only in ("0", "1"):
+            output = subprocess.run(
+                [sys.executable, "-c", _STARTUP_SCRIPT, str(tmp_path / query_only), "numpy", query_only],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+            ).stdout
+            assert json.loads(output.strip().splitlines()[-1])["heavy_modules"] == []
+    
+    def test_queries_work_and_ingestion_is_refused(self, tmp_path):
+        """Test that a query-only RAGSystem answers from an existing store but never builds the chunker"""
+        RAGSystem(make_config(str(tmp_path), "numpy"), embeddings=HashEmbeddings(64),
+                  llm_client=FakeLLMClient()).add_text("Professor Reed teaches CS101.", "reed.txt")
+        config = make_config(str(tmp_path), "numpy")
+        config.QUERY_ONLY = True
+        rag = RAGSystem(config, embeddings=HashEmbeddings(64), llm_client=FakeLLMClient())
+        rag.warm_up()
+        assert rag.query("Who teaches CS101?")["sources"] == ["reed.txt"]
+        with pytest.raises(RuntimeError):
+            rag.add_text("Professor Stone teaches CS102.", "stone.txt")
+        assert rag._document_processor is None
@@ -1,4 +1,7 @@
 from rag_system import RAGSystem
+from ingestion_pipeline import IngestionPipeline
+from page_records import iter_page_records
+from crawl_cache import CrawlCache
 import os
 
 def load_text_from_file(file_path: str) -> str:
@@ -6,15 +9,77 @@ def load_text_from_file(file_path: str) -> str:
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read()
 
-def load_multiple_texts(text_directory: str, rag_system: RAGSystem):
+def load_multiple_texts(text_directory: str, rag_system: RAGSystem, parallel: bool = False):
     """Load multiple text files from a directory"""
+    if parallel:
+        return load_texts_pipelined(text_directory, rag_system)
     for filename in os.listdir(text_directory):
         if filename.endswith('.txt'):
             file_path = os.path.join(text_directory, filename)
-            text = load_text_from_file(file_path)
-            rag_system.add_text(text, filename)
+            rag_system.add_file(file_path, filename)
             print(f"Loaded {filename}")
 
+def load_texts_pipelined(text_directory: str, rag_system: RAGSystem):
+    """Load all text files from a directory with the parallel ingestion pipeline"""
+    file_paths = [
+        os.path.join(text_directory, filename)
+        for filename in sorted(os.listdir(text_directory))
+        if filename.endswith('.txt')
+    ]
+    pipeline = IngestionPipeline(
+        rag_system,
+        workers=rag_system.config.INGEST_WORKERS,
+        embed_batch_size=rag_system.config.INGEST_EMBED_BATCH_SIZE,
+        write_batch_size=rag_system.config.INGEST_WRITE_BATCH_SIZE,
+        queue_size=rag_system.config.INGEST_QUEUE_SIZE
+    )
+    return pipeline.run(file_paths)
+
+def load_pdfs(pdf_directory: str, rag_system: RAGSystem, parallel: bool = True):
+    """Load every PDF in a directory page by page (pages spread over worker processes if parallel)"""
+    pdf_paths = [
+        os.path.join(pdf_directory, filename)
+        for filename in sorted(os.listdir(pdf_directory))
+        if filename.lower().endswith('.pdf')
+    ]
+    if not parallel:
+        for pdf_path in pdf_paths:
+            rag_system.add_pdf(pdf_path)
+        return None
+    pipeline = IngestionPipeline(
+        rag_system,
+        workers=rag_system.config.INGEST_WORKERS,
+        embed_batch_size=rag_system.config.INGEST_EMBED_BATCH_SIZE,
+        write_batch_size=rag_system.config.INGEST_WRITE_BATCH_SIZE,
+        queue_size=rag_system.config.INGEST_QUEUE_SIZE
+    )
+    return pipeline.run_pdfs(pdf_paths, pages_per_task=rag_system.config.INGEST_PDF_PAGES_PER_TASK)
+
+def load_scraped_pages(data_file: str, rag_system: RAGSystem, changed_only: bool = True) -> int:
+    """Load pages saved by Extractor/faculty_scraper.py, by default only those changed since they were last loaded.
+
+    What was loaded is recorded per URL in a CrawlCache (SCRAPED_PAGES_CACHE_PATH)
+    after add_text, so a page changed by any scrape since then is loaded,
+    however many scrapes ran in between. The JSONL file is read one record
+    at a time, so it is never held in memory whole.
+    """
+    cache = CrawlCache(rag_system.config.SCRAPED_PAGES_CACHE_PATH)
+    loaded = total = 0
+    try:
+        for page in iter_page_records(data_file):
+            total += 1
+            url, text = page["url"], page["markdown_content"]
+            if changed_only and cache.is_unchanged(url, text):
+                continue
+            crawl_date = page.get("timestamp", "")[:10]
+            rag_system.add_text(text, url, metadata={"url": url, "crawl_date": crawl_date})
+            cache.store(url, text)
+            loaded += 1
+    finally:
+        cache.close()
+    print(f"Loaded {loaded} of {total} scraped pages")
+    return loaded
+
 def main():
     # Initialize RAG system
     rag = RAGSystem()
@@ -27,9 +92,19 @@ def main():
     # Option 2: Load multiple text files from directory
     text_dir = "extracted_texts"  # Directory containing your text files
     if os.path.exists(text_dir):
-        load_multiple_texts(text_dir, rag)
+        load_multiple_texts(text_dir, rag, parallel=True)
+    
+    # Option 3: Load PDFs saved by the crawler (faster and cleaner than screenshots + OCR)
+    pdf_dir = "../Extractor/pdfs"
+    if os.path.exists(pdf_dir):
+        load_pdfs(pdf_dir, rag)
+    
+    # Option 4: Load pages changed in the last scraper run
+    scraped_file = "../Extractor/faculty_data.jsonl"
+    if os.path.exists(scraped_file):
+        load_scraped_pages(scraped_file, rag)
     
-    # Option 3: Add text directly in code
+    # Option 5: Add text directly in code
     sample_text = """
     Your extracted text content goes here.
     This could be from PDFs, web scraping, or any other source.
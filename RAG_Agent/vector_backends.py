@@ -0,0 +1,35 @@
+import os
+from typing import Any, Callable, Optional
+
+def create_vector_store(config, progress_output: Optional[Callable[[str], None]] = None) -> Any:
+    """Create the vector store backend selected by config.VECTOR_BACKEND.
+
+    Backends are imported on demand so the NumPy backend never pays for
+    importing chromadb. progress_output receives the store's progress
+    messages (default: instrumentation.progress).
+    """
+    if config.VECTOR_BACKEND == "numpy":
+        from numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(config.NUMPY_DB_PATH, config.COLLECTION_NAME,
+                                quantization=config.VECTOR_QUANTIZATION,
+                                rerank_factor=config.QUANTIZATION_RERANK_FACTOR,
+                                keep_full_precision=config.KEEP_FULL_PRECISION,
+                                index_fields=config.METADATA_INDEX_FIELDS,
+                                compact_threshold=config.NUMPY_COMPACT_THRESHOLD,
+                                progress_output=progress_output)
+    if config.VECTOR_BACKEND == "chroma":
+        from vector_store import VectorStore
+        return VectorStore(config.CHROMA_DB_PATH, config.COLLECTION_NAME, progress_output=progress_output)
+    raise ValueError(f"Unknown vector backend: {config.VECTOR_BACKEND}")
+
+def lexical_index_path(config) -> str:
+    """Where the BM25 index for the configured collection lives.
+
+    By default it sits inside the vector DB directory and is named after the
+    collection, so deleting the DB or switching backend or collection never
+    pairs a collection with another one's lexical index.
+    """
+    if config.LEXICAL_INDEX_PATH:
+        return config.LEXICAL_INDEX_PATH
+    db_path = config.NUMPY_DB_PATH if config.VECTOR_BACKEND == "numpy" else config.CHROMA_DB_PATH
+    return os.path.join(db_path, f"{config.COLLECTION_NAME}.lexical.sqlite")
@@ -1,39 +1,159 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
-from langchain.schema import Document
+from typing import Callable, Iterator, List, Dict, Any, Optional, Set
+from langchain_core.documents import Document
+from metadata_filters import to_chroma_where
+from instrumentation import progress
 
 class VectorStore:
-    def __init__(self, db_path: str, collection_name: str):
+    def __init__(self, db_path: str, collection_name: str, progress_output: Optional[Callable[[str], None]] = None):
+        self.progress = progress_output or progress
         self.client = chromadb.PersistentClient(
             path=db_path,
             settings=Settings(anonymized_telemetry=False)
         )
         self.collection = self.client.get_or_create_collection(name=collection_name)
+        self._dimension = None
+        self._change_listeners = []
+        self._document_listeners = []
     
-    def add_documents(self, documents: List[Document], embeddings: List[List[float]]):
+    def add_change_listener(self, callback: Callable[[], None]):
+        """Register a callback invoked whenever the collection's contents change"""
+        self._change_listeners.append(callback)
+    
+    def add_document_listener(self, listener):
+        """Register an index kept in step with the collection.
+
+        listener.index_documents(documents) receives every added or updated
+        chunk and listener.remove_documents(ids) every deleted chunk ID.
+        """
+        self._document_listeners.append(listener)
+    
+    def _notify_change(self):
+        for callback in self._change_listeners:
+            callback()
+    
+    def _notify_indexed(self, documents: List[Document]):
+        for listener in self._document_listeners:
+            listener.index_documents(documents)
+    
+    def _notify_removed(self, ids: List[str]):
+        for listener in self._document_listeners:
+            listener.remove_documents(ids)
+    
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[List[Document]]:
+        """Yield every stored chunk, in batches"""
+        offset = 0
+        while True:
+            batch = self.collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+            if not batch["ids"]:
+                return
+            yield [
+                Document(page_content=text, metadata=metadata)
+                for text, metadata in zip(batch["documents"], batch["metadatas"])
+            ]
+            offset += len(batch["ids"])
+    
+    def get_existing_ids(self, ids: List[str]) -> Set[str]:
+        """Return the subset of chunk IDs already stored, in one lookup"""
+        if not ids:
+            return set()
+        existing = self.collection.get(ids=list(ids), include=[])
+        return set(existing["ids"])
+    
+    def get_existing_hashes(self, ids: List[str]) -> Dict[str, Optional[str]]:
+        """Map each already stored chunk ID to its content hash, in one lookup.
+
+        Chunks stored before content hashes were recorded map to None.
+        """
+        if not ids:
+            return {}
+        existing = self.collection.get(ids=list(ids), include=["metadatas"])
+        return {
+            chunk_id: (metadata or {}).get("content_hash")
+            for chunk_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+    
+    def update_documents(self, documents: List[Document], embeddings: List[List[float]]):
+        """Overwrite stored chunks whose content has changed"""
+        if not documents:
+            return
+        self.collection.upsert(
+            ids=[doc.metadata["chunk_id"] for doc in documents],
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+            embeddings=embeddings
+        )
+        self.progress(f"Updated {len(documents)} changed chunks in the database")
+        self._notify_indexed(documents)
+        self._notify_change()
+    
+    def get_chunk_ids_from(self, source: str, page: int, first_chunk_index: int) -> List[str]:
+        """Get IDs of a source page's chunks at or beyond a chunk index"""
+        existing = self.collection.get(
+            where={"$and": [
+                {"source": source},
+                {"page": page},
+                {"chunk_index": {"$gte": first_chunk_index}}
+            ]},
+            include=[]
+        )
+        return existing["ids"]
+    
+    def get_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """Stored chunks by ID, in one lookup; IDs that are not stored are left out"""
+        if not ids:
+            return {}
+        existing = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return {
+            chunk_id: Document(page_content=text, metadata=metadata)
+            for chunk_id, text, metadata in zip(existing["ids"], existing["documents"], existing["metadatas"])
+        }
+    
+    def get_chunk_ids_after_page(self, source: str, last_page: int) -> List[str]:
+        """Get IDs of a source's chunks on pages after last_page"""
+        existing = self.collection.get(
+            where={"$and": [{"source": source}, {"page": {"$gt": last_page}}]},
+            include=[]
+        )
+        return existing["ids"]
+    
+    def delete_documents(self, ids: List[str]):
+        """Delete chunks by ID"""
+        if not ids:
+            return
+        self.collection.delete(ids=list(ids))
+        self.progress(f"Deleted {len(ids)} stale chunks from the database")
+        self._notify_removed(list(ids))
+        self._notify_change()
+    
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]], check_existing: bool = True):
         """Add documents to the vector store with incremental updates"""
         ids = []
         texts = []
         metadatas = []
         embeddings_to_add = []
+        documents_to_add = []
         
-        for doc, embedding in zip(documents, embeddings):
-            chunk_id = doc.metadata["chunk_id"]
-            
-            # Check if chunk already exists
+        # Check which chunks already exist with a single bulk lookup
+        existing_ids = set()
+        if check_existing:
             try:
-                existing = self.collection.get(ids=[chunk_id])
-                if existing["ids"]:
-                    print(f"Chunk {chunk_id} already exists, skipping...")
-                    continue
-            except:
+                existing_ids = self.get_existing_ids([doc.metadata["chunk_id"] for doc in documents])
+            except Exception:
                 pass
+        
+        for doc, embedding in zip(documents, embeddings):
+            chunk_id = doc.metadata["chunk_id"]
+            if chunk_id in existing_ids:
+                self.progress(f"Chunk {chunk_id} already exists, skipping...")
+                continue
             
             ids.append(chunk_id)
             texts.append(doc.page_content)
             metadatas.append(doc.metadata)
             embeddings_to_add.append(embedding)
+            documents_to_add.append(doc)
         
         if ids:
             self.collection.add(
@@ -42,26 +162,53 @@ class VectorStore:
                 metadatas=metadatas,
                 embeddings=embeddings_to_add
             )
-            print(f"Added {len(ids)} new chunks to the database")
+            self.progress(f"Added {len(ids)} new chunks to the database")
+            self._notify_indexed(documents_to_add)
+            self._notify_change()
         else:
-            print("No new chunks to add")
+            self.progress("No new chunks to add")
     
-    def similarity_search(self, query_embedding: List[float], k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar documents"""
+    def similarity_search(self, query_embedding: List[float], k: int = 5,
+                          filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search for similar documents, optionally restricted by metadata filters"""
+        return self.similarity_search_many([query_embedding], k=k, filters=filters)[0]
+    
+    def similarity_search_many(self, query_embeddings: List[List[float]], k: int = 5,
+                               filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Search for similar documents for many queries in a single collection.query call.
+
+        filters (e.g. {"source": "a.txt", "page": {"$gte": 2}}) become a Chroma
+        where clause, which Chroma resolves against its metadata index before
+        the vector search, so all k results match.
+        """
+        if not query_embeddings:
+            return []
         results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=k
+            query_embeddings=query_embeddings,
+            n_results=k,
+            where=to_chroma_where(filters)
         )
         
-        documents = []
-        for i in range(len(results["ids"][0])):
-            documents.append({
-                "content": results["documents"][0][i],
-                "metadata": results["metadatas"][0][i],
-                "distance": results["distances"][0][i]
-            })
+        all_documents = []
+        for q in range(len(results["ids"])):
+            documents = []
+            for i in range(len(results["ids"][q])):
+                documents.append({
+                    "content": results["documents"][q][i],
+                    "metadata": results["metadatas"][q][i],
+                    "distance": results["distances"][q][i]
+                })
+            all_documents.append(documents)
         
-        return documents
+        return all_documents
+    
+    def get_embedding_dimension(self) -> Optional[int]:
+        """Get the dimension of stored embeddings, or None if the collection is empty"""
+        if self._dimension is None:
+            sample = self.collection.get(limit=1, include=["embeddings"])
+            if sample["ids"]:
+                self._dimension = len(sample["embeddings"][0])
+        return self._dimension
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the collection"""